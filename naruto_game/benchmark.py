@@ -0,0 +1,271 @@
+"""
+性能基准模块：测量战斗核心热点路径的耗时，并与保存的基线比较以发现性能回退
+
+每个基准由准备函数和被测函数组成：准备函数创建一次操作所需的全新对象(队伍、战斗状态等)，
+不计入耗时；被测函数执行一次操作并单独计时。随机种子固定，每次操作执行的代码完全相同，
+耗时的差异只来自其他进程的干扰和缓存状态，因此比较基线时取所有操作中最短的耗时，中位数仅供参考。
+
+基线保存为JSON文件，同时记录测量时的Python版本和平台。耗时与机器有关，
+应在同一台机器上保存基线并比较；check子命令发现任一基准比基线慢超过阈值时返回非零退出码。
+"""
+import os
+import gc
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+from naruto_game.config import BENCHMARK_ROUNDS, BENCHMARK_THRESHOLD
+from naruto_game.models.character import (
+    ROSTER, STAT_LONGEST_CHAIN, create_team7, create_team10, create_team_from_lineup,
+)
+from naruto_game.models import status_effects
+from naruto_game.simulation import setup_battle, simulate_battle, quiet_output
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(PROJECT_ROOT, "benchmark_baseline.json")
+BASELINE_VERSION = 1
+
+# 追打链基准：佐助的奥义在这一随机状态下引出长度为3的追打链
+CHASE_LINEUP = ("sasuke", "shikamaru", "sakura", "naruto")
+CHASE_ENEMY_LINEUP = ("naruto", "sasuke", "sakura")
+CHASE_SEED = 3
+CHASE_LENGTH = 3
+
+# 状态效果基准：一个角色身上同时带有的全部状态效果
+STATUS_EFFECT_FACTORIES = (
+    status_effects.create_attack_up, status_effects.create_defense_up, status_effects.create_small_float,
+    status_effects.create_big_float, status_effects.create_knockdown, status_effects.create_repel,
+    status_effects.create_ignite, status_effects.create_poison, status_effects.create_seal,
+    status_effects.create_immobilize, status_effects.create_blind, status_effects.create_bleed,
+    status_effects.create_stun, status_effects.create_slow, status_effects.create_mind_control,
+    status_effects.create_confusion,
+)
+STATUS_EFFECT_DURATION = 3
+
+# 整场战斗基准的阵容和随机种子
+BATTLE_LINEUP = ("naruto", "sasuke", "sakura", "kakashi")
+BATTLE_ENEMY_LINEUP = ("shikamaru", "choji", "ino")
+BATTLE_SEED = 2024
+# 吞吐基准每次操作进行的随机阵容战斗场数
+THROUGHPUT_BATTLES = 20
+
+
+class BenchmarkCase:
+    """一个基准：setup()返回被测函数的参数，op(*args)为计时的一次操作"""
+    def __init__(self, name, description, setup, op, samples, unit_count=1, unit="次"):
+        self.name = name
+        self.description = description
+        self.setup = setup
+        self.op = op
+        self.samples = samples          # 每轮的操作次数
+        self.unit_count = unit_count    # 每次操作包含的单位数，用于换算吞吐
+        self.unit = unit
+
+
+def _no_setup():
+    return ()
+
+def _skill_setup(lineup, enemy_lineup, skill_name, seed):
+    """开始一场战斗，返回我方一号位角色的技能、使用者和目标"""
+    battle_state = setup_battle(lineup, enemy_lineup, seed=0)
+    # 只测一次技能，不让目标中途阵亡
+    for character in battle_state.enemy_team.characters:
+        character.max_hp = character.current_hp = 10 ** 7
+    battle_state.current_team = battle_state.player_team
+    battle_state.player_team.shared_chakra = battle_state.player_team.max_chakra
+    user = battle_state.player_team.get_characters_by_position()[0]
+    skill = getattr(user, skill_name)
+    targets = skill.get_valid_targets(user, battle_state)
+    random.seed(seed)
+    return skill, user, targets, battle_state
+
+def _setup_skill_use():
+    # 只有一名忍者，没有可以追打的队友，测得的是技能本身和追打检查的开销
+    return _skill_setup(("naruto",), BATTLE_ENEMY_LINEUP, "normal_attack", BATTLE_SEED)
+
+def _setup_chase_chain():
+    return _skill_setup(CHASE_LINEUP, CHASE_ENEMY_LINEUP, "mystery_art", CHASE_SEED)
+
+def _use_skill(skill, user, targets, battle_state):
+    skill.use(user, targets, battle_state)
+
+def _use_chase_skill(skill, user, targets, battle_state):
+    skill.use(user, targets, battle_state)
+    if user.combat_stats[STAT_LONGEST_CHAIN] < CHASE_LENGTH:
+        # 技能或追打规则变化后这一设定可能不再引出追打链，测得的耗时也就失去了意义
+        raise RuntimeError(f"追打链基准没有引出长度为{CHASE_LENGTH}的追打链，请更新CHASE_SEED等设定")
+
+def _setup_status_effects():
+    team = create_team_from_lineup("player", ("choji", "naruto"))
+    target, source = team.characters
+    target.max_hp = target.current_hp = 10 ** 7
+    for factory in STATUS_EFFECT_FACTORIES:
+        target.add_status_effect(factory(duration=STATUS_EFFECT_DURATION), source, 1)
+    return (target,)
+
+def _update_status_effects(target):
+    # 一个完整回合：回合开始和回合结束各更新一次
+    target.update_status_effects(True, 2)
+    target.update_status_effects(False, 2)
+
+def _create_teams():
+    create_team7()
+    create_team10()
+
+def _full_battle():
+    simulate_battle(BATTLE_LINEUP, BATTLE_ENEMY_LINEUP, seed=BATTLE_SEED)
+
+def _setup_throughput():
+    rng = random.Random(BATTLE_SEED)
+    roster = list(ROSTER)
+    return ([(rng.sample(roster, 4), rng.sample(roster, 4), rng.getrandbits(32)) for _ in range(THROUGHPUT_BATTLES)],)
+
+def _battle_throughput(battles):
+    for lineup, enemy_lineup, seed in battles:
+        simulate_battle(lineup, enemy_lineup, seed=seed)
+
+
+BENCHMARKS = [
+    BenchmarkCase("team_construction", "创建第七班和第十班", _no_setup, _create_teams, 200),
+    BenchmarkCase("skill_use", "一次普通攻击(Skill.use)", _setup_skill_use, _use_skill, 500),
+    BenchmarkCase("chase_chain", f"奥义引出{CHASE_LENGTH}次追打", _setup_chase_chain, _use_chase_skill, 200),
+    BenchmarkCase("status_effects", f"{len(STATUS_EFFECT_FACTORIES)}个状态效果的一个回合",
+                  _setup_status_effects, _update_status_effects, 500),
+    BenchmarkCase("full_battle", "一场AI对AI的战斗", _no_setup, _full_battle, 20),
+    BenchmarkCase("battle_throughput", f"{THROUGHPUT_BATTLES}场随机阵容的战斗",
+                  _setup_throughput, _battle_throughput, 4, THROUGHPUT_BATTLES, "场"),
+]
+BENCHMARKS_BY_NAME = {case.name: case for case in BENCHMARKS}
+
+
+def measure(case, rounds=BENCHMARK_ROUNDS):
+    """测量一个基准，返回每次操作的耗时(秒)，共rounds * case.samples个"""
+    timings = []
+    for _ in range(rounds):
+        gc.collect()
+        for _ in range(case.samples):
+            args = case.setup()
+            start = time.perf_counter()
+            case.op(*args)
+            timings.append(time.perf_counter() - start)
+    return timings
+
+def run_benchmarks(cases=BENCHMARKS, rounds=BENCHMARK_ROUNDS, report=None):
+    """依次测量cases，返回 {名称: {"best": 秒, "median": 秒}}，report(case, result)在每个基准完成后调用"""
+    results = {}
+    for case in cases:
+        # 战斗核心会打印日志，测量时丢弃
+        with quiet_output():
+            timings = measure(case, rounds)
+        result = results[case.name] = {"best": min(timings), "median": statistics.median(timings)}
+        if report:
+            report(case, result)
+    return results
+
+def load_baseline(path):
+    with open(path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("version") != BASELINE_VERSION:
+        raise ValueError(f"{path}: 基线文件版本不符")
+    return baseline
+
+def save_baseline(path, results):
+    baseline = {
+        "version": BASELINE_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+def compare(results, baseline_results, threshold=BENCHMARK_THRESHOLD):
+    """返回 [(名称, 当前/基线的比值, 是否回退)]，基线中没有的基准不参与比较"""
+    comparison = []
+    for name, result in results.items():
+        reference = baseline_results.get(name)
+        if reference is None:
+            continue
+        ratio = result["best"] / reference["best"]
+        comparison.append((name, ratio, ratio > 1 + threshold))
+    return comparison
+
+
+def _format_result(case, result):
+    per_op = result["best"]
+    throughput = case.unit_count / per_op
+    return (f"  {case.name:<20}{per_op * 1e6:>12.1f}{result['median'] * 1e6:>12.1f}"
+            f"{throughput:>12.1f} {case.unit}/秒   {case.description}")
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="火影忍者OL战斗原型 - 战斗核心性能基准")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="基线文件")
+    parser.add_argument("--rounds", type=int, default=BENCHMARK_ROUNDS, help="每个基准测量的轮数")
+    parser.add_argument("--only", default=None, help="只测量这些基准，逗号分隔")
+    subparsers = parser.add_subparsers(dest="command")
+
+    subparsers.add_parser("run", help="测量并输出结果(默认)")
+    subparsers.add_parser("save", help="测量并保存为基线")
+    check_parser = subparsers.add_parser("check", help="测量并与基线比较，有性能回退时返回1")
+    check_parser.add_argument("--threshold", type=float, default=BENCHMARK_THRESHOLD,
+                              help="比基线慢超过该比例视为回退，如0.2表示20%%")
+    args = parser.parse_args(argv)
+
+    if args.rounds < 1:
+        parser.error("--rounds 至少为1")
+    cases = BENCHMARKS
+    if args.only:
+        names = [name.strip() for name in args.only.split(",") if name.strip()]
+        unknown = [name for name in names if name not in BENCHMARKS_BY_NAME]
+        if unknown:
+            parser.error(f"未知的基准: {', '.join(unknown)}(可选: {', '.join(BENCHMARKS_BY_NAME)})")
+        cases = [BENCHMARKS_BY_NAME[name] for name in names]
+
+    baseline = None
+    if args.command == "check":
+        try:
+            baseline = load_baseline(args.baseline)
+        except (OSError, ValueError) as e:
+            print(f"无法读取基线: {e}", file=sys.stderr)
+            return 2
+        if baseline["python"] != platform.python_version() or baseline["machine"] != platform.machine():
+            print(f"注意: 基线测量于 Python {baseline['python']} / {baseline['platform']}，"
+                  f"与当前环境不同，比较结果仅供参考")
+
+    print(f"每个基准 {args.rounds} 轮，耗时单位为微秒/次：")
+    print(f"  {'基准':<18}{'最好':>10}{'中位数':>9}{'吞吐':>12}")
+    results = run_benchmarks(cases, args.rounds, lambda case, result: print(_format_result(case, result)))
+
+    if args.command == "save":
+        save_baseline(args.baseline, results)
+        print(f"基线已保存到 {args.baseline}")
+        return 0
+
+    if args.command == "check":
+        comparison = compare(results, baseline["results"], args.threshold)
+        regressed_cases = [BENCHMARKS_BY_NAME[name] for name, _, regressed in comparison if regressed]
+        if regressed_cases:
+            # 共享的机器上整体速度也会波动，疑似回退的基准再测一次，取两次中较好的结果
+            print("重新测量疑似回退的基准：")
+            for name, result in run_benchmarks(regressed_cases, args.rounds,
+                                               lambda case, result: print(_format_result(case, result))).items():
+                results[name] = min(results[name], result, key=lambda item: item["best"])
+            comparison = compare(results, baseline["results"], args.threshold)
+        print(f"与基线比较(阈值 {args.threshold:.0%})：")
+        for name, ratio, regressed in comparison:
+            print(f"  {name:<20}{ratio:>8.2f}x   {'性能回退' if regressed else '正常'}")
+        missing = [case.name for case in cases if case.name not in baseline["results"]]
+        if missing:
+            print(f"基线中没有这些基准: {', '.join(missing)}")
+        return 1 if any(regressed for _, _, regressed in comparison) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
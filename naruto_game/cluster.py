@@ -0,0 +1,533 @@
+"""
+分片模块：由监督进程接受客户端连接，把战斗分散到多个工作进程中托管，突破单进程只能使用一个核心的限制
+
+客户端协议与server.py完全相同。监督进程按战斗ID把请求路由到拥有该战斗的工作进程(粘性路由)，
+工作进程推送的事件原样转发给客户端。每个工作进程运行一个不监听端口的BattleServer，
+与监督进程之间通过multiprocessing的管道交换消息：
+
+监督进程 -> 工作进程
+    ("request", 连接ID, 请求)       ("disconnect", 连接ID)       ("backlog", 连接ID, 是否积压)
+    ("export", 战斗ID)              ("import", 战斗ID, 快照, 参战连接ID, 观战连接ID)
+    ("stats", 编号)                 ("stop",)
+工作进程 -> 监督进程，同一轮事件循环产生的消息合并为一个列表发送
+    ("send", 连接ID, 数据)          ("created", 战斗ID或None)    ("removed", 战斗ID)
+    ("exported", 战斗ID, 快照, 参战连接ID, 观战连接ID)            ("stats", 编号, 统计)
+
+各工作进程托管的战斗数相差超过阈值时，监督进程把战斗从最忙的工作进程迁移到最闲的工作进程：
+源进程导出迁移快照(种子和已执行的步骤，见server.restore_battle)，目标进程重建后继续推进，
+迁移期间到达的请求暂存在监督进程中，导入后按原顺序转发。
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import multiprocessing
+import concurrent.futures
+from naruto_game.config import (MAX_BATTLE_TURNS, AI_ACTION_DELAY, SERVER_HOST, SERVER_PORT,
+                                SESSION_BUFFER_HIGH, SESSION_BUFFER_LOW, REBALANCE_INTERVAL, REBALANCE_THRESHOLD)
+from naruto_game.server import BattleServer, encode_event, run_load_test
+
+MIGRATION_BATCH = 32        # 每次再平衡最多迁移的战斗数
+BACKLOG_CHECK_INTERVAL = 0.05
+
+
+class ShardSession:
+    """工作进程中代表一个客户端连接的会话，发送的数据经管道交给监督进程"""
+    def __init__(self, worker, conn_id):
+        self.worker = worker
+        self.conn_id = conn_id
+        self.battles = set()
+        self.watching = set()
+        self.stale = set()
+        self.congested = False  # 监督进程报告该连接的发送积压过多
+
+    def send(self, data):
+        # 共享的memoryview取回原始的bytes对象，同一批消息中重复的对象只序列化一次
+        data = data.obj if isinstance(data, memoryview) else data
+        self.worker.post(("send", self.conn_id, data))
+        return len(data)
+
+    @property
+    def backlog(self):
+        return SESSION_BUFFER_HIGH + 1 if self.congested else 0
+
+
+class ShardServer(BattleServer):
+    """工作进程中的战斗服务器，把开始托管和移除的战斗报告给监督进程(迁入的战斗同样报告为created)"""
+    def __init__(self, worker, ai_delay, max_turns):
+        super().__init__(ai_delay, max_turns)
+        self.worker = worker
+
+    def _host(self, battle):
+        super()._host(battle)
+        self.worker.post(("created", battle.id))
+
+    def _remove(self, battle):
+        if battle.id in self.battles:
+            self.worker.post(("removed", battle.id))
+        super()._remove(battle)
+
+    def _abandon(self, battle):
+        super()._abandon(battle)
+        self.worker.post(("removed", battle.id))
+
+
+class ShardWorker:
+    """工作进程：在自己的事件循环上托管一部分战斗"""
+    def __init__(self, conn, index, count, ai_delay, max_turns):
+        self.conn = conn
+        self.server = ShardServer(self, ai_delay, max_turns)
+        self.server.next_battle_id = index + 1      # 第index个分片分配 index+1, index+1+count, ...
+        self.server.battle_id_step = count
+        self.sessions = {}                          # 连接ID -> ShardSession
+        self.outbox = []
+        self.loop = None
+        self.stopped = None
+
+    def post(self, message):
+        """把消息放入发件箱，在本轮事件循环结束时一起发送"""
+        if not self.outbox:
+            self.loop.call_soon(self._flush)
+        self.outbox.append(message)
+
+    def _flush(self):
+        messages, self.outbox = self.outbox, []
+        self.conn.send(messages)
+
+    def _session(self, conn_id):
+        session = self.sessions.get(conn_id)
+        if session is None:
+            session = self.sessions[conn_id] = ShardSession(self, conn_id)
+        return session
+
+    def _on_message(self):
+        while self.conn.poll():
+            try:
+                message = self.conn.recv()
+            except EOFError:
+                message = ("stop",)
+            self.handle_message(message)
+
+    def handle_message(self, message):
+        """处理监督进程发来的一条消息"""
+        kind = message[0]
+        server = self.server
+        if kind == "request":
+            _, conn_id, request = message
+            session = self._session(conn_id)
+            next_battle_id = server.next_battle_id
+            try:
+                server.handle_request(session, request)
+            except ValueError as e:
+                session.send(encode_event({"event": "error", "battle": request.get("battle"), "message": str(e)}))
+            finally:
+                if request.get("op") == "create" and server.next_battle_id == next_battle_id:
+                    # 创建失败(包括意外的异常)时也要回复，监督进程据此结束对这次创建的计数
+                    self.post(("created", None))
+        elif kind == "disconnect":
+            session = self.sessions.pop(message[1], None)
+            if session:
+                for battle_id in list(session.battles | session.watching):
+                    server.leave(session, battle_id)
+        elif kind == "backlog":
+            session = self.sessions.get(message[1])
+            if session:
+                session.congested = message[2]
+        elif kind == "export":
+            battle_id = message[1]
+            exported = server.export_battle(battle_id)
+            if exported is None:
+                self.post(("exported", battle_id, None, [], []))
+            else:
+                snapshot, sessions, spectators = exported
+                self.post(("exported", battle_id, snapshot,
+                           [session.conn_id for session in sessions], [session.conn_id for session in spectators]))
+        elif kind == "import":
+            _, battle_id, snapshot, players, spectators = message
+            server.import_battle(battle_id, snapshot,
+                                 [self._session(conn_id) for conn_id in players],
+                                 [self._session(conn_id) for conn_id in spectators])
+        elif kind == "stats":
+            self.post(("stats", message[1], server.stats()))
+        elif kind == "stop" and not self.stopped.done():
+            self.stopped.set_result(None)
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = self.loop.create_future()
+        self.loop.add_reader(self.conn.fileno(), self._on_message)
+        try:
+            await self.stopped
+        finally:
+            self.loop.remove_reader(self.conn.fileno())
+            await self.server.close()
+
+def run_worker(conn, index, count, ai_delay, max_turns):
+    """工作进程入口"""
+    asyncio.run(ShardWorker(conn, index, count, ai_delay, max_turns).run())
+
+
+class WorkerHandle:
+    """监督进程中一个工作进程的代理"""
+    def __init__(self, index, process, conn):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.battles = set()    # 该工作进程托管的战斗ID
+        self.creating = 0       # 已转发、尚未确认的创建请求数
+
+    @property
+    def load(self):
+        return len(self.battles) + self.creating
+
+    def send(self, message):
+        self.conn.send(message)
+
+
+class ShardSupervisor:
+    """监督进程：接受客户端连接，按战斗ID路由请求，并在工作进程之间迁移战斗以平衡负载"""
+    def __init__(self, workers=None, ai_delay=AI_ACTION_DELAY, max_turns=MAX_BATTLE_TURNS,
+                 rebalance_interval=REBALANCE_INTERVAL, rebalance_threshold=REBALANCE_THRESHOLD):
+        self.worker_count = workers or os.cpu_count() or 1
+        self.ai_delay = ai_delay
+        self.max_turns = max_turns
+        self.rebalance_interval = rebalance_interval
+        self.rebalance_threshold = rebalance_threshold
+        self.workers = []
+        self.owners = {}        # 战斗ID -> WorkerHandle
+        self.migrating = {}     # 战斗ID -> 迁移期间暂存的(连接ID, 请求)
+        self.clients = {}       # 连接ID -> StreamWriter
+        self.tasks = {}         # 连接ID -> 处理该连接的任务
+        self.congested = set()  # 发送积压过多的连接ID
+        self.next_conn_id = 1
+        self.pending_stats = {} # 编号 -> (Future, 已收到的统计)
+        self.next_stats_id = 1
+        self.migrations = 0
+        self.server = None
+        self.background = []
+
+    async def start(self, host=SERVER_HOST, port=SERVER_PORT):
+        """启动工作进程并开始监听，port为0时由系统分配端口"""
+        loop = asyncio.get_running_loop()
+        for index in range(self.worker_count):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=run_worker, args=(child_conn, index, self.worker_count, self.ai_delay, self.max_turns),
+                name=f"battle-shard-{index}", daemon=True)
+            process.start()
+            child_conn.close()
+            worker = WorkerHandle(index, process, parent_conn)
+            loop.add_reader(parent_conn.fileno(), self._on_worker_messages, worker)
+            self.workers.append(worker)
+
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+        self.background = [asyncio.create_task(self._rebalance_loop()),
+                           asyncio.create_task(self._backlog_loop())]
+        return self.server
+
+    @property
+    def address(self):
+        """实际监听的(主机, 端口)"""
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        """停止监听、关闭客户端连接并结束所有工作进程"""
+        loop = asyncio.get_running_loop()
+        for task in self.background:
+            task.cancel()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        for writer in self.clients.values():
+            writer.close()
+        if self.tasks:
+            await asyncio.wait(list(self.tasks.values()))
+        for worker in self.workers:
+            loop.remove_reader(worker.conn.fileno())
+            worker.send(("stop",))
+        for worker in self.workers:
+            await loop.run_in_executor(None, worker.process.join)
+            worker.conn.close()
+
+    async def handle_client(self, reader, writer):
+        """处理一个客户端连接，逐行读取请求并路由到工作进程"""
+        conn_id = self.next_conn_id
+        self.next_conn_id += 1
+        self.clients[conn_id] = writer
+        self.tasks[conn_id] = asyncio.current_task()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = None
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("请求必须是JSON对象")
+                    await self.route(conn_id, request)
+                except ValueError as e:
+                    battle_id = request.get("battle") if isinstance(request, dict) else None
+                    writer.write(encode_event({"event": "error", "battle": battle_id, "message": str(e)}))
+                # 与BattleServer.handle_client相同，不等待drain，积压由congested标记控制
+        except ConnectionError:
+            pass
+        finally:
+            del self.clients[conn_id]
+            del self.tasks[conn_id]
+            self.congested.discard(conn_id)
+            for worker in self.workers:
+                worker.send(("disconnect", conn_id))
+            writer.close()
+
+    async def route(self, conn_id, request):
+        """把请求交给对应的工作进程，请求无法路由时抛出ValueError"""
+        op = request.get("op")
+        if op == "create":
+            worker = min(self.workers, key=lambda worker: worker.load)
+            worker.creating += 1
+            worker.send(("request", conn_id, request))
+        elif op == "stats":
+            self.clients[conn_id].write(encode_event(dict(await self.stats(), event="stats")))
+        else:
+            battle_id = request.get("battle")
+            if not isinstance(battle_id, int):
+                # 列表、字典等不可哈希的值做字典查找会抛出TypeError
+                raise ValueError(f"无效的战斗ID: {battle_id}")
+            if battle_id in self.migrating:
+                self.migrating[battle_id].append((conn_id, request))
+            elif battle_id in self.owners:
+                self.owners[battle_id].send(("request", conn_id, request))
+            else:
+                raise ValueError(f"战斗不存在: {battle_id}")
+
+    def _on_worker_messages(self, worker):
+        while worker.conn.poll():
+            try:
+                messages = worker.conn.recv()
+            except EOFError:
+                asyncio.get_running_loop().remove_reader(worker.conn.fileno())
+                return
+            touched = set()
+            for message in messages:
+                kind = message[0]
+                if kind == "send":
+                    writer = self.clients.get(message[1])
+                    if writer is not None and not writer.is_closing():
+                        writer.write(message[2])
+                        touched.add(message[1])
+                elif kind == "created":
+                    battle_id = message[1]
+                    # 迁入的战斗在开始迁移时已经登记了归属
+                    if battle_id not in self.owners:
+                        worker.creating -= 1
+                    if battle_id is not None:
+                        worker.battles.add(battle_id)
+                        self.owners[battle_id] = worker
+                elif kind == "removed":
+                    worker.battles.discard(message[1])
+                    if self.owners.get(message[1]) is worker:
+                        del self.owners[message[1]]
+                elif kind == "exported":
+                    self._finish_migration(worker, *message[1:])
+                elif kind == "stats":
+                    pending = self.pending_stats.get(message[1])
+                    if pending:
+                        pending[1].append(message[2])
+                        if len(pending[1]) == len(self.workers):
+                            pending[0].set_result(pending[1])
+            for conn_id in touched:
+                self._check_backlog(conn_id)
+
+    def _check_backlog(self, conn_id):
+        """连接的发送积压超过上限时通知所有工作进程，由它们改为之后发送关键帧"""
+        writer = self.clients[conn_id]
+        if conn_id not in self.congested and writer.transport.get_write_buffer_size() > SESSION_BUFFER_HIGH:
+            self.congested.add(conn_id)
+            for worker in self.workers:
+                worker.send(("backlog", conn_id, True))
+
+    async def _backlog_loop(self):
+        # 积压回落时监督进程不会收到新的事件，需要定时检查
+        while True:
+            await asyncio.sleep(BACKLOG_CHECK_INTERVAL)
+            for conn_id in list(self.congested):
+                writer = self.clients.get(conn_id)
+                if writer is None or writer.transport.get_write_buffer_size() <= SESSION_BUFFER_LOW:
+                    self.congested.discard(conn_id)
+                    for worker in self.workers:
+                        worker.send(("backlog", conn_id, False))
+
+    async def _rebalance_loop(self):
+        while True:
+            await asyncio.sleep(self.rebalance_interval)
+            self.rebalance()
+
+    def rebalance(self):
+        """托管战斗数相差超过阈值时，从最忙的工作进程迁移一部分战斗到最闲的工作进程"""
+        busiest = max(self.workers, key=lambda worker: len(worker.battles))
+        idlest = min(self.workers, key=lambda worker: len(worker.battles))
+        difference = len(busiest.battles) - len(idlest.battles)
+        if difference <= self.rebalance_threshold:
+            return 0
+
+        candidates = [battle_id for battle_id in busiest.battles if battle_id not in self.migrating]
+        moved = candidates[:min(MIGRATION_BATCH, difference // 2)]
+        for battle_id in moved:
+            self.migrating[battle_id] = []
+            busiest.battles.discard(battle_id)
+            idlest.battles.add(battle_id)       # 提前计入，避免下一次再平衡重复迁移
+            busiest.send(("export", battle_id))
+        return len(moved)
+
+    def _finish_migration(self, source, battle_id, snapshot, players, spectators):
+        queued = self.migrating.pop(battle_id, [])
+        target = next(worker for worker in self.workers if battle_id in worker.battles)
+        if snapshot is None:
+            # 迁出前战斗已经结束，暂存的请求交还源进程，由它回复错误
+            target.battles.discard(battle_id)
+            target = source
+        else:
+            # 导出后、导入前断开的客户端已不在clients中，它们的disconnect只发给了当时的工作进程，
+            # 不能在目标进程上重建会话；没有参战客户端时目标进程导入后直接丢弃这场战斗
+            players = [conn_id for conn_id in players if conn_id in self.clients]
+            spectators = [conn_id for conn_id in spectators if conn_id in self.clients] if players else []
+            target.send(("import", battle_id, snapshot, players, spectators))
+            self.owners[battle_id] = target
+            self.migrations += 1
+        for conn_id, request in queued:
+            target.send(("request", conn_id, request))
+
+    async def stats(self):
+        """汇总所有工作进程的统计"""
+        loop = asyncio.get_running_loop()
+        stats_id = self.next_stats_id
+        self.next_stats_id += 1
+        future = loop.create_future()
+        self.pending_stats[stats_id] = (future, [])
+        for worker in self.workers:
+            worker.send(("stats", stats_id))
+        try:
+            shards = await future
+        finally:
+            del self.pending_stats[stats_id]
+        return merge_stats(shards, self.migrations)
+
+
+def merge_stats(shards, migrations=0):
+    """合并各工作进程的统计：计数相加(峰值为各进程峰值之和)，耗时和延迟取最大值"""
+    merged = {}
+    for stats in shards:
+        for key, value in stats.items():
+            if key.startswith("max_") or key.startswith("loop_lag"):
+                merged[key] = max(merged.get(key, 0), value)
+            elif key != "avg_step_ms":
+                merged[key] = merged.get(key, 0) + value
+    merged["avg_step_ms"] = (sum(stats["avg_step_ms"] * stats["actions"] for stats in shards) /
+                             max(merged.get("actions", 0), 1))
+    merged["workers"] = len(shards)
+    merged["migrations"] = migrations
+    merged["shard_battles"] = [stats["active"] for stats in shards]
+    return merged
+
+
+async def serve(workers=None, host=SERVER_HOST, port=SERVER_PORT, ai_delay=AI_ACTION_DELAY, max_turns=MAX_BATTLE_TURNS):
+    """运行分片服务器直到被中断"""
+    supervisor = ShardSupervisor(workers, ai_delay, max_turns)
+    await supervisor.start(host, port)
+    print(f"分片对战服务器监听于 {supervisor.address[0]}:{supervisor.address[1]}，工作进程: {supervisor.worker_count}")
+    try:
+        await supervisor.server.serve_forever()
+    finally:
+        await supervisor.close()
+
+
+def load_test_process(host, port, players, games, seed):
+    """在独立进程中运行一组负载测试客户端，避免客户端开销占用监督进程的核心"""
+    report = asyncio.run(run_load_test(players, games, host, port, seed=seed))
+    return report["battles"], report["latency_p99_ms"]
+
+async def benchmark_workers(workers, players, games, client_processes, seed=0):
+    """用workers个工作进程运行一轮负载测试，返回统计"""
+    supervisor = ShardSupervisor(workers, ai_delay=0.0)
+    await supervisor.start("127.0.0.1", 0)
+    host, port = supervisor.address
+    loop = asyncio.get_running_loop()
+    rng = random.Random(seed)
+    shares = [players // client_processes + (1 if index < players % client_processes else 0)
+              for index in range(client_processes)]
+    start = time.perf_counter()
+    try:
+        with concurrent.futures.ProcessPoolExecutor(client_processes) as pool:
+            reports = await asyncio.gather(*(
+                loop.run_in_executor(pool, load_test_process, host, port, share, games, rng.getrandbits(32))
+                for share in shares if share
+            ))
+        elapsed = time.perf_counter() - start
+        stats = await supervisor.stats()
+    finally:
+        await supervisor.close()
+    return {
+        "workers": workers,
+        "battles": sum(battles for battles, _ in reports),
+        "elapsed": elapsed,
+        "actions": stats["actions"],
+        "migrations": stats["migrations"],
+        "latency_p99_ms": max(latency for _, latency in reports),
+    }
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="火影忍者OL战斗原型 - 分片对战服务器")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="启动分片对战服务器")
+    serve_parser.add_argument("--workers", type=int, default=None, help="工作进程数 (默认: CPU核心数)")
+    serve_parser.add_argument("--host", default=SERVER_HOST, help="监听地址")
+    serve_parser.add_argument("--port", type=int, default=SERVER_PORT, help="监听端口")
+    serve_parser.add_argument("--ai-delay", type=float, default=AI_ACTION_DELAY, help="敌方每次行动前的间隔(秒)")
+    serve_parser.add_argument("--max-turns", type=int, default=MAX_BATTLE_TURNS, help="回合上限，超过判为平局")
+
+    bench_parser = subparsers.add_parser("bench", help="比较不同工作进程数下的吞吐")
+    bench_parser.add_argument("--workers", default="1,2,4", help="依次测试的工作进程数，用逗号分隔")
+    bench_parser.add_argument("--players", type=int, default=400, help="并发玩家数")
+    bench_parser.add_argument("--games", type=int, default=2, help="每名玩家依次进行的战斗数")
+    bench_parser.add_argument("--client-processes", type=int, default=None,
+                              help="运行负载测试客户端的进程数 (默认: 与工作进程数相同)")
+    bench_parser.add_argument("--seed", type=int, default=0, help="客户端随机种子")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        try:
+            asyncio.run(serve(args.workers, args.host, args.port, args.ai_delay, args.max_turns))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    try:
+        counts = [int(count) for count in args.workers.split(",")]
+    except ValueError:
+        parser.error(f"无效的工作进程数: {args.workers}")
+    if any(count <= 0 for count in counts) or args.players <= 0 or args.games <= 0:
+        parser.error("工作进程数、玩家数和战斗数必须为正数")
+
+    print(f"CPU核心数: {os.cpu_count()}，并发玩家: {args.players}，每人战斗: {args.games}")
+    baseline = None
+    for count in counts:
+        result = asyncio.run(benchmark_workers(count, args.players, args.games,
+                                               args.client_processes or count, args.seed))
+        throughput = result["battles"] / max(result["elapsed"], 1e-9)
+        baseline = baseline or throughput / count
+        print(f"工作进程 {count}: {result['battles']} 场，耗时 {result['elapsed']:.1f} 秒，"
+              f"{throughput:.1f} 场/秒，{result['actions'] / max(result['elapsed'], 1e-9):.0f} 次行动/秒，"
+              f"相对单进程 {throughput / baseline:.2f} 倍，迁移 {result['migrations']} 次，"
+              f"出招延迟p99 {result['latency_p99_ms']:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,17 @@
 """
 配置文件：定义游戏中使用的常量和配置
 """
+import os
 
 # 屏幕设置
 SCREEN_WIDTH = 1920
 SCREEN_HEIGHT = 1080
 GAME_TITLE = "火影忍者OL战斗原型"
-FPS = 60
+FPS = 60                # 渲染帧率上限
+UPDATE_RATE = 60        # 逻辑更新频率(次/秒)，固定步长，与渲染帧率无关
+MAX_FRAME_TIME = 0.25   # 单帧最多追赶的逻辑时间(秒)，防止卡顿后连续补帧
+TURBO_SPEEDS = (1, 2, 4, 8, 0)  # 快进倍速(每个逻辑步执行的update次数)，0表示极速：需要输入前不渲染
+TURBO_FRAME_BUDGET = 0.05       # 极速模式下每帧用于推进逻辑的最长时间(秒)，保证窗口仍能响应
 
 # 颜色定义
 WHITE = (255, 255, 255)
@@ -25,6 +30,25 @@ TRANSPARENT = (0, 0, 0, 0)
 MAX_CHAKRA = 100
 CHAKRA_PER_TURN = 20
 MAX_TEAM_SIZE = 4
+MAX_BATTLE_TURNS = 100  # 无界面模拟的回合上限，超过判为平局
+AI_ACTION_DELAY = 0.8   # 敌方行动后的停顿(秒)，便于玩家看清AI的动作
+REPLAY_STEP_DELAY = 0.5 # 回放播放时每次决策之间的间隔(秒)
+
+# 对战服务器
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+SESSION_BUFFER_HIGH = 256 * 1024    # 连接的发送积压超过该字节数时停止推送差异
+SESSION_BUFFER_LOW = 32 * 1024      # 积压降到该字节数以下后用关键帧重新同步
+REBALANCE_INTERVAL = 1.0            # 分片服务器检查负载均衡的间隔(秒)
+REBALANCE_THRESHOLD = 8             # 工作进程托管的战斗数相差超过该值时迁移战斗
+
+# 战斗结果数据库
+RESULTS_BATCH_SIZE = 5000           # 后台线程每个事务最多写入的战斗数
+RESULTS_FLUSH_INTERVAL = 0.5        # 攒批的最长等待时间(秒)
+
+# 性能基准
+BENCHMARK_ROUNDS = 5                # 每个基准测量的轮数，每轮开始前回收一次垃圾
+BENCHMARK_THRESHOLD = 0.20          # 比基线慢超过该比例视为性能回退
 
 # 状态效果
 STATUS_EFFECT_TYPES = {
@@ -80,4 +104,12 @@ BUTTON_HEIGHT = 50
 CHAR_CARD_WIDTH = 150
 CHAR_CARD_HEIGHT = 200
 HP_BAR_WIDTH = 100
-HP_BAR_HEIGHT = 10 
\ No newline at end of file
+HP_BAR_HEIGHT = 10
+MESSAGE_HISTORY_SIZE = 200  # 战斗日志可滚动查看的历史消息条数
+
+# 渲染缓存
+TEXT_CACHE_SIZE = 512  # 文字表面缓存的最大条目数
+GLYPH_ATLAS_PAGE_SIZE = 512  # 字形图集每页的边长(像素)
+GLYPH_ATLAS_MAX_PAGES = 4    # 每个字号最多的图集页数，用满后清空最久未使用的一页
+# 找到的中文字体文件路径缓存在这里，之后启动直接打开字体文件；环境变量NARUTO_FONT_CACHE可覆盖
+FONT_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "naruto_game", "fonts.json")
@@ -1,6 +1,7 @@
 import pygame
 import sys
-from naruto_game.config import SCREEN_WIDTH, SCREEN_HEIGHT, FPS, GAME_TITLE
+import time
+from naruto_game.config import SCREEN_WIDTH, SCREEN_HEIGHT, FPS, UPDATE_RATE, MAX_FRAME_TIME, GAME_TITLE
 from naruto_game.scenes import TitleScene, BattleScene
 
 class Game:
@@ -19,8 +20,17 @@ class Game:
         # Start with title scene
         self.current_scene = TitleScene(self)
         
+        # Fixed timestep: logic advances at UPDATE_RATE regardless of frame rate
+        step = 1.0 / UPDATE_RATE
+        accumulator = 0.0
+        previous_time = time.perf_counter()
+        
         # Main game loop
         while self.running:
+            now = time.perf_counter()
+            accumulator += min(now - previous_time, MAX_FRAME_TIME)
+            previous_time = now
+            
             # Process events
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
@@ -28,20 +38,26 @@ class Game:
                 if self.current_scene:
                     self.current_scene.handle_event(event)
             
-            # Update scene
-            if self.current_scene:
+            # Update scene in fixed steps until caught up with real time
+            while self.current_scene and accumulator >= step:
                 self.current_scene.update()
+                accumulator -= step
                 
                 # Check for scene change
                 if self.current_scene.next_scene:
                     self.current_scene = self.current_scene.next_scene
             
-            # Render scene
+            # Render scene (returns dirty rects, or None for a full redraw)
+            dirty_rects = None
             if self.current_scene:
-                self.current_scene.render(self.screen)
+                self.current_scene.interpolation = accumulator / step
+                dirty_rects = self.current_scene.render(self.screen)
             
             # Update display
-            pygame.display.flip()
+            if dirty_rects is None:
+                pygame.display.flip()
+            elif dirty_rects:
+                pygame.display.update(dirty_rects)
             
             # Cap frame rate
             self.clock.tick(FPS)
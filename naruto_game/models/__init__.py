@@ -1,7 +1,55 @@
 """
 模型包的初始化文件
+
+包级别的名字按需导入(PEP 562)：访问models.Character时才加载character模块，
+只需要战斗核心的模拟进程和命令行工具不会因为导入本包而加载全部模块。
 """
-from .status_effects import *
-from .skills import *
-from .character import *
-from .battle import * 
\ No newline at end of file
+import importlib
+
+# 子模块 -> 对外提供的名字
+_EXPORTS = {
+    "status_effects": (
+        "StatusEffectDefinition", "ActiveStatusEffect", "StatModifier",
+        "create_attack_up", "create_defense_up", "create_small_float", "create_big_float", "create_knockdown",
+        "create_repel", "create_ignite", "create_poison", "create_seal", "create_immobilize", "create_blind",
+        "create_bleed", "create_stun", "create_slow", "create_mind_control", "create_confusion",
+    ),
+    "skills": (
+        "Skill", "NormalAttack", "MysterySkill", "ChaseSkill", "PassiveSkill",
+        "create_normal_punch", "create_naruto_skills", "create_sasuke_skills", "create_sakura_skills",
+        "create_kakashi_skills", "create_shikamaru_skills", "create_choji_skills", "create_ino_skills",
+    ),
+    "character": (
+        "DIRTY_HP", "DIRTY_EFFECTS", "DIRTY_COOLDOWNS",
+        "STAT_DAMAGE_PHYSICAL", "STAT_DAMAGE_NINJUTSU", "STAT_DAMAGE_FIRE", "STAT_DAMAGE_POISON",
+        "STAT_DAMAGE_TAKEN", "STAT_HEALING_DONE", "STAT_HEALING_RECEIVED", "STAT_STATUSES_APPLIED",
+        "STAT_CHASES", "STAT_LONGEST_CHAIN", "STAT_COUNT", "DAMAGE_STATS",
+        "Character", "BattleTeam", "ROSTER",
+        "create_naruto", "create_sasuke", "create_sakura", "create_kakashi", "create_shikamaru", "create_choji",
+        "create_ino", "create_team7", "create_team10", "create_team_from_lineup",
+    ),
+    "battle": ("BattleState", "BattleSystem"),
+    "state_delta": (
+        "DELTA_DIFF", "DELTA_KEYFRAME", "PHASES", "EMPTY_DIFF", "ENEMY_REF_FLAG", "NO_REF",
+        "FIELD_TURN", "FIELD_PHASE", "FIELD_TEAM", "FIELD_ACTOR", "FIELD_PLAYER_CHAKRA", "FIELD_ENEMY_CHAKRA",
+        "FIELD_OVER", "FIELD_HP_INT", "FIELD_HP_FLOAT", "FIELD_ALIVE", "FIELD_COOLDOWNS", "FIELD_EFFECTS",
+        "StateTracker", "character_refs", "character_from_ref", "create_effect_definition",
+        "is_empty_delta", "apply_state_delta",
+    ),
+}
+
+_LOCATIONS = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = list(_LOCATIONS)
+
+
+def __getattr__(name):
+    module = _LOCATIONS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f"{__name__}.{module}"), name)
+    globals()[name] = value     # 之后的访问不再经过__getattr__
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
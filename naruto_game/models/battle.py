@@ -17,6 +17,8 @@ class BattleState:
         self.selected_targets = []                    # 选中的技能目标
         self.combo_count = 0                          # 当前连击数
         self.is_battle_over = False                   # 战斗是否结束
+        self.ai_policy = None                         # AI策略函数，为None时使用内置AI
+        self.auto_enemy_actions = True                # 为False时不自动执行敌方行动，停在敌方角色的行动阶段，由外部调用perform_ai_action
         
         # 战斗阶段
         self.phase = "BATTLE_START"  # 'BATTLE_START' | 'TURN_START' | 'CHARACTER_ACTION' | 'TURN_END' | 'BATTLE_END'
@@ -46,6 +48,10 @@ class BattleState:
         # 处理回合开始时的状态效果
         self._process_turn_start_effects()
         
+        # 持续伤害可能击败最后一名角色
+        if self.check_battle_end():
+            return
+        
         # 开始角色行动
         self.start_character_action()
     
@@ -91,17 +97,31 @@ class BattleState:
                 self.add_to_battle_log(f"{character.name} 行动！")
                 
                 # 如果是敌人，AI自动选择技能和目标
-                if self.current_team == self.enemy_team:
-                    self._ai_select_skill_and_targets()
-                    self.use_current_skill()
+                if self.current_team == self.enemy_team and self.auto_enemy_actions:
+                    self.perform_ai_action()
                 
                 return
                 
         # 如果没有角色可以行动，结束当前队伍的回合
         self.end_team_turn()
     
+    def choose_ai_action(self):
+        """由AI为当前角色选择技能和目标，返回(技能, 目标列表)，不执行"""
+        self._ai_select_skill_and_targets()
+        return self.selected_skill, self.selected_targets
+    
+    def perform_ai_action(self):
+        """由AI为当前角色选择技能和目标并执行"""
+        self._ai_select_skill_and_targets()
+        return self.use_current_skill()
+    
     def _ai_select_skill_and_targets(self):
         """AI自动选择技能和目标"""
+        # 如果指定了AI策略，由策略决定技能和目标
+        if self.ai_policy:
+            self.selected_skill, self.selected_targets = self.ai_policy(self, self.current_character)
+            return
+        
         # 找出所有可用的技能（查克拉足够，没有在冷却）
         available_skills = []
         for skill in self.current_character.skills:
@@ -209,9 +229,8 @@ class BattleState:
             self.add_to_battle_log(f"{next_character.name} 行动！")
             
             # 如果是敌人，AI自动选择技能和目标
-            if self.current_team == self.enemy_team:
-                self._ai_select_skill_and_targets()
-                self.use_current_skill()
+            if self.current_team == self.enemy_team and self.auto_enemy_actions:
+                self.perform_ai_action()
         else:
             # 当前队伍没有更多角色可以行动，结束该队伍的回合
             self.end_team_turn()
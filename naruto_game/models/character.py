@@ -2,9 +2,33 @@
 角色与战队模块：定义角色和战队的基本功能
 """
 import random
-import pygame
 import math
-from naruto_game.utils.helpers import create_simple_character_image
+
+# 脏标记：自上次生成状态差异以来变化过的字段，由state_delta.StateTracker读取后清除
+DIRTY_HP = 0x01          # 生命值或存活状态
+DIRTY_EFFECTS = 0x02     # 状态效果的增加、移除或叠层
+DIRTY_COOLDOWNS = 0x04   # 技能冷却
+
+# 战斗统计：Character.combat_stats中各计数器的下标，长度固定为STAT_COUNT
+STAT_DAMAGE_PHYSICAL = 0     # 造成的物理伤害
+STAT_DAMAGE_NINJUTSU = 1     # 造成的忍术伤害
+STAT_DAMAGE_FIRE = 2         # 造成的灼烧伤害
+STAT_DAMAGE_POISON = 3       # 造成的中毒伤害
+STAT_DAMAGE_TAKEN = 4        # 受到的伤害
+STAT_HEALING_DONE = 5        # 施加的治疗
+STAT_HEALING_RECEIVED = 6    # 受到的治疗
+STAT_STATUSES_APPLIED = 7    # 施加的状态效果次数
+STAT_CHASES = 8              # 发动的追打次数
+STAT_LONGEST_CHAIN = 9       # 参与过的最长追打链(含起手攻击)
+STAT_COUNT = 10
+
+# 伤害类型 -> 造成伤害的计数器下标
+DAMAGE_STATS = {
+    "physical": STAT_DAMAGE_PHYSICAL,
+    "ninjutsu": STAT_DAMAGE_NINJUTSU,
+    "fire": STAT_DAMAGE_FIRE,
+    "poison": STAT_DAMAGE_POISON,
+}
 
 class Character:
     """角色基类：定义一个忍者角色的基本属性和方法"""
@@ -25,6 +49,8 @@ class Character:
         
         # 战场位置
         self.battle_position = (0, 0)  # 当前位置
+        self.previous_position = (0, 0)  # 上一个逻辑步的位置，用于渲染插值
+        self.render_position = (0, 0)  # 本帧插值后的绘制位置
         self.target_position = (0, 0)  # 目标位置
         self.move_speed = 5           # 移动速度
         self.is_moving = False        # 是否正在移动
@@ -40,15 +66,71 @@ class Character:
         self.status_effects = []   # 状态效果列表
         self.is_alive = True       # 是否存活
         self.can_act = True        # 是否可以行动
+        self.dirty = 0             # 脏标记(DIRTY_*的组合)
+
+        # 战斗统计：按STAT_*下标累加，伤害和治疗只计实际扣除或恢复的生命值
+        self.combat_stats = [0] * STAT_COUNT
         
         # 标签：用于识别角色属性、流派等
         self.tags = []
         
-        # 创建简单的角色图像
-        self.image = create_simple_character_image(name, (100, 100, 100))
+        # 角色图像：首次访问时才生成，无界面的模拟不需要渲染头像
+        self.image_color = (100, 100, 100)
+        self._image = None
+        self._portraits = {}       # 缩放后的头像缓存：尺寸 -> Surface
+    
+    @property
+    def image(self):
+        """角色图像（延迟创建）"""
+        if self._image is None:
+            # 渲染相关的模块在第一次需要图像时才导入，无界面的模拟不加载pygame
+            from naruto_game.utils.helpers import create_simple_character_image
+            self._image = create_simple_character_image(self.name, self.image_color)
+        return self._image
+    
+    @image.setter
+    def image(self, value):
+        self._image = value
+        self._portraits = {}
+    
+    @property
+    def damage_dealt(self):
+        """造成的伤害(各类型之和)"""
+        stats = self.combat_stats
+        return stats[STAT_DAMAGE_PHYSICAL] + stats[STAT_DAMAGE_NINJUTSU] + stats[STAT_DAMAGE_FIRE] + stats[STAT_DAMAGE_POISON]
+    
+    @property
+    def damage_taken(self):
+        """受到的伤害"""
+        return self.combat_stats[STAT_DAMAGE_TAKEN]
+    
+    @property
+    def healing_received(self):
+        """受到的治疗"""
+        return self.combat_stats[STAT_HEALING_RECEIVED]
+    
+    def __getstate__(self):
+        """复制或序列化角色时不包含缓存的图像，需要时会重新生成"""
+        state = self.__dict__.copy()
+        state["_image"] = None
+        state["_portraits"] = {}
+        return state
+    
+    def get_portrait(self, size):
+        """获取缩放到指定尺寸(宽, 高)的头像，每个尺寸只缩放一次"""
+        portrait = self._portraits.get(size)
+        if portrait is None:
+            import pygame
+            portrait = pygame.transform.scale(self.image, size)
+            # 转换为显示表面的像素格式，之后的blit不再需要逐帧转换
+            if pygame.display.get_surface() is not None:
+                portrait = portrait.convert_alpha()
+            self._portraits[size] = portrait
+        return portrait
     
     def move_towards_target(self):
-        """向目标位置移动"""
+        """向目标位置移动，每个固定逻辑步调用一次"""
+        self.previous_position = self.battle_position
         if not self.is_moving:
             return
             
@@ -72,6 +154,14 @@ class Character:
         x, y = self.battle_position
         self.battle_position = (x + move_x, y + move_y)
     
+    def get_render_position(self, alpha):
+        """在上一步和当前位置之间按alpha(0~1)插值，得到渲染位置"""
+        if alpha >= 1 or self.previous_position == self.battle_position:
+            return self.battle_position
+        prev_x, prev_y = self.previous_position
+        x, y = self.battle_position
+        return (prev_x + (x - prev_x) * alpha, prev_y + (y - prev_y) * alpha)
+    
     def start_move_to(self, target_pos):
         """开始移动到目标位置"""
         self.target_position = target_pos
@@ -88,13 +178,21 @@ class Character:
             actual_damage = self.calculate_ninjutsu_damage(amount, source)
             
         # 应用伤害
+        hp_before = self.current_hp
         self.current_hp -= actual_damage
+        self.dirty |= DIRTY_HP
         
         # 检查是否死亡
         if self.current_hp <= 0:
             self.current_hp = 0
             self.is_alive = False
             self.can_act = False
+        
+        # 统计不含溢出的伤害
+        lost = hp_before - self.current_hp
+        self.combat_stats[STAT_DAMAGE_TAKEN] += lost
+        if source is not None:
+            source.combat_stats[DAMAGE_STATS.get(damage_type, STAT_DAMAGE_PHYSICAL)] += lost
             
         return actual_damage
     
@@ -110,13 +208,19 @@ class Character:
         damage_reduction = 100 / (100 + self.resistance)
         return int(raw_damage * damage_reduction)
     
-    def heal(self, amount):
-        """治疗"""
+    def heal(self, amount, source=None):
+        """治疗，source为施加治疗的角色"""
         if not self.is_alive:
             return 0  # 无法治疗死亡角色
             
         old_hp = self.current_hp
         self.current_hp = min(self.current_hp + amount, self.max_hp)
+        if self.current_hp != old_hp:
+            self.dirty |= DIRTY_HP
+            restored = self.current_hp - old_hp
+            self.combat_stats[STAT_HEALING_RECEIVED] += restored
+            if source is not None:
+                source.combat_stats[STAT_HEALING_DONE] += restored
         
         # 如果被治疗的角色之前没有生命值（例如复活），将其标记为活着
         if old_hp == 0 and self.current_hp > 0:
@@ -127,6 +231,9 @@ class Character:
     
     def add_status_effect(self, effect_definition, source, current_turn):
         """添加状态效果"""
+        if source is not None:
+            source.combat_stats[STAT_STATUSES_APPLIED] += 1
+        
         # 检查是否已有相同ID的效果
         existing_effect = next((effect for effect in self.status_effects if effect.id == effect_definition.id), None)
         
@@ -134,6 +241,7 @@ class Character:
             # 如果已存在且可叠加，增加层数
             if existing_effect.stacks < effect_definition.max_stacks:
                 existing_effect.add_stack()
+                self.dirty |= DIRTY_EFFECTS
             # 刷新持续时间
             existing_effect.reset_duration()
         else:
@@ -150,6 +258,7 @@ class Character:
                 self.can_act = False
                 
             self.status_effects.append(active_effect)
+            self.dirty |= DIRTY_EFFECTS
     
     def remove_status_effect(self, effect):
         """移除状态效果"""
@@ -166,6 +275,7 @@ class Character:
                     self.can_act = True
                     
             self.status_effects.remove(effect)
+            self.dirty |= DIRTY_EFFECTS
     
     def update_status_effects(self, is_turn_start, current_turn):
         """更新状态效果"""
@@ -190,7 +300,9 @@ class Character:
             
         # 更新技能冷却
         for skill in self.skills:
-            skill.update_cooldown()
+            if skill.current_cooldown > 0:
+                skill.update_cooldown()
+                self.dirty |= DIRTY_COOLDOWNS
 
 
 class BattleTeam:
@@ -198,6 +310,7 @@ class BattleTeam:
     def __init__(self, player_id, characters, shared_chakra=0, max_chakra=100, chakra_per_turn=20):
         self.player_id = player_id              # 玩家ID
         self.characters = characters            # 角色列表
+        self.chakra_dirty = True                # 查克拉自上次生成状态差异以来是否变化过
         self.shared_chakra = shared_chakra      # 共享查克拉
         self.max_chakra = max_chakra            # 最大查克拉
         self.chakra_per_turn = chakra_per_turn  # 每回合回复查克拉量
@@ -206,6 +319,16 @@ class BattleTeam:
         # 按手位排序角色
         self.characters.sort(key=lambda char: char.position)
     
+    @property
+    def shared_chakra(self):
+        """共享查克拉"""
+        return self._shared_chakra
+    
+    @shared_chakra.setter
+    def shared_chakra(self, value):
+        self._shared_chakra = value
+        self.chakra_dirty = True
+    
     def update_chakra_per_turn(self):
         """每回合更新查克拉"""
         self.shared_chakra = min(self.shared_chakra + self.chakra_per_turn, self.max_chakra)
@@ -258,8 +381,8 @@ def create_naruto():
     
     # 设置角色标签和颜色
     naruto.tags = ["第七班", "木叶", "九尾人柱力"]
-    # 设置角色图像
-    naruto.image = create_simple_character_image("漩涡鸣人", (255, 165, 0))  # 橙色
+    # 设置角色图像颜色
+    naruto.image_color = (255, 165, 0)  # 橙色
     
     # 设置技能
     skills = create_naruto_skills()
@@ -289,8 +412,8 @@ def create_sasuke():
     
     # 设置角色标签和颜色
     sasuke.tags = ["第七班", "木叶", "写轮眼", "带刀"]
-    # 设置角色图像
-    sasuke.image = create_simple_character_image("宇智波佐助", (0, 0, 255))  # 蓝色
+    # 设置角色图像颜色
+    sasuke.image_color = (0, 0, 255)  # 蓝色
     
     # 设置技能
     skills = create_sasuke_skills()
@@ -320,8 +443,8 @@ def create_sakura():
     
     # 设置角色标签和颜色
     sakura.tags = ["第七班", "木叶", "医疗忍者"]
-    # 设置角色图像
-    sakura.image = create_simple_character_image("春野樱", (255, 105, 180))  # 粉色
+    # 设置角色图像颜色
+    sakura.image_color = (255, 105, 180)  # 粉色
     
     # 设置技能
     skills = create_sakura_skills()
@@ -351,8 +474,8 @@ def create_kakashi():
     
     # 设置角色标签和颜色
     kakashi.tags = ["第七班", "木叶", "上忍", "写轮眼"]
-    # 设置角色图像
-    kakashi.image = create_simple_character_image("旗木卡卡西", (192, 192, 192))  # 银色
+    # 设置角色图像颜色
+    kakashi.image_color = (192, 192, 192)  # 银色
     
     # 设置技能
     skills = create_kakashi_skills()
@@ -382,8 +505,8 @@ def create_shikamaru():
     
     # 设置角色标签和颜色
     shikamaru.tags = ["第十班", "木叶", "奈良一族"]
-    # 设置角色图像
-    shikamaru.image = create_simple_character_image("奈良鹿丸", (50, 50, 50))  # 暗灰色
+    # 设置角色图像颜色
+    shikamaru.image_color = (50, 50, 50)  # 暗灰色
     
     # 设置技能
     skills = create_shikamaru_skills()
@@ -413,8 +536,8 @@ def create_choji():
     
     # 设置角色标签和颜色
     choji.tags = ["第十班", "木叶", "秋道一族"]
-    # 设置角色图像
-    choji.image = create_simple_character_image("秋道丁次", (165, 42, 42))  # 棕色
+    # 设置角色图像颜色
+    choji.image_color = (165, 42, 42)  # 棕色
     
     # 设置技能
     skills = create_choji_skills()
@@ -444,8 +567,8 @@ def create_ino():
     
     # 设置角色标签和颜色
     ino.tags = ["第十班", "木叶", "山中一族"]
-    # 设置角色图像
-    ino.image = create_simple_character_image("山中井野", (173, 216, 230))  # 浅蓝色
+    # 设置角色图像颜色
+    ino.image_color = (173, 216, 230)  # 浅蓝色
     
     # 设置技能
     skills = create_ino_skills()
@@ -473,4 +596,29 @@ def create_team10():
         characters=[create_shikamaru(), create_choji(), create_ino()],
         shared_chakra=50
     )
-    return team10 
\ No newline at end of file
+    return team10
+
+# 可选忍者名单：角色ID -> 创建函数
+ROSTER = {
+    "naruto": create_naruto,
+    "sasuke": create_sasuke,
+    "sakura": create_sakura,
+    "kakashi": create_kakashi,
+    "shikamaru": create_shikamaru,
+    "choji": create_choji,
+    "ino": create_ino,
+}
+
+def create_team_from_lineup(player_id, lineup, shared_chakra=50):
+    """按阵容创建队伍，lineup为按手位(1-4)排列的角色ID序列"""
+    characters = []
+    for position, char_id in enumerate(lineup, start=1):
+        character = ROSTER[char_id]()
+        character.position = position
+        characters.append(character)
+    
+    return BattleTeam(
+        player_id=player_id,
+        characters=characters,
+        shared_chakra=shared_chakra
+    ) 
\ No newline at end of file
@@ -2,7 +2,20 @@
 技能模块：包含普攻、奥义、追打等各种技能的定义
 """
 import random
-from naruto_game.models.status_effects import *
+from naruto_game.models.status_effects import (
+    create_small_float, create_big_float, create_knockdown, create_repel, create_poison, create_immobilize,
+    create_bleed, create_stun, create_slow, create_mind_control, create_confusion,
+)
+from naruto_game.models.character import DIRTY_COOLDOWNS, STAT_CHASES, STAT_LONGEST_CHAIN
+
+def _record_chain(user, chasers):
+    """记录追打链长度(起手攻击加追打次数)，没有发生追打时不计"""
+    if not chasers:
+        return
+    length = len(chasers) + 1
+    for character in (user, *chasers):
+        if character.combat_stats[STAT_LONGEST_CHAIN] < length:
+            character.combat_stats[STAT_LONGEST_CHAIN] = length
 
 class Skill:
     """技能基类"""
@@ -38,7 +51,9 @@ class Skill:
         battle_state.current_team.shared_chakra -= self.chakra_cost
         
         # 设置冷却
-        self.current_cooldown = self.cooldown_turns
+        if self.cooldown_turns != self.current_cooldown:
+            self.current_cooldown = self.cooldown_turns
+            user.dirty |= DIRTY_COOLDOWNS
         
         # 应用技能效果
         results = []
@@ -65,6 +80,7 @@ class Skill:
         if self.type == 'CHASE':
             return results
         
+        chasers = []
         for target in targets:
             # 查找目标身上是否有可被追打的状态
             chase_states = [effect for effect in target.status_effects if effect.definition.is_chase_state()]
@@ -87,12 +103,16 @@ class Skill:
                             chase_success, chase_result = skill.use(character, [target], battle_state)
                             if chase_success:
                                 results.append(chase_result)
+                                character.combat_stats[STAT_CHASES] += 1
+                                chasers.append(character)
                                 # 更新目标状态，如果目标已经死亡则停止追打链
                                 if not target.is_alive:
+                                    _record_chain(user, chasers)
                                     return results
                                 # 检查追打是否产生了新的可追打状态
                                 break  # 每个角色只能追打一次
         
+        _record_chain(user, chasers)
         return results
     
     def update_cooldown(self):
@@ -512,7 +532,7 @@ def create_sakura_skills():
         
         # 治疗目标
         heal_amount = user.ninja_tech * 0.8
-        target.heal(heal_amount)
+        target.heal(heal_amount, user)
         
         return f"{user.name}使用{self.name}治疗了{target.name}，回复了{heal_amount}点生命值"
     
@@ -0,0 +1,293 @@
+"""
+状态差异模块：在两次战斗步骤之间生成紧凑的二进制状态差异，并把差异应用到另一份战斗状态上
+
+差异靠脏标记增量生成：角色的take_damage、heal、add_status_effect、remove_status_effect、
+技能冷却变化以及队伍查克拉的赋值都会设置脏标记，生成差异时只检查被标记的角色和队伍，
+不比较整个对象图。
+
+格式(小端)：
+    u8 类型(0 差异 / 1 关键帧)  u8 战斗字段掩码  [战斗字段]  u8 角色记录数  [角色记录]
+    战斗字段按掩码位依次为：回合 u16，阶段 u8，当前队伍 u8，当前角色 u8，
+                           我方查克拉 u16，敌方查克拉 u16，是否结束 u8
+    角色记录：u8 角色引用  u8 字段掩码  [字段]
+    角色字段按掩码位依次为：生命值 i32 或 f64，存活 u8，冷却 u8个数+每个技能u8，
+                           状态效果 u8条数+每条(u8层数, u8长度, ID)，层数为0表示移除
+角色引用的最高位表示敌方，低7位为阵容序号；0xFF表示没有角色。
+"""
+import struct
+from naruto_game.models.character import DIRTY_HP, DIRTY_EFFECTS, DIRTY_COOLDOWNS
+from naruto_game.models import status_effects
+from naruto_game.models.status_effects import StatusEffectDefinition, ActiveStatusEffect
+
+DELTA_DIFF = 0
+DELTA_KEYFRAME = 1
+
+PHASES = ("BATTLE_START", "TURN_START", "CHARACTER_ACTION", "TURN_END", "BATTLE_END")
+
+# 战斗字段掩码
+FIELD_TURN = 0x01
+FIELD_PHASE = 0x02
+FIELD_TEAM = 0x04
+FIELD_ACTOR = 0x08
+FIELD_PLAYER_CHAKRA = 0x10
+FIELD_ENEMY_CHAKRA = 0x20
+FIELD_OVER = 0x40
+
+# 角色字段掩码
+FIELD_HP_INT = 0x01
+FIELD_HP_FLOAT = 0x02
+FIELD_ALIVE = 0x04
+FIELD_COOLDOWNS = 0x08
+FIELD_EFFECTS = 0x10
+
+ENEMY_REF_FLAG = 0x80
+NO_REF = 0xFF
+
+_U8 = struct.Struct("<B")
+_U16 = struct.Struct("<H")
+_I32 = struct.Struct("<i")
+_F64 = struct.Struct("<d")
+
+# 战斗字段的编码格式，顺序与FIELD_TURN到FIELD_OVER的掩码位一致
+_BATTLE_FIELD_FORMATS = (_U16, _U8, _U8, _U8, _U16, _U16, _U8)
+
+EMPTY_DIFF = bytes((DELTA_DIFF, 0, 0))
+
+
+def character_refs(battle_state):
+    """(引用, 角色) 列表，我方在前"""
+    refs = [(index, character) for index, character in enumerate(battle_state.player_team.characters)]
+    refs.extend((ENEMY_REF_FLAG | index, character) for index, character in enumerate(battle_state.enemy_team.characters))
+    return refs
+
+def character_from_ref(battle_state, ref):
+    """由引用找到角色，NO_REF返回None"""
+    if ref == NO_REF:
+        return None
+    team = battle_state.enemy_team if ref & ENEMY_REF_FLAG else battle_state.player_team
+    return team.characters[ref & ~ENEMY_REF_FLAG]
+
+def _team_code(battle_state, team):
+    if team is None:
+        return 0
+    return 1 if team is battle_state.player_team else 2
+
+def _effect_signature(character):
+    """状态效果的 ID -> 层数"""
+    return {effect.id: effect.stacks for effect in character.status_effects}
+
+def create_effect_definition(effect_id):
+    """按ID重建状态效果定义，用于在镜像状态上显示；未知ID只保留ID作为名称"""
+    factory = getattr(status_effects, f"create_{effect_id}", None)
+    if factory is not None:
+        definition = factory()
+        if definition.id == effect_id:
+            return definition
+    return StatusEffectDefinition(effect_id, effect_id)
+
+
+class StateTracker:
+    """跟踪一场战斗的状态变化，每次collect返回与上一次之间的差异
+
+    脏标记保存在角色和队伍上，同一份战斗状态只能有一个跟踪器。
+    """
+    def __init__(self, battle_state):
+        self.battle_state = battle_state
+        self.refs = character_refs(battle_state)
+        self.battle_fields = None
+        self.effects = {}       # 角色 -> 上次发送的状态效果
+        self.cooldowns = {}     # 角色 -> 上次发送的冷却
+        self.keyframe()
+
+    def _battle_values(self):
+        battle_state = self.battle_state
+        current = battle_state.current_character
+        actor = next((ref for ref, character in self.refs if character is current), NO_REF)
+
+        # 查克拉只在队伍被标记为脏时重新读取
+        previous = self.battle_fields
+        chakra = []
+        for index, team in ((4, battle_state.player_team), (5, battle_state.enemy_team)):
+            chakra.append(int(team.shared_chakra) if previous is None or team.chakra_dirty else previous[index])
+            team.chakra_dirty = False
+
+        return (
+            battle_state.turn_count,
+            PHASES.index(battle_state.phase),
+            _team_code(battle_state, battle_state.current_team),
+            actor,
+            chakra[0],
+            chakra[1],
+            int(battle_state.is_battle_over),
+        )
+
+    def keyframe(self):
+        """完整状态，同时重置跟踪基准"""
+        for _, character in self.refs:
+            character.dirty = DIRTY_HP | DIRTY_EFFECTS | DIRTY_COOLDOWNS
+        self.battle_fields = None
+        self.effects = {}
+        self.cooldowns = {}
+        return self._encode(DELTA_KEYFRAME)
+
+    def collect(self):
+        """自上次collect或keyframe以来的差异，没有变化时返回EMPTY_DIFF"""
+        return self._encode(DELTA_DIFF)
+
+    def _encode(self, kind):
+        out = bytearray((kind, 0))
+
+        # 战斗字段：只有几个标量，直接与上次的值比较
+        values = self._battle_values()
+        mask = 0
+        for bit, (value, fmt) in enumerate(zip(values, _BATTLE_FIELD_FORMATS)):
+            if self.battle_fields is None or self.battle_fields[bit] != value:
+                mask |= 1 << bit
+                out += fmt.pack(value)
+        out[1] = mask
+        self.battle_fields = values
+
+        # 角色记录：只检查有脏标记的角色
+        count_offset = len(out)
+        out.append(0)
+        count = 0
+        for ref, character in self.refs:
+            if not character.dirty:
+                continue
+            record = self._encode_character(character, kind)
+            character.dirty = 0
+            if record is None:
+                continue
+            out.append(ref)
+            out += record
+            count += 1
+        out[count_offset] = count
+        return bytes(out)
+
+    def _encode_character(self, character, kind):
+        flags = character.dirty
+        mask = 0
+        out = bytearray(1)
+
+        if flags & DIRTY_HP:
+            hp = character.current_hp
+            if isinstance(hp, int):
+                mask |= FIELD_HP_INT
+                out += _I32.pack(hp)
+            else:
+                mask |= FIELD_HP_FLOAT
+                out += _F64.pack(hp)
+            mask |= FIELD_ALIVE
+            out.append(int(character.is_alive))
+
+        if flags & DIRTY_COOLDOWNS:
+            cooldowns = tuple(skill.current_cooldown for skill in character.skills)
+            if cooldowns != self.cooldowns.get(character):
+                mask |= FIELD_COOLDOWNS
+                out.append(len(cooldowns))
+                out += bytes(cooldowns)
+                self.cooldowns[character] = cooldowns
+
+        if flags & DIRTY_EFFECTS:
+            signature = _effect_signature(character)
+            previous = {} if kind == DELTA_KEYFRAME else self.effects.get(character, {})
+            changes = [(effect_id, stacks) for effect_id, stacks in signature.items() if previous.get(effect_id) != stacks]
+            changes.extend((effect_id, 0) for effect_id in previous if effect_id not in signature)
+            if changes or kind == DELTA_KEYFRAME:
+                mask |= FIELD_EFFECTS
+                out.append(len(changes))
+                for effect_id, stacks in changes:
+                    encoded = effect_id.encode("utf-8")
+                    out.append(min(stacks, 255))
+                    out.append(len(encoded))
+                    out += encoded
+            self.effects[character] = signature
+
+        if not mask:
+            return None
+        out[0] = mask
+        return out
+
+
+def is_empty_delta(data):
+    """差异是否没有任何变化"""
+    return data[0] == DELTA_DIFF and data[1] == 0 and data[2] == 0
+
+def apply_state_delta(battle_state, data):
+    """把差异或关键帧应用到battle_state上，返回有变化的角色列表
+
+    只写入显示所需的状态，不触发状态效果的施加和移除逻辑。
+    """
+    data = memoryview(data)
+    kind, mask = data[0], data[1]
+    offset = 2
+
+    values = []
+    for bit, fmt in enumerate(_BATTLE_FIELD_FORMATS):
+        if mask & (1 << bit):
+            values.append(fmt.unpack_from(data, offset)[0])
+            offset += fmt.size
+        else:
+            values.append(None)
+    turn, phase, team, actor, player_chakra, enemy_chakra, over = values
+    if turn is not None:
+        battle_state.turn_count = turn
+    if phase is not None:
+        battle_state.phase = PHASES[phase]
+    if team is not None:
+        battle_state.current_team = (None, battle_state.player_team, battle_state.enemy_team)[team]
+    if actor is not None:
+        battle_state.current_character = character_from_ref(battle_state, actor)
+    if player_chakra is not None:
+        battle_state.player_team.shared_chakra = player_chakra
+    if enemy_chakra is not None:
+        battle_state.enemy_team.shared_chakra = enemy_chakra
+    if over is not None:
+        battle_state.is_battle_over = bool(over)
+
+    changed = []
+    count = data[offset]
+    offset += 1
+    for _ in range(count):
+        character = character_from_ref(battle_state, data[offset])
+        field_mask = data[offset + 1]
+        offset += 2
+
+        if field_mask & FIELD_HP_INT:
+            character.current_hp = _I32.unpack_from(data, offset)[0]
+            offset += _I32.size
+        elif field_mask & FIELD_HP_FLOAT:
+            character.current_hp = _F64.unpack_from(data, offset)[0]
+            offset += _F64.size
+        if field_mask & FIELD_ALIVE:
+            character.is_alive = bool(data[offset])
+            offset += 1
+
+        if field_mask & FIELD_COOLDOWNS:
+            skill_count = data[offset]
+            for skill, cooldown in zip(character.skills, data[offset + 1:offset + 1 + skill_count]):
+                skill.current_cooldown = cooldown
+            offset += 1 + skill_count
+
+        if field_mask & FIELD_EFFECTS:
+            effect_count = data[offset]
+            offset += 1
+            if kind == DELTA_KEYFRAME:
+                character.status_effects = []
+            for _ in range(effect_count):
+                stacks, length = data[offset], data[offset + 1]
+                effect_id = bytes(data[offset + 2:offset + 2 + length]).decode("utf-8")
+                offset += 2 + length
+                existing = next((effect for effect in character.status_effects if effect.id == effect_id), None)
+                if stacks == 0:
+                    if existing:
+                        character.status_effects.remove(existing)
+                elif existing:
+                    existing.stacks = stacks
+                else:
+                    definition = create_effect_definition(effect_id)
+                    character.status_effects.append(
+                        ActiveStatusEffect(definition, None, character, battle_state.turn_count, stacks))
+
+        changed.append(character)
+    return changed
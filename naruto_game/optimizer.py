@@ -0,0 +1,177 @@
+"""
+阵容优化模块：针对固定对手，用遗传算法和局部搜索寻找最佳阵容与手位
+"""
+import os
+import sys
+import random
+import argparse
+import multiprocessing
+from naruto_game.config import MAX_TEAM_SIZE, MAX_BATTLE_TURNS
+from naruto_game.models.character import ROSTER
+from naruto_game.simulation import AI_POLICIES
+from naruto_game.tournament import lineup_key, play_pairing
+
+
+class LineupOptimizer:
+    """阵容优化器：以模拟战斗胜率作为适应度"""
+    def __init__(self, pool_ids, opponent, team_size=MAX_TEAM_SIZE, games=20, policy="default",
+                 workers=None, seed=0, max_turns=MAX_BATTLE_TURNS):
+        self.pool_ids = list(pool_ids)                  # 可选忍者
+        self.opponent = lineup_key(opponent)            # 固定对手阵容
+        self.team_size = team_size                      # 每队人数
+        self.games = games                              # 每个候选阵容的模拟场次
+        self.policy = policy                            # AI策略
+        self.workers = workers or os.cpu_count() or 1   # 并行进程数
+        self.seed = seed                                # 随机种子
+        self.max_turns = max_turns                      # 单场战斗的回合上限
+        self.rng = random.Random(seed)                  # 搜索用的随机数，与战斗随机数分开
+        self.fitness_cache = {}                         # 阵容 -> 胜率
+        self.process_pool = None
+
+    def evaluate(self, candidates):
+        """评估一批候选阵容，已评估过的直接读取缓存"""
+        keys = [lineup_key(candidate) for candidate in candidates]
+        pending = list(dict.fromkeys(key for key in keys if key not in self.fitness_cache))
+        tasks = [
+            (key, self.opponent, self.games, self.policy, self.seed, self.max_turns, False)
+            for key in pending
+        ]
+
+        if self.process_pool and len(tasks) > 1:
+            records = self.process_pool.map(play_pairing, tasks)
+        else:
+            records = map(play_pairing, tasks)
+
+        for record in records:
+            self.fitness_cache[record["a"]] = (record["wins_a"] + 0.5 * record["draws"]) / self.games
+
+        return [self.fitness_cache[key] for key in keys]
+
+    def random_lineup(self):
+        """随机生成一个阵容"""
+        return self.rng.sample(self.pool_ids, self.team_size)
+
+    def crossover(self, parent_a, parent_b):
+        """顺序交叉：保留父代A的前半段手位，其余按父代B的顺序补齐"""
+        cut = self.rng.randint(1, self.team_size - 1) if self.team_size > 1 else 1
+        child = parent_a[:cut]
+        for char_id in parent_b + self.pool_ids:
+            if len(child) == self.team_size:
+                break
+            if char_id not in child:
+                child.append(char_id)
+        return child
+
+    def mutate(self, lineup):
+        """变异：交换两个手位，或用未上阵的忍者替换一名成员"""
+        lineup = list(lineup)
+        bench = [char_id for char_id in self.pool_ids if char_id not in lineup]
+        if bench and (self.team_size < 2 or self.rng.random() < 0.5):
+            lineup[self.rng.randrange(self.team_size)] = self.rng.choice(bench)
+        elif self.team_size > 1:
+            i, j = self.rng.sample(range(self.team_size), 2)
+            lineup[i], lineup[j] = lineup[j], lineup[i]
+        return lineup
+
+    def neighbours(self, lineup):
+        """局部搜索的邻域：所有手位交换和单人替换"""
+        result = []
+        for i in range(self.team_size):
+            for j in range(i + 1, self.team_size):
+                swapped = list(lineup)
+                swapped[i], swapped[j] = swapped[j], swapped[i]
+                result.append(swapped)
+            for char_id in self.pool_ids:
+                if char_id not in lineup:
+                    replaced = list(lineup)
+                    replaced[i] = char_id
+                    result.append(replaced)
+        return result
+
+    def genetic_search(self, population_size, generations, mutation_rate=0.3):
+        """遗传算法：锦标赛选择 + 精英保留"""
+        population = [self.random_lineup() for _ in range(population_size)]
+        for generation in range(generations):
+            scores = self.evaluate(population)
+            ranked = [lineup for _, lineup in sorted(zip(scores, population), key=lambda item: -item[0])]
+            print(f"第 {generation + 1} 代: 最佳 {lineup_key(ranked[0])} 胜率 {max(scores):.2f}")
+
+            next_population = ranked[:max(1, population_size // 10)]
+            while len(next_population) < population_size:
+                parent_a = max(self.rng.sample(ranked, min(3, len(ranked))), key=lambda c: self.fitness_cache[lineup_key(c)])
+                parent_b = max(self.rng.sample(ranked, min(3, len(ranked))), key=lambda c: self.fitness_cache[lineup_key(c)])
+                child = self.crossover(parent_a, parent_b)
+                if self.rng.random() < mutation_rate:
+                    child = self.mutate(child)
+                next_population.append(child)
+            population = next_population
+
+        scores = self.evaluate(population)
+        return max(zip(scores, population), key=lambda item: item[0])[1]
+
+    def local_search(self, lineup):
+        """爬山法：每次移动到邻域中胜率最高的阵容，直到无法改进"""
+        best = list(lineup)
+        best_score = self.evaluate([best])[0]
+        while True:
+            candidates = self.neighbours(best)
+            scores = self.evaluate(candidates)
+            score, candidate = max(zip(scores, candidates), key=lambda item: item[0])
+            if score <= best_score:
+                return best, best_score
+            best, best_score = candidate, score
+
+    def optimize(self, population_size=24, generations=10):
+        """运行完整的优化流程，返回(最佳阵容, 胜率)"""
+        if self.workers > 1:
+            self.process_pool = multiprocessing.Pool(self.workers)
+        try:
+            best = self.genetic_search(population_size, generations)
+            return self.local_search(best)
+        finally:
+            if self.process_pool:
+                self.process_pool.terminate()
+                self.process_pool.join()
+                self.process_pool = None
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="火影忍者OL战斗原型 - 阵容优化")
+    parser.add_argument("--pool", default=",".join(ROSTER), help="可选忍者ID，用逗号分隔 (默认: 全部角色)")
+    parser.add_argument("--opponent", required=True, help="对手阵容，按手位顺序用逗号分隔")
+    parser.add_argument("--team-size", type=int, default=MAX_TEAM_SIZE, help="每队人数")
+    parser.add_argument("--games", type=int, default=20, help="每个候选阵容的模拟场次")
+    parser.add_argument("--population", type=int, default=24, help="种群大小")
+    parser.add_argument("--generations", type=int, default=10, help="迭代代数")
+    parser.add_argument("--policy", choices=sorted(AI_POLICIES), default="default", help="AI策略")
+    parser.add_argument("--workers", type=int, default=None, help="并行进程数 (默认: CPU核数)")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    args = parser.parse_args(argv)
+
+    pool_ids = [char_id.strip() for char_id in args.pool.split(",") if char_id.strip()]
+    opponent = [char_id.strip() for char_id in args.opponent.split(",") if char_id.strip()]
+    unknown = [char_id for char_id in pool_ids + opponent if char_id not in ROSTER]
+    if unknown:
+        parser.error(f"未知的角色ID: {', '.join(unknown)}")
+    if not 1 <= args.team_size <= min(MAX_TEAM_SIZE, len(pool_ids)):
+        parser.error("每队人数必须在1到可选忍者数之间，且不超过4人")
+
+    optimizer = LineupOptimizer(
+        pool_ids,
+        opponent,
+        team_size=args.team_size,
+        games=args.games,
+        policy=args.policy,
+        workers=args.workers,
+        seed=args.seed,
+    )
+    best, score = optimizer.optimize(args.population, args.generations)
+
+    print(f"最佳阵容: {lineup_key(best)} (手位1-{len(best)})，胜率 {score:.2f}")
+    print(f"共评估 {len(optimizer.fitness_cache)} 个阵容")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
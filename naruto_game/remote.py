@@ -0,0 +1,187 @@
+"""
+远程战斗模块：界面客户端一侧的服务器连接，以及由增量推送维护的本地镜像状态
+
+客户端不运行战斗核心。本地的BattleState只用来给战斗场景提供显示所需的数据，
+收到的二进制状态差异由apply_state_delta只改写其中变化的字段。
+"""
+import sys
+import json
+import socket
+import argparse
+from naruto_game.config import AI_ACTION_DELAY
+from naruto_game.models.battle import BattleState
+from naruto_game.models.character import create_team_from_lineup
+from naruto_game.models.state_delta import apply_state_delta
+from naruto_game.server import (
+    LocalServerThread, encode_event, decode_state, resolve_character, team_sides, is_player_turn, battle_winner,
+)
+
+TEAM7_LINEUP = ["naruto", "sasuke", "sakura", "kakashi"]
+TEAM10_LINEUP = ["shikamaru", "choji", "ino"]
+
+RECV_SIZE = 65536
+
+
+class BattleClient:
+    """非阻塞的行协议连接，由界面主循环每个逻辑步轮询一次"""
+    def __init__(self, host, port, timeout=5.0):
+        self.sock = socket.create_connection((host, port), timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.setblocking(False)
+        self.incoming = bytearray()
+        self.outgoing = bytearray()
+        self.closed = False
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def send(self, message):
+        """发送一个请求，发不完的部分留到下次轮询"""
+        self.outgoing += encode_event(message)
+        self._flush()
+
+    def _flush(self):
+        while self.outgoing and not self.closed:
+            try:
+                sent = self.sock.send(self.outgoing)
+            except BlockingIOError:
+                return
+            except OSError:
+                self.closed = True
+                return
+            del self.outgoing[:sent]
+            self.bytes_sent += sent
+
+    def poll(self):
+        """读取已到达的数据，返回完整的事件列表，不会阻塞"""
+        self._flush()
+        while not self.closed:
+            try:
+                data = self.sock.recv(RECV_SIZE)
+            except BlockingIOError:
+                break
+            except OSError:
+                self.closed = True
+                break
+            if not data:
+                self.closed = True
+                break
+            self.incoming += data
+            self.bytes_received += len(data)
+
+        events = []
+        end = self.incoming.find(b"\n")
+        start = 0
+        while end != -1:
+            events.append(json.loads(self.incoming[start:end]))
+            start = end + 1
+            end = self.incoming.find(b"\n", start)
+        del self.incoming[:start]
+        return events
+
+    def close(self):
+        """关闭连接"""
+        self.closed = True
+        self.sock.close()
+
+
+class RemoteBattle:
+    """服务器上一场战斗在客户端的镜像"""
+    def __init__(self, player_lineup, enemy_lineup):
+        self.player_lineup = list(player_lineup)
+        self.enemy_lineup = list(enemy_lineup)
+        player_team = create_team_from_lineup("player", self.player_lineup)
+        enemy_team = create_team_from_lineup("enemy", self.enemy_lineup)
+        self.battle_state = BattleState(player_team, enemy_team)
+        self.battle_id = None
+
+    def create_request(self, policy="default", seed=None):
+        """创建这场战斗的请求"""
+        return {"op": "create", "player": self.player_lineup, "enemy": self.enemy_lineup,
+                "policy": policy, "seed": seed}
+
+    def apply_event(self, event):
+        """应用一个服务器事件，返回新增的日志"""
+        kind = event["event"]
+        if kind == "created":
+            for key, info in event["roster"].items():
+                if resolve_character(self.battle_state, key).id != info["id"]:
+                    raise ValueError(f"服务器上的阵容与本地不一致: {key}")
+            self.battle_id = event["battle"]
+            data = event["keyframe"]
+        elif kind == "state" and event["battle"] == self.battle_id:
+            data = event["keyframe"]
+        elif kind == "delta" and event["battle"] == self.battle_id:
+            data = event["diff"]
+        else:
+            return []
+
+        apply_state_delta(self.battle_state, decode_state(data))
+        log = event.get("log", [])
+        self.battle_state.battle_log.extend(log)
+        return log
+
+    def act_request(self, skill, target):
+        """当前角色使用技能的请求"""
+        battle_state = self.battle_state
+        character = battle_state.current_character
+        targets = [] if target is None else [
+            f"{side}:{team.characters.index(target)}"
+            for side, team in team_sides(battle_state) if target in team.characters
+        ]
+        return {"op": "act", "battle": self.battle_id, "skill": character.skills.index(skill), "targets": targets}
+
+    @property
+    def is_waiting(self):
+        """服务器是否在等待我方行动"""
+        return self.battle_id is not None and is_player_turn(self.battle_state)
+
+    @property
+    def winner(self):
+        """胜方，战斗未结束或平局时为None"""
+        return battle_winner(self.battle_state) if self.battle_state.is_battle_over else None
+
+
+def parse_address(text):
+    """解析 '主机:端口'"""
+    host, _, port = text.rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"无效的地址: {text}")
+    return host, int(port)
+
+
+def main(argv=None):
+    """命令行入口：以联网模式进行一场第七班对第十班的战斗"""
+    parser = argparse.ArgumentParser(description="火影忍者OL战斗原型 - 联网战斗客户端")
+    parser.add_argument("--connect", default=None, help="服务器地址(主机:端口)，不指定时在本进程内启动本地服务器")
+    parser.add_argument("--ai-delay", type=float, default=AI_ACTION_DELAY, help="本地服务器的敌方行动间隔(秒)")
+    parser.add_argument("--seed", type=int, default=None, help="战斗随机种子")
+    args = parser.parse_args(argv)
+
+    # 避免循环导入：scenes导入了本模块
+    from naruto_game.scenes import Game, RemoteBattleScene
+
+    local_server = None
+    if args.connect:
+        try:
+            host, port = parse_address(args.connect)
+        except ValueError as e:
+            parser.error(str(e))
+    else:
+        local_server = LocalServerThread(ai_delay=args.ai_delay)
+        host, port = local_server.start()
+        print(f"本地服务器监听于 {host}:{port}")
+
+    client = BattleClient(host, port)
+    game = Game()
+    try:
+        game.run(RemoteBattleScene(game, client, seed=args.seed))
+    finally:
+        print(f"已发送 {client.bytes_sent} 字节，已接收 {client.bytes_received} 字节")
+        client.close()
+        if local_server:
+            local_server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""
+离屏渲染模块：在无显示器的环境下，通过BattleScene原有的渲染流程把一场战斗逐帧导出为PNG序列或原始帧数据
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import contextlib
+import pygame
+from naruto_game.config import SCREEN_WIDTH, SCREEN_HEIGHT, UPDATE_RATE, MAX_BATTLE_TURNS
+from naruto_game.replay import Replay
+from naruto_game.replay_archive import ReplayArchive
+
+FRAME_FORMATS = ("png", "raw")  # png: 每帧一个PNG文件；raw: 所有帧的RGB24数据连续写入一个文件
+
+
+class FrameExporter:
+    """离屏帧导出器：按固定的模拟时间步进战斗场景，不受帧率上限约束"""
+    def __init__(self, output_dir, size=(SCREEN_WIDTH, SCREEN_HEIGHT), fps=30, frame_format="png"):
+        # 没有显示器时使用SDL的dummy驱动，必须在初始化pygame之前设置
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+        pygame.init()
+
+        self.output_dir = output_dir        # 输出目录
+        self.size = tuple(size)             # 输出分辨率
+        self.fps = fps                      # 输出帧率
+        self.frame_format = frame_format    # 'png' | 'raw'
+        self.frame_count = 0
+
+        # 场景始终按原生分辨率渲染到同一块画布上，脏矩形渲染因此可以跨帧复用像素
+        self.screen = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+        if self.size == self.screen.get_size():
+            self.frame = self.screen
+        else:
+            self.frame = pygame.Surface(self.size)
+
+        self.raw_file = None
+        self.last_png_path = None
+        self.last_raw_frame = None
+
+    def render_battle(self, seed=None, auto_play=True, max_frames=None, tail_seconds=1.0, max_turns=MAX_BATTLE_TURNS,
+                      replay=None):
+        """渲染一场战斗，返回导出的帧数
+
+        指定seed时战斗过程可复现；指定replay时按回放记录的决策重现录制的战斗，
+        使用回放自己的阵容、种子、AI策略和回合上限，忽略seed、auto_play和max_turns。
+        战斗结束后再渲染tail_seconds秒的结算画面。
+        """
+        # 避免循环导入：scenes在导入时会加载UI模块
+        from naruto_game.scenes import BattleScene, ReplayBattleScene
+
+        if replay is not None:
+            max_turns = replay.max_turns
+        elif seed is not None:
+            random.seed(seed)
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        if self.frame_format == "raw":
+            self.raw_file = open(os.path.join(self.output_dir, "frames.rgb"), "wb")
+
+        # 场景会把调试信息打印到标准输出，导出时将其丢弃
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            if replay is not None:
+                scene = ReplayBattleScene(self, replay)
+            else:
+                scene = BattleScene(self)
+                scene.auto_play = auto_play
+
+            steps_per_frame = UPDATE_RATE / self.fps
+            accumulator = 0.0
+            tail_frames = int(tail_seconds * self.fps)
+            try:
+                while max_frames is None or self.frame_count < max_frames:
+                    if scene.battle_state.is_battle_over or scene.battle_state.turn_count > max_turns:
+                        if tail_frames <= 0:
+                            break
+                        tail_frames -= 1
+
+                    accumulator += steps_per_frame
+                    while accumulator >= 1:
+                        scene.update()
+                        accumulator -= 1
+                    scene.interpolation = accumulator
+
+                    dirty_rects = scene.render(self.screen)
+                    self._write_frame(dirty_rects)
+            finally:
+                if self.raw_file:
+                    self.raw_file.close()
+                    self.raw_file = None
+
+        return self.frame_count
+
+    def _write_frame(self, dirty_rects):
+        """写出当前画面；画面没有变化时直接复用上一帧的数据，不再缩放和编码"""
+        unchanged = dirty_rects is not None and not dirty_rects
+        if not unchanged and self.frame is not self.screen:
+            pygame.transform.smoothscale(self.screen, self.size, self.frame)
+
+        if self.frame_format == "png":
+            path = os.path.join(self.output_dir, f"frame_{self.frame_count:06d}.png")
+            if unchanged and self.last_png_path:
+                shutil.copyfile(self.last_png_path, path)
+            else:
+                pygame.image.save(self.frame, path)
+            self.last_png_path = path
+        else:
+            if not unchanged or self.last_raw_frame is None:
+                self.last_raw_frame = pygame.image.tobytes(self.frame, "RGB")
+            self.raw_file.write(self.last_raw_frame)
+
+        self.frame_count += 1
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="火影忍者OL战斗原型 - 离屏渲染战斗画面")
+    parser.add_argument("--output", default="render_frames", help="输出目录")
+    parser.add_argument("--width", type=int, default=SCREEN_WIDTH, help="输出宽度")
+    parser.add_argument("--height", type=int, default=SCREEN_HEIGHT, help="输出高度")
+    parser.add_argument("--fps", type=int, default=30, help="输出帧率")
+    parser.add_argument("--format", choices=FRAME_FORMATS, default="png", help="输出格式")
+    parser.add_argument("--seed", type=int, default=0, help="战斗随机种子")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--replay", default=None, help="渲染回放文件中的战斗，代替按种子进行的托管战斗")
+    source.add_argument("--archive", default=None, help="渲染回放归档中的一场战斗，需要同时指定--index")
+    parser.add_argument("--index", type=int, default=None, help="归档中的战斗序号")
+    parser.add_argument("--max-frames", type=int, default=None, help="最多导出的帧数")
+    args = parser.parse_args(argv)
+
+    if args.width <= 0 or args.height <= 0 or args.fps <= 0:
+        parser.error("分辨率和帧率必须为正数")
+    if (args.archive is None) != (args.index is None):
+        parser.error("--archive和--index必须一起使用")
+
+    replay = None
+    source = args.replay or args.archive
+    if source:
+        try:
+            if args.replay:
+                replay = Replay.load(args.replay)
+            else:
+                with ReplayArchive(args.archive) as archive:
+                    replay = archive[args.index]
+        except (OSError, ValueError, IndexError) as e:
+            print(f"{source}: 无法读取 ({e})")
+            return 1
+
+    exporter = FrameExporter(args.output, (args.width, args.height), args.fps, args.format)
+    start = time.perf_counter()
+    frames = exporter.render_battle(seed=args.seed, max_frames=args.max_frames, replay=replay)
+    elapsed = time.perf_counter() - start
+
+    battle_seconds = frames / args.fps
+    print(f"已导出 {frames} 帧到 {args.output} ({args.width}x{args.height}, {args.format})")
+    print(f"耗时 {elapsed:.1f} 秒，渲染速度 {frames / max(elapsed, 1e-9):.1f} 帧/秒，"
+          f"为实时的 {battle_seconds / max(elapsed, 1e-9):.1f} 倍")
+    if args.format == "raw":
+        print(f"原始帧格式: rgb24 {args.width}x{args.height} @ {args.fps}fps，"
+              f"可用 ffmpeg -f rawvideo -pix_fmt rgb24 -s {args.width}x{args.height} -r {args.fps} -i frames.rgb 转码")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,321 @@
+"""
+回放模块：以"阵容 + 随机种子 + 玩家方决策序列"的紧凑二进制格式记录战斗，并通过战斗核心重建整场战斗
+
+文件格式(小端)：
+    头部      魔数b"NRRP"、版本(u8)、回合上限(u16)、随机种子(u64)
+    字符串    AI策略、我方阵容、敌方阵容，均为长度(u8) + UTF-8
+    决策      决策数(u32)，每条为 技能序号(u8)、目标数(u8)、目标(u8 * 目标数)
+    校验      结束时战斗状态的摘要(16字节)
+
+目标字节的最高位表示所属队伍(0我方/1敌方)，低7位为角色在队伍中的序号。
+"""
+import sys
+import copy
+import struct
+import random
+import hashlib
+import argparse
+from naruto_game.config import MAX_BATTLE_TURNS
+from naruto_game.models.character import ROSTER
+from naruto_game.simulation import AI_POLICIES, simulate_battle, setup_battle, quiet_output
+from naruto_game.tournament import lineup_key, parse_lineup_key
+
+REPLAY_MAGIC = b"NRRP"
+REPLAY_VERSION = 1
+DIGEST_SIZE = 16
+ENEMY_TARGET_FLAG = 0x80
+KEYFRAME_INTERVAL = 10  # 回放跳转时每隔多少次决策保存一次关键帧
+
+_HEADER = struct.Struct("<4sBHQ")
+_COUNT = struct.Struct("<I")
+
+
+def state_digest(battle_state):
+    """战斗状态的摘要，用于校验回放结果，检测不同版本间战斗逻辑的偏差"""
+    parts = [f"{battle_state.turn_count}|{battle_state.is_battle_over}"]
+    for team in (battle_state.player_team, battle_state.enemy_team):
+        parts.append(f"{team.player_id}:{team.shared_chakra}")
+        for character in team.characters:
+            effects = ",".join(sorted(f"{effect.id}x{effect.stacks}/{effect.remaining_turns}"
+                                      for effect in character.status_effects))
+            cooldowns = ",".join(str(skill.current_cooldown) for skill in character.skills)
+            parts.append(f"{character.id}:{character.current_hp}:{character.is_alive}:{cooldowns}:{effects}")
+    return hashlib.blake2b("\n".join(parts).encode("utf-8"), digest_size=DIGEST_SIZE).digest()
+
+
+def encode_decision(battle_state, skill, targets):
+    """把一次决策编码为字节：技能在角色技能列表中的序号 + 各目标的队伍和序号"""
+    character = battle_state.current_character
+    data = bytearray((character.skills.index(skill), len(targets)))
+    for target in targets:
+        if target in battle_state.player_team.characters:
+            data.append(battle_state.player_team.characters.index(target))
+        else:
+            data.append(ENEMY_TARGET_FLAG | battle_state.enemy_team.characters.index(target))
+    return bytes(data)
+
+def decode_decision(battle_state, data, offset):
+    """从offset处解码一次决策，返回(技能, 目标列表, 新的offset)"""
+    skill_index, target_count = data[offset], data[offset + 1]
+    skill = battle_state.current_character.skills[skill_index]
+    targets = []
+    for target_byte in data[offset + 2:offset + 2 + target_count]:
+        team = battle_state.enemy_team if target_byte & ENEMY_TARGET_FLAG else battle_state.player_team
+        targets.append(team.characters[target_byte & ~ENEMY_TARGET_FLAG])
+    return skill, targets, offset + 2 + target_count
+
+
+class Replay:
+    """一场战斗的回放记录"""
+    def __init__(self, player_lineup, enemy_lineup, seed, policy="default", max_turns=MAX_BATTLE_TURNS,
+                 decisions=None, final_digest=b""):
+        self.player_lineup = list(player_lineup)  # 我方阵容，按手位排列的角色ID
+        self.enemy_lineup = list(enemy_lineup)    # 敌方阵容
+        self.seed = seed                          # 随机种子(64位无符号整数)
+        self.policy = policy                      # AI策略名称
+        self.max_turns = max_turns                # 回合上限
+        self.decisions = list(decisions or [])    # 我方每次行动的编码决策
+        self.final_digest = final_digest          # 结束时的状态摘要
+
+    def to_bytes(self):
+        """序列化为紧凑的二进制格式"""
+        out = bytearray(_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, self.max_turns, self.seed))
+        for text in (self.policy, lineup_key(self.player_lineup), lineup_key(self.enemy_lineup)):
+            encoded = text.encode("utf-8")
+            out.append(len(encoded))
+            out += encoded
+        out += _COUNT.pack(len(self.decisions))
+        for decision in self.decisions:
+            out += decision
+        out += self.final_digest
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """从二进制数据解析回放，格式不正确时抛出ValueError"""
+        data = memoryview(data)
+        try:
+            magic, version, max_turns, seed = _HEADER.unpack_from(data, 0)
+            if magic != REPLAY_MAGIC:
+                raise ValueError("不是回放文件")
+            if version != REPLAY_VERSION:
+                raise ValueError(f"不支持的回放版本: {version}")
+
+            offset = _HEADER.size
+            texts = []
+            for _ in range(3):
+                length = data[offset]
+                texts.append(bytes(data[offset + 1:offset + 1 + length]).decode("utf-8"))
+                offset += 1 + length
+            policy, player_key, enemy_key = texts
+
+            (count,) = _COUNT.unpack_from(data, offset)
+            offset += _COUNT.size
+            decisions = []
+            for _ in range(count):
+                end = offset + 2 + data[offset + 1]
+                decisions.append(bytes(data[offset:end]))
+                offset = end
+
+            final_digest = bytes(data[offset:offset + DIGEST_SIZE])
+            if len(final_digest) != DIGEST_SIZE:
+                raise ValueError("回放文件不完整")
+        except (struct.error, IndexError, UnicodeDecodeError) as e:
+            raise ValueError(f"回放文件已损坏: {e}")
+
+        return cls(parse_lineup_key(player_key), parse_lineup_key(enemy_key), seed, policy, max_turns,
+                   decisions, final_digest)
+
+    def save(self, path):
+        """写入文件，返回字节数"""
+        data = self.to_bytes()
+        with open(path, "wb") as f:
+            f.write(data)
+        return len(data)
+
+    @classmethod
+    def load(cls, path):
+        """从文件读取"""
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+def record_battle(player_lineup, enemy_lineup, seed=None, policy="default", max_turns=MAX_BATTLE_TURNS):
+    """由AI进行一场战斗并记录回放，返回(Replay, BattleResult)"""
+    if seed is None:
+        seed = random.getrandbits(64)
+    decisions = []
+
+    def record_action(battle_state):
+        # 决策时消耗的随机数在回放时不会重现，这里先保存再恢复随机数状态，
+        # 保证战斗核心使用的随机数序列只取决于种子和决策
+        rng_state = random.getstate()
+        skill, targets = battle_state.choose_ai_action()
+        random.setstate(rng_state)
+        if not skill or not targets:
+            return False
+        decisions.append(encode_decision(battle_state, skill, targets))
+        return battle_state.use_current_skill()
+
+    result = simulate_battle(player_lineup, enemy_lineup, policy, seed, max_turns, player_action=record_action)
+    replay = Replay(player_lineup, enemy_lineup, seed, policy, max_turns, decisions, state_digest(result.battle_state))
+    return replay, result
+
+def replay_battle(replay):
+    """按记录的决策重建整场战斗，返回BattleResult"""
+    data = b"".join(replay.decisions)
+    position = 0
+
+    def replay_action(battle_state):
+        nonlocal position
+        if position >= len(data):
+            return False
+        skill, targets, position = decode_decision(battle_state, data, position)
+        battle_state.select_skill(skill)
+        battle_state.select_targets(targets)
+        return battle_state.use_current_skill()
+
+    return simulate_battle(replay.player_lineup, replay.enemy_lineup, replay.policy, replay.seed, replay.max_turns,
+                           player_action=replay_action)
+
+def verify_replay(replay):
+    """重建战斗并比对结束状态的摘要，一致时返回True"""
+    result = replay_battle(replay)
+    return state_digest(result.battle_state) == replay.final_digest
+
+
+class ReplayCursor:
+    """可跳转的回放：逐次执行记录的决策，每隔keyframe_interval次决策保存一次关键帧
+
+    跳转时从不晚于目标位置的最近关键帧恢复，最多重新模拟keyframe_interval次决策。
+    一次决策包括我方的行动，以及战斗核心随后自动进行的敌方行动。
+    """
+    def __init__(self, replay, keyframe_interval=KEYFRAME_INTERVAL):
+        self.replay = replay
+        self.keyframe_interval = keyframe_interval
+        self.length = len(replay.decisions)     # 决策总数
+        self.keyframes = {}                     # 决策序号 -> (战斗状态副本, 随机数状态)
+
+        with quiet_output():
+            self.battle_state = setup_battle(replay.player_lineup, replay.enemy_lineup, replay.policy, replay.seed)
+        self.rng_state = random.getstate()      # 战斗核心使用的随机数状态，与其他代码隔开
+        self.position = 0                       # 已执行的决策数
+        self._save_keyframe()
+
+    def _save_keyframe(self):
+        self.keyframes[self.position] = (copy.deepcopy(self.battle_state), self.rng_state)
+
+    def step(self):
+        """执行下一次决策，已到末尾或战斗已结束时返回False"""
+        if self.position >= self.length or self.battle_state.is_battle_over:
+            return False
+
+        random.setstate(self.rng_state)
+        with quiet_output():
+            skill, targets, _ = decode_decision(self.battle_state, self.replay.decisions[self.position], 0)
+            self.battle_state.select_skill(skill)
+            self.battle_state.select_targets(targets)
+            self.battle_state.use_current_skill()
+        self.rng_state = random.getstate()
+
+        self.position += 1
+        if self.position % self.keyframe_interval == 0 and self.position not in self.keyframes:
+            self._save_keyframe()
+        return True
+
+    def seek(self, position):
+        """跳转到执行完position次决策时的状态，返回当前战斗状态"""
+        position = max(0, min(position, self.length))
+        keyframe = max(index for index in self.keyframes if index <= position)
+
+        # 目标在当前位置之前，或从关键帧出发比从当前位置出发更近时，先恢复关键帧
+        if position < self.position or keyframe > self.position:
+            state, rng_state = self.keyframes[keyframe]
+            self.battle_state = copy.deepcopy(state)
+            self.rng_state = rng_state
+            self.position = keyframe
+
+        while self.position < position and self.step():
+            pass
+        return self.battle_state
+
+    def is_finished(self):
+        """是否已执行完所有决策"""
+        return self.position >= self.length or self.battle_state.is_battle_over
+
+    def is_verified(self):
+        """执行完所有决策后，结束状态是否与记录的摘要一致"""
+        return self.is_finished() and state_digest(self.battle_state) == self.replay.final_digest
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="火影忍者OL战斗原型 - 战斗回放")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record", help="由AI进行一场战斗并记录回放")
+    record_parser.add_argument("--player", required=True, help="我方阵容，按手位顺序用逗号分隔")
+    record_parser.add_argument("--enemy", required=True, help="敌方阵容，按手位顺序用逗号分隔")
+    record_parser.add_argument("--seed", type=int, default=None, help="随机种子 (默认: 随机)")
+    record_parser.add_argument("--policy", choices=sorted(AI_POLICIES), default="default", help="AI策略")
+    record_parser.add_argument("--output", default="battle.nrp", help="回放文件")
+
+    verify_parser = subparsers.add_parser("verify", help="重建回放中的战斗并校验结果")
+    verify_parser.add_argument("files", nargs="+", help="回放文件")
+
+    view_parser = subparsers.add_parser("view", help="在回放场景中观看战斗")
+    view_parser.add_argument("file", help="回放文件，或与--index一起使用的归档文件")
+    view_parser.add_argument("--index", type=int, default=None, help="归档中的战斗序号")
+    args = parser.parse_args(argv)
+
+    if args.command == "view":
+        # 避免循环导入：场景模块依赖本模块
+        from naruto_game.scenes import Game, ReplayScene
+        from naruto_game.replay_archive import ReplayArchive
+        try:
+            if args.index is None:
+                replay = Replay.load(args.file)
+            else:
+                with ReplayArchive(args.file) as archive:
+                    replay = archive[args.index]
+        except (OSError, ValueError, IndexError) as e:
+            print(f"{args.file}: 无法读取 ({e})")
+            return 1
+        game = Game()
+        game.run(ReplayScene(game, replay))
+        return 0
+
+    if args.command == "record":
+        player = [char_id.strip() for char_id in args.player.split(",") if char_id.strip()]
+        enemy = [char_id.strip() for char_id in args.enemy.split(",") if char_id.strip()]
+        unknown = [char_id for char_id in player + enemy if char_id not in ROSTER]
+        if unknown:
+            parser.error(f"未知的角色ID: {', '.join(unknown)}")
+        if args.seed is not None and not 0 <= args.seed < 2 ** 64:
+            parser.error("随机种子必须是64位无符号整数")
+
+        replay, result = record_battle(player, enemy, args.seed, args.policy)
+        size = replay.save(args.output)
+        log_size = len("\n".join(map(str, result.battle_state.battle_log)).encode("utf-8"))
+        print(f"回放已写入: {args.output} ({size} 字节，{len(replay.decisions)} 次决策，种子 {replay.seed})")
+        print(f"胜方: {result.winner or '平局'}，回合数: {result.turn_count}，文字战斗日志 {log_size} 字节")
+        return 0
+
+    failed = 0
+    for path in args.files:
+        try:
+            replay = Replay.load(path)
+        except (OSError, ValueError) as e:
+            print(f"{path}: 无法读取 ({e})")
+            failed += 1
+            continue
+        if verify_replay(replay):
+            print(f"{path}: 校验通过")
+        else:
+            print(f"{path}: 校验失败，战斗结果与记录不一致")
+            failed += 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
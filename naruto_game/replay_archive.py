@@ -0,0 +1,311 @@
+"""
+回放归档模块：只追加写入的回放归档，读取端通过mmap按序号O(1)定位任意一场战斗
+
+归档由两个文件组成：
+    数据文件 <path>        头部(8字节) + 依次追加的回放数据(Replay.to_bytes)
+    索引文件 <path>.idx    头部 + 每场战斗一条固定长度的索引记录
+
+索引文件头部：魔数b"NRRI"、版本(u8)、记录长度(u8)、角色表长度(u16)、角色表(UTF-8，逗号分隔)
+索引记录(32字节)：数据偏移(u64)、数据长度(u32)、CRC32(u32)、胜方(u8)、回合数(u16)、
+                  我方阵容(4字节)、敌方阵容(4字节)，阵容中每个字节为角色在角色表中的序号，0xFF表示空位
+
+写入时先追加数据再追加索引，读取时忽略不完整的索引记录，因此写入中断不会破坏已有的记录。
+按阵容或胜负筛选只扫描索引文件，不需要解析回放数据。
+"""
+import os
+import sys
+import mmap
+import zlib
+import struct
+import random
+import argparse
+from collections import Counter
+from naruto_game.config import MAX_TEAM_SIZE
+from naruto_game.models.character import ROSTER
+from naruto_game.replay import Replay, record_battle
+from naruto_game.tournament import lineup_key
+
+DATA_MAGIC = b"NRRA"
+INDEX_MAGIC = b"NRRI"
+ARCHIVE_VERSION = 1
+EMPTY_SLOT = 0xFF
+
+WINNER_CODES = {None: 0, "player": 1, "enemy": 2}  # 胜方编码，0表示平局
+WINNER_NAMES = {code: name for name, code in WINNER_CODES.items()}
+
+_DATA_HEADER = struct.Struct("<4sB3x")
+_INDEX_HEADER = struct.Struct("<4sBBH")
+_ENTRY = struct.Struct("<QIIBH4s4s5x")
+
+
+class ArchiveEntry:
+    """一条索引记录"""
+    def __init__(self, index, offset, length, crc, winner, turn_count, player_lineup, enemy_lineup):
+        self.index = index                  # 序号
+        self.offset = offset                # 回放数据在数据文件中的偏移
+        self.length = length                # 回放数据长度
+        self.crc = crc                      # 回放数据的CRC32
+        self.winner = winner                # 'player' | 'enemy' | None(平局)
+        self.turn_count = turn_count        # 回合数
+        self.player_lineup = player_lineup  # 我方阵容
+        self.enemy_lineup = enemy_lineup    # 敌方阵容
+
+
+def _index_path(path):
+    return path + ".idx"
+
+
+class ReplayArchiveWriter:
+    """回放归档的追加写入端"""
+    def __init__(self, path, roster_ids=None):
+        self.path = path
+        index_path = _index_path(path)
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+
+        if is_new:
+            self.roster_ids = list(roster_ids or ROSTER)
+            with open(path, "wb") as f:
+                f.write(_DATA_HEADER.pack(DATA_MAGIC, ARCHIVE_VERSION))
+            roster_text = ",".join(self.roster_ids).encode("utf-8")
+            with open(index_path, "wb") as f:
+                f.write(_INDEX_HEADER.pack(INDEX_MAGIC, ARCHIVE_VERSION, _ENTRY.size, len(roster_text)))
+                f.write(roster_text)
+        else:
+            # 沿用已有归档的角色表，保证阵容编码一致
+            with open(index_path, "rb") as f:
+                self.roster_ids, _ = _read_index_header(f.read())
+            self._truncate_partial_entry(index_path)
+
+        self.roster_index = {char_id: i for i, char_id in enumerate(self.roster_ids)}
+        self.data_file = open(path, "ab")
+        self.index_file = open(index_path, "ab")
+
+    def _truncate_partial_entry(self, index_path):
+        """截掉上次写入中断时残留的半条索引记录"""
+        with open(index_path, "rb") as f:
+            _, entries_offset = _read_index_header(f.read())
+        size = os.path.getsize(index_path)
+        partial = (size - entries_offset) % _ENTRY.size
+        if partial:
+            with open(index_path, "r+b") as f:
+                f.truncate(size - partial)
+
+    def encode_lineup(self, lineup):
+        """把阵容编码为定长字节"""
+        if len(lineup) > MAX_TEAM_SIZE:
+            raise ValueError(f"阵容人数超过{MAX_TEAM_SIZE}人: {lineup_key(lineup)}")
+        try:
+            codes = [self.roster_index[char_id] for char_id in lineup]
+        except KeyError as e:
+            raise ValueError(f"角色不在归档的角色表中: {e}")
+        return bytes(codes + [EMPTY_SLOT] * (MAX_TEAM_SIZE - len(codes)))
+
+    def append(self, replay, winner, turn_count):
+        """追加一场战斗，返回其序号"""
+        payload = replay.to_bytes()
+        offset = self.data_file.seek(0, os.SEEK_END)
+        self.data_file.write(payload)
+        self.data_file.flush()
+
+        entry = _ENTRY.pack(
+            offset,
+            len(payload),
+            zlib.crc32(payload),
+            WINNER_CODES[winner],
+            turn_count,
+            self.encode_lineup(replay.player_lineup),
+            self.encode_lineup(replay.enemy_lineup),
+        )
+        index_offset = self.index_file.seek(0, os.SEEK_END)
+        self.index_file.write(entry)
+        self.index_file.flush()
+        return (index_offset - self._entries_offset()) // _ENTRY.size
+
+    def _entries_offset(self):
+        return _INDEX_HEADER.size + len(",".join(self.roster_ids).encode("utf-8"))
+
+    def close(self):
+        self.data_file.close()
+        self.index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _read_index_header(data):
+    """解析索引文件头部，返回(角色表, 第一条索引记录的偏移)"""
+    if len(data) < _INDEX_HEADER.size:
+        raise ValueError("索引文件不完整")
+    magic, version, entry_size, roster_length = _INDEX_HEADER.unpack_from(data, 0)
+    if magic != INDEX_MAGIC:
+        raise ValueError("不是回放归档的索引文件")
+    if version != ARCHIVE_VERSION or entry_size != _ENTRY.size:
+        raise ValueError(f"不支持的归档版本: {version}")
+    entries_offset = _INDEX_HEADER.size + roster_length
+    roster_text = bytes(data[_INDEX_HEADER.size:entries_offset]).decode("utf-8")
+    return roster_text.split(",") if roster_text else [], entries_offset
+
+
+class ReplayArchive:
+    """回放归档的读取端：数据和索引均通过mmap访问，不会整体读入内存"""
+    def __init__(self, path):
+        self.path = path
+        self._data_file = open(path, "rb")
+        self._index_file = open(_index_path(path), "rb")
+        self.data = mmap.mmap(self._data_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.index = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version = _DATA_HEADER.unpack_from(self.data, 0)
+        if magic != DATA_MAGIC or version != ARCHIVE_VERSION:
+            raise ValueError("不是回放归档文件")
+        self.roster_ids, self.entries_offset = _read_index_header(self.index)
+        self.roster_index = {char_id: i for i, char_id in enumerate(self.roster_ids)}
+
+        # 只计入完整且数据已写入的记录
+        count = (len(self.index) - self.entries_offset) // _ENTRY.size
+        while count and self._raw_entry(count - 1)[0] + self._raw_entry(count - 1)[1] > len(self.data):
+            count -= 1
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def _raw_entry(self, i):
+        return _ENTRY.unpack_from(self.index, self.entries_offset + i * _ENTRY.size)
+
+    def _decode_lineup(self, codes):
+        return [self.roster_ids[code] for code in codes if code != EMPTY_SLOT]
+
+    def entry(self, i):
+        """读取第i条索引记录，O(1)"""
+        if not 0 <= i < self.count:
+            raise IndexError(f"归档中没有第{i}条记录")
+        offset, length, crc, winner, turn_count, player_codes, enemy_codes = self._raw_entry(i)
+        return ArchiveEntry(i, offset, length, crc, WINNER_NAMES[winner], turn_count,
+                            self._decode_lineup(player_codes), self._decode_lineup(enemy_codes))
+
+    def payload(self, i, verify=False):
+        """第i场战斗的原始回放数据(memoryview，不复制)
+
+        视图直接指向映射的内存，用完后应调用release()，或写成 with archive.payload(i) as view: ...；
+        仍有未释放的视图时，close()只能把解除映射推迟到这些视图被回收之后。
+        """
+        if not 0 <= i < self.count:
+            raise IndexError(f"归档中没有第{i}条记录")
+        offset, length, crc = self._raw_entry(i)[:3]
+        view = memoryview(self.data)[offset:offset + length]
+        if verify and zlib.crc32(view) != crc:
+            # 异常的回溯会引用本帧，先释放视图，以免调用方随后无法关闭归档
+            view.release()
+            raise ValueError(f"第{i}条记录的数据已损坏")
+        return view
+
+    def __getitem__(self, i):
+        """读取并解析第i场战斗的回放"""
+        if i < 0:
+            i += self.count
+        with self.payload(i, verify=True) as view:
+            return Replay.from_bytes(view)
+
+    def __iter__(self):
+        """按顺序遍历所有索引记录"""
+        for i in range(self.count):
+            yield self.entry(i)
+
+    def filter(self, player_lineup=None, enemy_lineup=None, character=None, winner=None):
+        """按阵容或胜负筛选，只扫描索引，返回符合条件的序号列表
+
+        player_lineup/enemy_lineup需手位完全一致；character为任一方包含的角色ID；
+        winner为'player'、'enemy'或'draw'，None表示不限。
+        """
+        def encode(lineup):
+            codes = [self.roster_index.get(char_id, -1) for char_id in lineup]
+            return bytes(code if code >= 0 else 0xFE for code in codes) + bytes([EMPTY_SLOT] * (MAX_TEAM_SIZE - len(codes)))
+
+        player_codes = encode(player_lineup) if player_lineup is not None else None
+        enemy_codes = encode(enemy_lineup) if enemy_lineup is not None else None
+        character_code = self.roster_index.get(character, -1) if character is not None else None
+        winner_code = WINNER_CODES[None if winner == "draw" else winner] if winner is not None else None
+
+        entries = memoryview(self.index)[self.entries_offset:self.entries_offset + self.count * _ENTRY.size]
+        matches = []
+        for i, (_, _, _, entry_winner, _, entry_player, entry_enemy) in enumerate(_ENTRY.iter_unpack(entries)):
+            if winner_code is not None and entry_winner != winner_code:
+                continue
+            if player_codes is not None and entry_player != player_codes:
+                continue
+            if enemy_codes is not None and entry_enemy != enemy_codes:
+                continue
+            if character_code is not None and character_code not in entry_player and character_code not in entry_enemy:
+                continue
+            matches.append(i)
+        entries.release()
+        return matches
+
+    def close(self):
+        for mapping in (self.data, self.index):
+            try:
+                mapping.close()
+            except BufferError:
+                # 调用方仍持有payload返回的视图：不能立即解除映射，等视图和映射对象被回收时再解除
+                pass
+        self._data_file.close()
+        self._index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="火影忍者OL战斗原型 - 回放归档")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record", help="随机生成阵容进行AI对战，并把回放追加到归档")
+    record_parser.add_argument("archive", help="归档文件")
+    record_parser.add_argument("--battles", type=int, default=100, help="战斗场数")
+    record_parser.add_argument("--seed", type=int, default=0, help="生成阵容和战斗种子用的随机种子")
+
+    query_parser = subparsers.add_parser("query", help="按阵容或胜负筛选归档中的战斗")
+    query_parser.add_argument("archive", help="归档文件")
+    query_parser.add_argument("--player", default=None, help="我方阵容，按手位顺序用逗号分隔")
+    query_parser.add_argument("--enemy", default=None, help="敌方阵容，按手位顺序用逗号分隔")
+    query_parser.add_argument("--character", default=None, help="任一方包含的角色ID")
+    query_parser.add_argument("--winner", choices=["player", "enemy", "draw"], default=None, help="胜方")
+    query_parser.add_argument("--show", type=int, default=10, help="列出的记录数")
+    args = parser.parse_args(argv)
+
+    if args.command == "record":
+        rng = random.Random(args.seed)
+        roster_ids = list(ROSTER)
+        with ReplayArchiveWriter(args.archive) as writer:
+            for _ in range(args.battles):
+                player = rng.sample(roster_ids, MAX_TEAM_SIZE)
+                enemy = rng.sample(roster_ids, MAX_TEAM_SIZE)
+                replay, result = record_battle(player, enemy, seed=rng.getrandbits(64))
+                writer.append(replay, result.winner, result.turn_count)
+        print(f"已向 {args.archive} 追加 {args.battles} 场战斗")
+        return 0
+
+    def parse(text):
+        return [char_id.strip() for char_id in text.split(",") if char_id.strip()] if text else None
+
+    with ReplayArchive(args.archive) as archive:
+        matches = archive.filter(parse(args.player), parse(args.enemy), args.character, args.winner)
+        outcomes = Counter(WINNER_NAMES[archive._raw_entry(i)[3]] or "draw" for i in matches)
+        print(f"归档共 {len(archive)} 场，符合条件 {len(matches)} 场: {dict(outcomes)}")
+        for i in matches[:args.show]:
+            entry = archive.entry(i)
+            print(f"  #{i}: {lineup_key(entry.player_lineup)} vs {lineup_key(entry.enemy_lineup)} "
+                  f"胜方 {entry.winner or '平局'}，{entry.turn_count} 回合，{entry.length} 字节")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
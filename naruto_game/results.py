@@ -0,0 +1,449 @@
+"""
+战斗结果模块：把每场结束的战斗写入SQLite数据库，并提供常用的平衡性查询
+
+写入端ResultsSink只在调用线程中提取一条轻量的记录并放入队列，由后台线程攒批后在一个事务中写入，
+数据库使用WAL模式，模拟和服务器的线程不会因为磁盘而阻塞。
+
+表结构：
+    battles            每场战斗一行：时间、来源、AI策略、随机种子、双方阵容、胜方、回合数
+    battle_characters  每个参战角色一行：所属队伍、手位、角色ID、结果(1胜/0平/-1负)、
+                       结束时的生命值和存活状态、造成伤害、受到伤害、受到治疗，
+                       以及按类型的造成伤害、施加治疗、施加状态、追打次数和最长追打链
+battle_characters按(角色ID, 手位, 结果)建立索引，按忍者和手位统计胜率只需扫描索引。
+旧数据库打开时会补上后来增加的统计列，旧记录的这些列为0。
+"""
+import os
+import sys
+import time
+import queue
+import random
+import sqlite3
+import argparse
+import threading
+from naruto_game.config import MAX_TEAM_SIZE, RESULTS_BATCH_SIZE, RESULTS_FLUSH_INTERVAL
+from naruto_game.models.character import (
+    ROSTER, STAT_DAMAGE_PHYSICAL, STAT_DAMAGE_NINJUTSU, STAT_DAMAGE_FIRE, STAT_DAMAGE_POISON,
+    STAT_HEALING_DONE, STAT_STATUSES_APPLIED, STAT_CHASES, STAT_LONGEST_CHAIN,
+)
+from naruto_game.simulation import AI_POLICIES, simulate_battle
+from naruto_game.tournament import lineup_key
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS battles (
+    id INTEGER PRIMARY KEY,
+    recorded_at REAL NOT NULL,
+    source TEXT NOT NULL,
+    policy TEXT NOT NULL,
+    seed TEXT,
+    player_lineup TEXT NOT NULL,
+    enemy_lineup TEXT NOT NULL,
+    winner TEXT,
+    turns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS battle_characters (
+    battle_id INTEGER NOT NULL REFERENCES battles(id),
+    side TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    character_id TEXT NOT NULL,
+    result INTEGER NOT NULL,
+    final_hp REAL NOT NULL,
+    alive INTEGER NOT NULL,
+    damage_dealt REAL NOT NULL,
+    damage_taken REAL NOT NULL,
+    healing_received REAL NOT NULL,
+    damage_physical REAL NOT NULL DEFAULT 0,
+    damage_ninjutsu REAL NOT NULL DEFAULT 0,
+    damage_fire REAL NOT NULL DEFAULT 0,
+    damage_poison REAL NOT NULL DEFAULT 0,
+    healing_done REAL NOT NULL DEFAULT 0,
+    statuses_applied INTEGER NOT NULL DEFAULT 0,
+    chases INTEGER NOT NULL DEFAULT 0,
+    longest_chain INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_battle_characters_ninja ON battle_characters(character_id, position, result);
+CREATE INDEX IF NOT EXISTS idx_battles_lineups ON battles(player_lineup, enemy_lineup);
+"""
+
+# 后来增加的统计列：(列名, 类型, Character.combat_stats下标)，旧数据库打开时补上
+STAT_COLUMNS = (
+    ("damage_physical", "REAL", STAT_DAMAGE_PHYSICAL),
+    ("damage_ninjutsu", "REAL", STAT_DAMAGE_NINJUTSU),
+    ("damage_fire", "REAL", STAT_DAMAGE_FIRE),
+    ("damage_poison", "REAL", STAT_DAMAGE_POISON),
+    ("healing_done", "REAL", STAT_HEALING_DONE),
+    ("statuses_applied", "INTEGER", STAT_STATUSES_APPLIED),
+    ("chases", "INTEGER", STAT_CHASES),
+    ("longest_chain", "INTEGER", STAT_LONGEST_CHAIN),
+)
+
+BATTLE_COLUMNS = ("id", "recorded_at", "source", "policy", "seed", "player_lineup", "enemy_lineup", "winner", "turns")
+CHARACTER_COLUMNS = (
+    "battle_id", "side", "position", "character_id", "result", "final_hp", "alive",
+    "damage_dealt", "damage_taken", "healing_received",
+) + tuple(name for name, _, _ in STAT_COLUMNS)
+
+def _insert_sql(table, columns):
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+INSERT_BATTLE = _insert_sql("battles", BATTLE_COLUMNS)
+INSERT_CHARACTER = _insert_sql("battle_characters", CHARACTER_COLUMNS)
+
+_STOP = object()    # 队列中的结束标记
+
+
+def open_results(path):
+    """打开结果数据库，不存在时创建表和索引"""
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")   # WAL模式下只在检查点时同步，掉电最多丢失最近的事务
+    conn.executescript(SCHEMA)
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(battle_characters)")}
+    with conn:
+        for name, column_type, _ in STAT_COLUMNS:
+            if name not in existing:
+                conn.execute(f"ALTER TABLE battle_characters ADD COLUMN {name} {column_type} NOT NULL DEFAULT 0")
+    return conn
+
+def battle_record(battle_state, winner, seed=None, policy="default", source=""):
+    """从结束的战斗中提取一条记录：(战斗行, 角色行列表)，只包含可序列化的基本类型"""
+    battle_row = (
+        time.time(),
+        source,
+        policy,
+        None if seed is None else str(seed),
+        lineup_key(character.id for character in battle_state.player_team.characters),
+        lineup_key(character.id for character in battle_state.enemy_team.characters),
+        winner,
+        battle_state.turn_count,
+    )
+    character_rows = []
+    for side, team in (("player", battle_state.player_team), ("enemy", battle_state.enemy_team)):
+        result = 0 if winner is None else (1 if winner == side else -1)
+        for character in team.characters:
+            stats = character.combat_stats
+            character_rows.append((
+                side, character.position, character.id, result, character.current_hp, int(character.is_alive),
+                character.damage_dealt, character.damage_taken, character.healing_received,
+            ) + tuple(stats[index] for _, _, index in STAT_COLUMNS))
+    return battle_row, character_rows
+
+
+class ResultsSink:
+    """战斗结果的写入端：record只把记录放入队列，由后台线程批量写入"""
+    def __init__(self, path, batch_size=RESULTS_BATCH_SIZE, flush_interval=RESULTS_FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size            # 每个事务最多写入的战斗数
+        self.flush_interval = flush_interval    # 队列中有记录时最多等待多久再写入
+        self.queue = queue.SimpleQueue()
+        self.recorded = 0                       # 已放入队列的战斗数
+        self.written = 0                        # 已提交的战斗数
+        self.transactions = 0
+        self.rejected = 0                       # 格式有误、无法写入而被跳过的战斗数
+        self.error = None                       # 后台线程遇到的异常
+        self.closed = False                     # 后台线程已结束，不再接受记录
+        self.lock = threading.Lock()            # 保证放入的记录和flush事件要么被写入线程处理，要么在结束时被取出
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="results-writer", daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        if self.error:
+            raise self.error
+
+    def record(self, battle_state, winner, seed=None, policy="default", source=""):
+        """记录一场结束的战斗"""
+        self.put(battle_record(battle_state, winner, seed, policy, source))
+
+    def put(self, record):
+        """放入一条已由battle_record提取的记录，例如由工作进程返回的记录"""
+        with self.lock:
+            # 与flush相同，检查和放入之间后台线程不能结束，否则记录会留在队列里无人写入
+            if self.closed:
+                self._raise_closed()
+            self.queue.put(record)
+            self.recorded += 1
+
+    def flush(self):
+        """等待此前放入的记录全部提交；后台线程已出错或结束时抛出异常"""
+        done = threading.Event()
+        with self.lock:
+            if self.closed:
+                # 正常关闭后没有待写入的记录，直接返回
+                if self.error:
+                    raise self.error
+                return
+            self.queue.put(done)
+        done.wait()
+        if self.error:
+            raise self.error
+
+    def _raise_closed(self):
+        if self.error:
+            raise self.error
+        raise RuntimeError("结果写入线程已结束")
+
+    def close(self):
+        """写完队列中的记录后结束后台线程；后台线程出错时在这里抛出"""
+        if self.thread.is_alive():
+            self.queue.put(_STOP)
+            self.thread.join()
+        if self.error:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _run(self):
+        try:
+            conn = open_results(self.path)
+            self.next_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM battles").fetchone()[0]
+        except sqlite3.Error as e:
+            self.error = e
+            self.ready.set()
+            return
+        self.ready.set()
+
+        try:
+            stopping = False
+            while not stopping:
+                batch, waiters, stopping = self._collect()
+                try:
+                    if batch:
+                        self._write(conn, batch)
+                finally:
+                    # 写入失败时也要唤醒，flush会看到self.error
+                    for done in waiters:
+                        done.set()
+        except Exception as e:
+            self.error = e
+        finally:
+            conn.close()
+            # 出错后不再写入，唤醒仍在等待flush的调用方；此后的put和flush直接抛出异常
+            with self.lock:
+                self.closed = True
+            while not self.queue.empty():
+                item = self.queue.get()
+                if isinstance(item, threading.Event):
+                    item.set()
+
+    def _collect(self):
+        """从队列取出一批记录，返回(记录列表, 待唤醒的flush事件, 是否结束)"""
+        batch = []
+        waiters = []
+        item = self.queue.get()
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            if item is _STOP:
+                return batch, waiters, True
+            if isinstance(item, threading.Event):
+                # flush要求立即写入已有的记录
+                waiters.append(item)
+                return batch, waiters, False
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                return batch, waiters, False
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return batch, waiters, False
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    return batch, waiters, False
+
+    def _write(self, conn, batch):
+        try:
+            self._insert(conn, batch)
+        except sqlite3.OperationalError:
+            # 磁盘已满、数据库被锁定等，重试也无济于事
+            raise
+        except (sqlite3.Error, TypeError, ValueError):
+            # 某条记录格式有误，整批已回滚；逐条重新写入，只跳过有问题的记录
+            for record in batch:
+                try:
+                    self._insert(conn, [record])
+                except sqlite3.OperationalError:
+                    raise
+                except (sqlite3.Error, TypeError, ValueError):
+                    self.rejected += 1
+
+    def _insert(self, conn, batch):
+        """在一个事务中写入batch，失败时整体回滚，战斗ID不前进"""
+        battle_id = self.next_id
+        battle_rows = []
+        character_rows = []
+        for battle_row, rows in batch:
+            battle_id += 1
+            battle_rows.append((battle_id,) + tuple(battle_row))
+            character_rows.extend((battle_id,) + tuple(row) for row in rows)
+        with conn:
+            conn.executemany(INSERT_BATTLE, battle_rows)
+            conn.executemany(INSERT_CHARACTER, character_rows)
+        self.next_id = battle_id
+        self.written += len(batch)
+        self.transactions += 1
+
+
+def win_rates_by_ninja(conn, min_games=1):
+    """各忍者的出场数、胜平负和胜率，以及场均伤害和治疗，按胜率降序"""
+    return conn.execute("""
+        SELECT character_id, COUNT(*) AS games,
+               SUM(result = 1), SUM(result = 0), SUM(result = -1), AVG(result = 1) AS win_rate,
+               AVG(damage_dealt), AVG(damage_taken), AVG(healing_received)
+        FROM battle_characters
+        GROUP BY character_id
+        HAVING games >= ?
+        ORDER BY win_rate DESC, games DESC
+    """, (min_games,)).fetchall()
+
+def combat_stats_by_ninja(conn, min_games=1):
+    """各忍者的场均分类型伤害、施加治疗、施加状态、追打次数和最长追打链，按出场数降序"""
+    return conn.execute("""
+        SELECT character_id, COUNT(*) AS games,
+               AVG(damage_physical), AVG(damage_ninjutsu), AVG(damage_fire), AVG(damage_poison),
+               AVG(healing_done), AVG(statuses_applied), AVG(chases), MAX(longest_chain)
+        FROM battle_characters
+        GROUP BY character_id
+        HAVING games >= ?
+        ORDER BY games DESC, character_id
+    """, (min_games,)).fetchall()
+
+def win_rates_by_position(conn, character_id=None, min_games=1):
+    """按忍者和手位统计出场数与胜率，指定character_id时只统计该忍者"""
+    where = "WHERE character_id = ?" if character_id else ""
+    params = (character_id, min_games) if character_id else (min_games,)
+    return conn.execute(f"""
+        SELECT character_id, position, COUNT(*) AS games, AVG(result = 1) AS win_rate
+        FROM battle_characters
+        {where}
+        GROUP BY character_id, position
+        HAVING games >= ?
+        ORDER BY character_id, position
+    """, params).fetchall()
+
+def lineup_results(conn, player_lineup, enemy_lineup=None):
+    """某个我方阵容(可限定敌方阵容)的场次与胜平负"""
+    where = "player_lineup = ?" + (" AND enemy_lineup = ?" if enemy_lineup else "")
+    params = (player_lineup, enemy_lineup) if enemy_lineup else (player_lineup,)
+    return conn.execute(f"""
+        SELECT COUNT(*), SUM(winner = 'player'), SUM(winner IS NULL), SUM(winner = 'enemy'), AVG(turns)
+        FROM battles WHERE {where}
+    """, params).fetchone()
+
+
+def simulate_records(battles, roster_ids, team_size=MAX_TEAM_SIZE, policy="default", seed=0):
+    """随机阵容进行battles场AI对AI的战斗，逐场返回结果记录"""
+    rng = random.Random(seed)
+    for _ in range(battles):
+        player_lineup = rng.sample(roster_ids, team_size)
+        enemy_lineup = rng.sample(roster_ids, team_size)
+        battle_seed = rng.getrandbits(64)
+        result = simulate_battle(player_lineup, enemy_lineup, policy, battle_seed)
+        yield battle_record(result.battle_state, result.winner, battle_seed, policy, "simulate")
+
+def benchmark_sink(path, battles, sample_battles=200, batch_size=RESULTS_BATCH_SIZE):
+    """写入battles场战斗记录，测量调用方每次记录的开销和后台写入的吞吐
+
+    记录取自sample_battles场真实战斗并循环使用，模拟速度不影响测得的写入吞吐。
+    """
+    samples = list(simulate_records(sample_battles, list(ROSTER)))
+    with ResultsSink(path, batch_size=batch_size) as sink:
+        start = time.perf_counter()
+        for index in range(battles):
+            sink.put(samples[index % len(samples)])
+        enqueued = time.perf_counter() - start
+        sink.flush()
+        elapsed = time.perf_counter() - start
+    rows = sum(1 + len(samples[index % len(samples)][1]) for index in range(battles))
+    return {
+        "battles": battles,
+        "rows": rows,
+        "enqueue_us": enqueued / battles * 1e6,
+        "elapsed": elapsed,
+        "transactions": sink.transactions,
+    }
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="火影忍者OL战斗原型 - 战斗结果数据库")
+    parser.add_argument("--db", default="battle_results.db", help="结果数据库文件")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    simulate_parser = subparsers.add_parser("simulate", help="随机阵容进行AI对AI的战斗并记录结果")
+    simulate_parser.add_argument("--battles", type=int, default=1000, help="战斗场数")
+    simulate_parser.add_argument("--policy", choices=sorted(AI_POLICIES), default="default", help="AI策略")
+    simulate_parser.add_argument("--seed", type=int, default=0, help="随机种子")
+
+    query_parser = subparsers.add_parser("query", help="查询平衡性统计")
+    query_parser.add_argument("report", choices=["ninja", "stats", "position", "lineup"],
+                              help="按忍者、按忍者的战斗统计、按手位或按阵容")
+    query_parser.add_argument("--character", default=None, help="按手位统计时只看该忍者")
+    query_parser.add_argument("--lineup", default=None, help="按阵容查询时的我方阵容，如 naruto-sasuke-sakura-kakashi")
+    query_parser.add_argument("--enemy", default=None, help="按阵容查询时限定的敌方阵容")
+    query_parser.add_argument("--min-games", type=int, default=1, help="最少出场数")
+
+    bench_parser = subparsers.add_parser("bench", help="测量批量写入的吞吐")
+    bench_parser.add_argument("--battles", type=int, default=50000, help="写入的战斗数")
+    bench_parser.add_argument("--batch-size", type=int, default=RESULTS_BATCH_SIZE, help="每个事务最多写入的战斗数")
+    args = parser.parse_args(argv)
+
+    if args.command == "simulate":
+        with ResultsSink(args.db) as sink:
+            for record in simulate_records(args.battles, list(ROSTER), policy=args.policy, seed=args.seed):
+                sink.put(record)
+        print(f"已记录 {sink.written} 场战斗到 {args.db}")
+        if sink.rejected:
+            print(f"有 {sink.rejected} 场战斗的记录格式有误，已跳过")
+        return 0
+
+    if args.command == "bench":
+        if os.path.exists(args.db):
+            parser.error(f"基准测试需要新的数据库文件，{args.db} 已存在")
+        report = benchmark_sink(args.db, args.battles, batch_size=args.batch_size)
+        elapsed = max(report["elapsed"], 1e-9)
+        print(f"写入 {report['battles']} 场战斗 ({report['rows']} 行)，耗时 {elapsed:.2f} 秒，"
+              f"{report['battles'] / elapsed:.0f} 场/秒，{report['rows'] / elapsed:.0f} 行/秒，"
+              f"事务 {report['transactions']} 个；调用方每次记录 {report['enqueue_us']:.2f} 微秒")
+        return 0
+
+    if not os.path.exists(args.db):
+        parser.error(f"数据库不存在: {args.db}")
+    conn = open_results(args.db)
+    try:
+        if args.report == "ninja":
+            print("忍者            出场     胜     平     负    胜率   场均伤害  场均承伤  场均治疗")
+            for row in win_rates_by_ninja(conn, args.min_games):
+                character_id, games, wins, draws, losses, win_rate, dealt, taken, healed = row
+                print(f"{character_id:<14}{games:>6}{wins:>7}{draws:>7}{losses:>7}{win_rate:>8.1%}"
+                      f"{dealt:>10.0f}{taken:>10.0f}{healed:>10.0f}")
+        elif args.report == "stats":
+            print("忍者            出场    物理    忍术    灼烧    中毒    治疗  施加状态  追打  最长链")
+            for row in combat_stats_by_ninja(conn, args.min_games):
+                character_id, games, physical, ninjutsu, fire, poison, healing, statuses, chases, chain = row
+                print(f"{character_id:<14}{games:>6}{physical:>8.0f}{ninjutsu:>8.0f}{fire:>8.0f}{poison:>8.0f}"
+                      f"{healing:>8.0f}{statuses:>10.1f}{chases:>6.1f}{chain:>8}")
+        elif args.report == "position":
+            print("忍者            手位    出场    胜率")
+            for character_id, position, games, win_rate in win_rates_by_position(conn, args.character, args.min_games):
+                print(f"{character_id:<14}{position:>6}{games:>8}{win_rate:>8.1%}")
+        else:
+            if not args.lineup:
+                parser.error("按阵容查询需要指定--lineup")
+            games, wins, draws, losses, turns = lineup_results(conn, args.lineup, args.enemy)
+            if not games:
+                print("没有记录")
+            else:
+                print(f"{args.lineup}: {games} 场，胜{wins} 平{draws} 负{losses}，胜率 {wins / games:.1%}，"
+                      f"平均 {turns:.1f} 回合")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,31 +2,53 @@
 游戏场景模块：管理不同游戏场景和状态
 """
 import pygame
+import os
 import sys
+import time
 import random
 from naruto_game.config import *
-from naruto_game.utils.ui import Button, CharacterCard, MessageBox, SkillButton
-from naruto_game.utils.helpers import get_font, draw_text
-from naruto_game.models.character import create_team7, create_team10
+from naruto_game.utils.ui import Button, CharacterCard, MessageBox, SkillButton, Slider
+from naruto_game.utils.helpers import get_font, draw_text, render_text
+from naruto_game.utils.profiler import profiler
+from naruto_game.utils.timeline import Timeline
+from naruto_game.models.character import (
+    create_team7, create_team10, STAT_DAMAGE_PHYSICAL, STAT_DAMAGE_NINJUTSU, STAT_DAMAGE_FIRE,
+    STAT_DAMAGE_POISON, STAT_DAMAGE_TAKEN, STAT_HEALING_DONE, STAT_STATUSES_APPLIED, STAT_CHASES,
+    STAT_LONGEST_CHAIN,
+)
 from naruto_game.models.battle import BattleSystem
+from naruto_game.replay import ReplayCursor
+from naruto_game.remote import RemoteBattle, TEAM7_LINEUP, TEAM10_LINEUP
 
 class Scene:
     """场景基类"""
     def __init__(self, game):
         self.game = game
         self.next_scene = None
+        self.interpolation = 1.0  # 渲染时在上一逻辑步和当前逻辑步之间的插值比例(0~1)
     
     def handle_event(self, event):
         """处理事件"""
         pass
     
     def update(self):
-        """更新场景状态"""
+        """按固定步长更新场景状态，每次调用推进1/UPDATE_RATE秒"""
         pass
     
     def render(self, screen):
-        """渲染场景"""
+        """渲染场景
+
+        返回本帧需要刷新到显示器的矩形列表；返回None表示整屏刷新。
+        """
+        pass
+        
+    def invalidate(self):
+        """要求下一帧整屏重绘"""
         pass
+    
+    def needs_input(self):
+        """当前是否在等待玩家输入，极速快进在需要输入时停下"""
+        return True
         
     def switch_to_scene(self, scene_class, *args, **kwargs):
         """切换到新场景"""
@@ -70,13 +92,13 @@ class TitleScene(Scene):
         
         # 绘制主标题
         title_text = "火影忍者OL"
-        title_surface = self.title_font.render(title_text, True, (255, 150, 0))
+        title_surface = render_text(self.title_font, title_text, (255, 150, 0))
         title_rect = title_surface.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 4))
         screen.blit(title_surface, title_rect)
         
         # 绘制副标题
         subtitle_text = "战斗原型"
-        subtitle_surface = self.subtitle_font.render(subtitle_text, True, (200, 200, 200))
+        subtitle_surface = render_text(self.subtitle_font, subtitle_text, (200, 200, 200))
         subtitle_rect = subtitle_surface.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 4 + 80))
         screen.blit(subtitle_surface, subtitle_rect)
         
@@ -114,16 +136,30 @@ class TitleScene(Scene):
         sys.exit()
 
 
+# 战斗结束统计表的列：(表头, Character.combat_stats下标)
+SUMMARY_COLUMNS = (
+    ("物理", STAT_DAMAGE_PHYSICAL),
+    ("忍术", STAT_DAMAGE_NINJUTSU),
+    ("灼烧", STAT_DAMAGE_FIRE),
+    ("中毒", STAT_DAMAGE_POISON),
+    ("承伤", STAT_DAMAGE_TAKEN),
+    ("治疗", STAT_HEALING_DONE),
+    ("施加状态", STAT_STATUSES_APPLIED),
+    ("追打", STAT_CHASES),
+    ("最长链", STAT_LONGEST_CHAIN),
+)
+
 class BattleScene(Scene):
     """战斗场景"""
+    show_combat_summary = True  # 战斗结束时显示双方角色的战斗统计
+    
     def __init__(self, game):
         super().__init__(game)
         
         # 创建队伍和战斗系统
-        self.player_team = create_team7()
-        self.enemy_team = create_team10()
+        self.player_team, self.enemy_team = self._create_teams()
         self.battle_system = BattleSystem()
-        self.battle_state = self.battle_system.create_battle(self.player_team, self.enemy_team)
+        self.battle_state = None  # 在start_battle中创建
         
         # 设置角色位置
         self._setup_battle_positions()
@@ -148,9 +184,39 @@ class BattleScene(Scene):
         self.highlight_timer = 0
         self.highlight_max = 30  # 闪烁周期
         
+        # 脏矩形渲染：记录上一帧绘制时的状态，用于判断哪些区域需要重绘
+        self.needs_full_redraw = True
+        self.last_frame_state = None
+        self.last_highlight_visible = None
+        self.last_chakra = None
+        self.last_mouse_pos = None
+        self.sprite_states = {}
+        
+        # 分层缓存：静态背景、战场角色、界面元素和战斗结束时的半透明覆盖
+        self.background_layer = None
+        self.character_layer = None
+        self.ui_layer = None
+        self.overlay_layer = None
+        self.summary_surface = None  # 战斗结束统计表，结束后统计不再变化，只绘制一次
+        self.character_layer_key = None
+        self.ui_layer_key = None
+        
+        # 技能按钮对应的(角色, 回合)，避免每帧重建按钮
+        self.skill_buttons_key = None
+        self.synced_log_count = 0
+        
+        # 时间轴：AI行动间隔等定时事件，按逻辑步推进，不阻塞主循环
+        self.timeline = Timeline()
+        self.is_ai_acting = False  # 敌方行动后等待下一个角色期间为True
+        self.auto_play = False     # 为True时我方也由AI操作，用于AI对AI观战和测试
+        
         # 开始战斗
         self.start_battle()
     
+    def _create_teams(self):
+        """创建双方队伍"""
+        return create_team7(), create_team10()
+    
     def _setup_battle_positions(self):
         """设置战斗位置"""
         # 玩家队伍位置 - 在左侧排成一行
@@ -191,12 +257,16 @@ class BattleScene(Scene):
         for i, character in enumerate(self.player_team.characters):
             if i < len(player_positions):
                 character.battle_position = player_positions[i]
+                character.previous_position = player_positions[i]
+                character.render_position = player_positions[i]
                 character.target_position = player_positions[i]
         
         # 设置敌人角色位置
         for i, character in enumerate(self.enemy_team.characters):
             if i < len(enemy_positions):
                 character.battle_position = enemy_positions[i]
+                character.previous_position = enemy_positions[i]
+                character.render_position = enemy_positions[i]
                 character.target_position = enemy_positions[i]
     
     def _create_ui_elements(self):
@@ -269,6 +339,7 @@ class BattleScene(Scene):
             
         # 清空当前的技能按钮列表
         self.skill_buttons = []
+        self.skill_buttons_key = (current_character, self.battle_state.turn_count)
         
         # 如果角色没有技能属性，尝试处理
         if not hasattr(current_character, 'normal_attack') or not current_character.normal_attack:
@@ -429,15 +500,71 @@ class BattleScene(Scene):
             if self.battle_state.is_battle_over:
                 return
             
-            # 等待一会儿以便玩家可以看到AI的动作
-            pygame.time.wait(800)
-            
-            # 准备下一个角色的回合
-            self.prepare_next_turn()
+            # 停顿一会儿以便玩家可以看到AI的动作，之后再准备下一个角色的回合
+            self.is_ai_acting = True
+            self.timeline.schedule(AI_ACTION_DELAY, self._finish_ai_action)
         else:
             # 如果没有有效目标，直接准备下一个角色
             self.prepare_next_turn()
     
+    def _execute_auto_player_action(self):
+        """托管模式下由AI替我方当前角色选择技能和目标，走与玩家点击相同的流程"""
+        self.is_ai_acting = False
+        if not self.auto_play or not self.is_waiting_for_action or self.battle_state.is_battle_over:
+            return
+        
+        skill, targets = self.battle_state.choose_ai_action()
+        if not skill or not targets:
+            return
+        
+        self.selected_skill = skill
+        self.available_targets = self.battle_system.get_valid_targets(
+            self.battle_state,
+            self.battle_state.current_character,
+            skill
+        )
+        self.selected_target = targets[0]
+        self.battle_state.select_targets([self.selected_target])
+        self.battle_log.add_message(f"我方{self.battle_state.current_character.name}(托管)使用{skill.name}!")
+        self._on_use_skill_click()
+    
+    def set_auto_play(self, enabled):
+        """开启或关闭托管模式"""
+        self.auto_play = enabled
+        self.battle_log.add_message("托管模式已开启" if enabled else "托管模式已关闭")
+        if not enabled and self.is_ai_acting and self.is_waiting_for_action:
+            # 取消尚未执行的托管行动
+            self.timeline.clear()
+            self.is_ai_acting = False
+    
+    def skip_to_result(self, max_turns=MAX_BATTLE_TURNS):
+        """跳到战斗结果：开启托管并跳过所有停顿，不经过渲染直接推进到战斗结束"""
+        if not self.auto_play:
+            self.set_auto_play(True)
+        idle_steps = 0
+        while not self.battle_state.is_battle_over and self.battle_state.turn_count <= max_turns:
+            # 直接把时间轴推进到下一个事件，省去停顿
+            wait = self.timeline.time_until_next()
+            if wait:
+                self.timeline.advance(wait)
+            self.update()
+            
+            # 连续两步都没有待触发的事件，说明战斗无法继续推进
+            idle_steps = 0 if self.timeline.pending else idle_steps + 1
+            if idle_steps >= 2:
+                break
+        self.invalidate()
+    
+    def needs_input(self):
+        """等待玩家操作或战斗已结束时需要输入"""
+        return self.battle_state.is_battle_over or (self.is_waiting_for_action and not self.auto_play)
+    
+    def _finish_ai_action(self):
+        """敌方行动的停顿结束，准备下一个角色的回合"""
+        self.is_ai_acting = False
+        if not self.battle_state.is_battle_over:
+            self.prepare_next_turn()
+    
     def _check_battle_end(self):
         """检查战斗是否结束"""
         if not self.player_team.is_team_alive() or not self.enemy_team.is_team_alive():
@@ -464,6 +591,20 @@ class BattleScene(Scene):
         
         if hasattr(self, 'back_to_title_button'):
             self.back_to_title_button.update(chakra=None, mouse_pos=mouse_pos)
+        
+        # 鼠标滚轮滚动战斗日志
+        if event.type == pygame.MOUSEWHEEL and self.battle_log.rect.collidepoint(mouse_pos):
+            self.battle_log.scroll(event.y)
+            return
+        
+        # F6切换托管，F7跳到战斗结果
+        if event.type == pygame.KEYDOWN and not self.battle_state.is_battle_over:
+            if event.key == pygame.K_F6:
+                self.set_auto_play(not self.auto_play)
+                return
+            if event.key == pygame.K_F7:
+                self.skip_to_result()
+                return
             
         # 如果战斗已结束，只处理返回按钮
         if self.battle_state.is_battle_over:
@@ -567,10 +708,14 @@ class BattleScene(Scene):
         for card in self.enemy_cards:
             card.update()
         
-        # 更新战斗日志
-        for log in self.battle_state.battle_log[-8:]:  # 只显示最近的8条日志
-            if log not in self.battle_log.messages:
-                self.battle_log.add_message(log)
+        # 更新战斗日志：只追加上次同步之后产生的新日志
+        # 战斗核心的一条日志可能是多行组成的列表
+        new_logs = []
+        for log in self.battle_state.battle_log[self.synced_log_count:]:
+            new_logs.extend(log if isinstance(log, list) else [log])
+        for log in new_logs[-self.battle_log.max_messages:]:  # 只显示最近的8条日志
+            self.battle_log.add_message(log)
+        self.synced_log_count = len(self.battle_state.battle_log)
         
         # 检查是否是玩家回合
         self.is_player_turn = (
@@ -585,8 +730,9 @@ class BattleScene(Scene):
             self.battle_state.current_character is not None
         )
         
-        # 如果是玩家回合，更新技能按钮
-        if self.is_waiting_for_action and not self.selected_skill:
+        # 如果是玩家回合且行动角色变化，更新技能按钮
+        buttons_key = (self.battle_state.current_character, self.battle_state.turn_count)
+        if self.is_waiting_for_action and not self.selected_skill and self.skill_buttons_key != buttons_key:
             self._update_skill_buttons()
             print("已更新技能按钮")
             print(f"当前角色: {self.battle_state.current_character.name}")
@@ -601,6 +747,9 @@ class BattleScene(Scene):
         
         # 初始化战斗系统
         self.battle_state = self.battle_system.create_battle(self.player_team, self.enemy_team)
+        self.synced_log_count = 0
+        self.timeline.clear()
+        self.is_ai_acting = False
         
         # 添加初始消息
         self.battle_log.add_message("战斗开始！")
@@ -628,10 +777,13 @@ class BattleScene(Scene):
             self.is_waiting_for_action = False
     
     def update(self):
-        """更新场景状态"""
+        """按固定步长更新场景状态"""
         # 更新闪烁效果计时器
         self.highlight_timer = (self.highlight_timer + 1) % self.highlight_max
         
+        # 推进时间轴，触发到期的定时事件
+        self.timeline.advance(1.0 / UPDATE_RATE)
+        
         # 获取鼠标位置
         mouse_pos = pygame.mouse.get_pos()
         
@@ -650,16 +802,20 @@ class BattleScene(Scene):
         if self.battle_state.is_battle_over:
             return
         
-        # 如果不是玩家回合，执行AI行动
-        if not self.is_player_turn and not self.is_waiting_for_action:
+        # 托管模式下，停顿一会儿后由AI替我方行动
+        if self.auto_play and self.is_waiting_for_action and not self.is_ai_acting:
+            self.is_ai_acting = True
+            self.timeline.schedule(AI_ACTION_DELAY, self._execute_auto_player_action)
+        
+        # 如果不是玩家回合且没有正在停顿的AI行动，执行AI行动
+        if not self.is_player_turn and not self.is_waiting_for_action and not self.is_ai_acting:
             # 如果战斗未结束且有敌方角色待行动，开始AI行动
             if not self.battle_state.is_battle_over and self.battle_state.current_character in self.enemy_team.characters:
                 self._execute_ai_action()
         
-        # 更新角色移动
+        # 更新角色移动（未移动的角色也要记录上一步位置，供渲染插值）
         for character in self.player_team.characters + self.enemy_team.characters:
-            if character.is_moving:
-                character.move_towards_target()
+            character.move_towards_target()
         
         # 更新角色卡片
         for card in self.player_cards + self.enemy_cards:
@@ -670,52 +826,156 @@ class BattleScene(Scene):
         self._update_ui_from_battle_state()
     
     def render(self, screen):
-        """渲染场景"""
-        # 填充背景
-        screen.fill((30, 30, 50))  # 深蓝色背景
+        """渲染场景，只重绘状态发生变化的区域"""
+        # 角色在两个逻辑步之间按插值比例绘制，高刷新率下移动依然平滑
+        for character in self.player_team.characters + self.enemy_team.characters:
+            character.render_position = character.get_render_position(self.interpolation)
         
-        # 绘制战场
-        self._draw_battlefield(screen)
+        dirty_rects = self._collect_dirty_rects()
         
-        # 绘制角色
-        for character in self.player_team.characters + self.enemy_team.characters:
-            if character.is_alive:
-                # 缩放调整角色图像
-                char_size = 64
-                scaled_image = pygame.transform.scale(character.image, (char_size, char_size))
-                screen.blit(scaled_image, (character.battle_position[0] - char_size // 2, character.battle_position[1] - char_size // 2))
-                
-                # 绘制简单的生命条
-                hp_percent = character.current_hp / character.max_hp
-                hp_width = 50
-                hp_height = 5
-                hp_x = character.battle_position[0] - hp_width // 2
-                hp_y = character.battle_position[1] - char_size // 2 - 10
-                
-                # HP背景
-                pygame.draw.rect(screen, RED, (hp_x, hp_y, hp_width, hp_height))
-                # HP值
-                if hp_percent > 0:
-                    pygame.draw.rect(screen, GREEN, (hp_x, hp_y, int(hp_width * hp_percent), hp_height))
-                
-                # 显示角色名
-                font = get_font(16)
-                name_surface = font.render(character.name, True, WHITE)
-                name_rect = name_surface.get_rect(center=(character.battle_position[0], character.battle_position[1] - char_size // 2 - 20))
-                screen.blit(name_surface, name_rect)
+        if dirty_rects is None:
+            # 整屏重绘
+            self._render_frame(screen)
+        elif dirty_rects:
+            # 只在脏区域内重绘，区域外的像素保持上一帧的内容
+            screen.set_clip(dirty_rects[0].unionall(dirty_rects[1:]))
+            self._render_frame(screen)
+            screen.set_clip(None)
         
-        # 绘制角色卡片
+        self._clear_dirty_flags()
+        return dirty_rects
+    
+    def invalidate(self):
+        """要求下一帧整屏重绘"""
+        self.needs_full_redraw = True
+    
+    def _frame_state(self):
+        """影响整体布局的状态，任何一项变化都需要整屏重绘"""
+        return (
+            self.battle_state.phase,
+            self.battle_state.current_character,
+            self.battle_state.current_team,
+            self.battle_state.is_battle_over,
+            self.is_waiting_for_action,
+            self.selected_skill,
+            self.selected_target,
+            tuple(self.available_targets),
+            tuple(self.skill_buttons),
+            getattr(self, 'use_skill_button', None),
+        )
+    
+    def _sprite_rect(self, character):
+        """战场上角色图像、血条、名字和目标提示覆盖的区域"""
+        x, y = character.render_position
+        return pygame.Rect(x - 60, y - 60, 120, 120)
+    
+    def _button_area(self, button):
+        """按钮及其背景框、高亮框和提示箭头覆盖的区域"""
+        area = button.get_bounds().union(button.rect.inflate(24, 24))
+        area.union_ip(pygame.Rect(button.rect.centerx - 16, button.rect.y - 46, 32, 46))
+        return area
+    
+    def _highlight_rects(self):
+        """闪烁高亮元素所在的区域"""
+        rects = []
+        if not self.is_waiting_for_action:
+            return rects
+        if not self.selected_skill:
+            rects.extend(self._button_area(button) for button in self.skill_buttons)
+        elif not self.selected_target:
+            for character in self.available_targets:
+                rects.append(self._sprite_rect(character))
+                rects.extend(card.rect.inflate(12, 12) for card in self.player_cards + self.enemy_cards
+                             if card.character == character)
+        elif hasattr(self, 'use_skill_button'):
+            rects.append(self._button_area(self.use_skill_button))
+        return rects
+    
+    def _collect_dirty_rects(self):
+        """收集本帧的脏矩形，返回None表示需要整屏重绘"""
+        frame_state = self._frame_state()
+        if self.needs_full_redraw or frame_state != self.last_frame_state:
+            self.needs_full_redraw = False
+            self.last_frame_state = frame_state
+            self._snapshot_render_state()
+            return None
+        
+        dirty_rects = []
+        
+        # 角色卡片
         for card in self.player_cards + self.enemy_cards:
-            card.draw(screen)
+            if card.dirty:
+                dirty_rects.append(card.rect.inflate(12, 12))
         
-        # 绘制战斗日志
-        self.battle_log.draw(screen)
+        # 战斗日志
+        if self.battle_log.dirty:
+            dirty_rects.append(self.battle_log.rect.inflate(2, 2))
+        
+        # 按钮悬停
+        buttons = list(self.skill_buttons) + [self.back_to_title_button]
+        if hasattr(self, 'use_skill_button'):
+            buttons.append(self.use_skill_button)
+        for button in buttons:
+            if button.dirty:
+                dirty_rects.append(self._button_area(button))
         
-        # 绘制查克拉
-        self._draw_chakra_bars(screen)
+        # 战场上的角色：位置或生命值变化时，旧位置和新位置都需要重绘
+        for character in self.player_team.characters + self.enemy_team.characters:
+            sprite_state = (character.render_position, character.current_hp, character.is_alive)
+            old_state = self.sprite_states.get(character)
+            if sprite_state != old_state:
+                if old_state:
+                    old_x, old_y = old_state[0]
+                    dirty_rects.append(pygame.Rect(old_x - 60, old_y - 60, 120, 120))
+                dirty_rects.append(self._sprite_rect(character))
+                self.sprite_states[character] = sprite_state
+        
+        # 查克拉条
+        chakra = (self.player_team.shared_chakra, self.enemy_team.shared_chakra)
+        if chakra != self.last_chakra:
+            dirty_rects.append(pygame.Rect(40, 40, 220, 40))
+            dirty_rects.append(pygame.Rect(SCREEN_WIDTH - 260, 40, 220, 40))
+            self.last_chakra = chakra
+        
+        # 高亮闪烁
+        is_highlight_visible = self.highlight_timer < self.highlight_max / 2
+        if is_highlight_visible != self.last_highlight_visible:
+            dirty_rects.extend(self._highlight_rects())
+            self.last_highlight_visible = is_highlight_visible
+        
+        # 调试信息中的鼠标位置
+        mouse_pos = pygame.mouse.get_pos()
+        if mouse_pos != self.last_mouse_pos:
+            dirty_rects.append(pygame.Rect(0, 0, 420, 65))
+            self.last_mouse_pos = mouse_pos
         
-        # 绘制当前行动角色信息
-        self._draw_current_character_info(screen)
+        return dirty_rects
+    
+    def _snapshot_render_state(self):
+        """整屏重绘时记录各区域的当前状态"""
+        self.sprite_states = {
+            character: (character.render_position, character.current_hp, character.is_alive)
+            for character in self.player_team.characters + self.enemy_team.characters
+        }
+        self.last_chakra = (self.player_team.shared_chakra, self.enemy_team.shared_chakra)
+        self.last_highlight_visible = self.highlight_timer < self.highlight_max / 2
+        self.last_mouse_pos = pygame.mouse.get_pos()
+    
+    def _clear_dirty_flags(self):
+        """重绘完成后清除各控件的脏标记"""
+        for card in self.player_cards + self.enemy_cards:
+            card.dirty = False
+        self.battle_log.dirty = False
+        for button in self.skill_buttons:
+            button.dirty = False
+        self.back_to_title_button.dirty = False
+        if hasattr(self, 'use_skill_button'):
+            self.use_skill_button.dirty = False
+    
+    def _render_frame(self, screen):
+        """绘制完整的一帧：先合成缓存图层，再绘制逐帧变化的元素"""
+        self._update_layers(screen.get_size())
+        screen.blit(self.ui_layer, (0, 0))
         
         # 绘制调试信息
         self._draw_debug_info(screen)
@@ -732,7 +992,7 @@ class BattleScene(Scene):
             else:
                 guide_text = "点击绿色按钮确认使用技能"
                 
-            guide_surface = font.render(guide_text, True, YELLOW)
+            guide_surface = render_text(font, guide_text, YELLOW)
             guide_rect = guide_surface.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT - 150))
             screen.blit(guide_surface, guide_rect)
             
@@ -774,8 +1034,8 @@ class BattleScene(Scene):
                     if is_highlight_visible:
                         char_size = 70
                         highlight_rect = pygame.Rect(
-                            character.battle_position[0] - char_size // 2,
-                            character.battle_position[1] - char_size // 2,
+                            character.render_position[0] - char_size // 2,
+                            character.render_position[1] - char_size // 2,
                             char_size,
                             char_size
                         )
@@ -784,16 +1044,16 @@ class BattleScene(Scene):
                     # 添加"点击选择"提示
                     target_font = get_font(18)
                     target_text = "点击选择"
-                    target_surface = target_font.render(target_text, True, highlight_color)
-                    target_rect = target_surface.get_rect(center=(character.battle_position[0], character.battle_position[1] - 40))
+                    target_surface = render_text(target_font, target_text, highlight_color)
+                    target_rect = target_surface.get_rect(center=(character.render_position[0], character.render_position[1] - 40))
                     screen.blit(target_surface, target_rect)
                     
                     # 绘制指向目标的箭头
-                    arrow_y = character.battle_position[1] + 40
+                    arrow_y = character.render_position[1] + 40
                     arrow_points = [
-                        (character.battle_position[0], arrow_y),
-                        (character.battle_position[0] - 15, arrow_y + 15),
-                        (character.battle_position[0] + 15, arrow_y + 15)
+                        (character.render_position[0], arrow_y),
+                        (character.render_position[0] - 15, arrow_y + 15),
+                        (character.render_position[0] + 15, arrow_y + 15)
                     ]
                     pygame.draw.polygon(screen, highlight_color, arrow_points)
                     
@@ -830,21 +1090,144 @@ class BattleScene(Scene):
         
         # 如果战斗结束，绘制结果和返回按钮
         if self.battle_state.is_battle_over:
-            # 创建半透明覆盖
-            overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
-            overlay.fill((0, 0, 0, 128))
-            screen.blit(overlay, (0, 0))
+            # 半透明覆盖，复用缓存的覆盖层
+            screen.blit(self.overlay_layer, (0, 0))
             
-            # 绘制战斗结果文本
+            # 绘制战斗结果文本，有统计表时上移为表格留出位置
             result_text = "战斗胜利！" if not self.enemy_team.is_team_alive() else "战斗失败！"
             font = get_font(72, bold=True)
-            result_surface = font.render(result_text, True, WHITE)
-            result_rect = result_surface.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 - 100))
+            result_surface = render_text(font, result_text, WHITE)
+            result_y = SCREEN_HEIGHT * 0.2 if self.show_combat_summary else SCREEN_HEIGHT // 2 - 100
+            result_rect = result_surface.get_rect(center=(SCREEN_WIDTH // 2, result_y))
             screen.blit(result_surface, result_rect)
             
+            # 绘制双方角色的战斗统计
+            if self.show_combat_summary:
+                if self.summary_surface is None:
+                    self.summary_surface = self._create_summary_surface()
+                summary_rect = self.summary_surface.get_rect(midtop=(SCREEN_WIDTH // 2, result_rect.bottom + 20))
+                screen.blit(self.summary_surface, summary_rect)
+            
             # 绘制返回按钮
             self.back_to_title_button.draw(screen)
     
+    def _create_summary_surface(self):
+        """绘制战斗结束统计表：每个角色一行，各列为SUMMARY_COLUMNS中的计数器"""
+        font = get_font(24)
+        row_height = 36
+        name_width = 200
+        column_width = 110
+        characters = self.player_team.characters + self.enemy_team.characters
+        width = name_width + column_width * len(SUMMARY_COLUMNS) + 20
+        height = row_height * (len(characters) + 1) + 20
+        
+        surface = pygame.Surface((width, height), pygame.SRCALPHA)
+        surface.fill((20, 20, 40, 235))
+        
+        y = 10
+        for index, (title, _) in enumerate(SUMMARY_COLUMNS):
+            header = render_text(font, title, YELLOW)
+            surface.blit(header, header.get_rect(midtop=(10 + name_width + column_width * index + column_width // 2, y)))
+        
+        for character in characters:
+            y += row_height
+            color = (100, 180, 255) if character in self.player_team.characters else (255, 120, 120)
+            if not character.is_alive:
+                color = LIGHT_GREY
+            surface.blit(render_text(font, character.name, color), (10, y))
+            for index, (_, stat) in enumerate(SUMMARY_COLUMNS):
+                value = render_text(font, str(int(character.combat_stats[stat])), WHITE)
+                surface.blit(value, value.get_rect(midtop=(10 + name_width + column_width * index + column_width // 2, y)))
+        return surface
+    
+    def _create_layer(self, size, flags=0):
+        """创建与显示表面像素格式一致的图层"""
+        layer = pygame.Surface(size, flags)
+        if pygame.display.get_surface() is not None:
+            layer = layer.convert_alpha() if flags & pygame.SRCALPHA else layer.convert()
+        return layer
+    
+    def _update_layers(self, size):
+        """按需重建缓存图层
+
+        背景层只在尺寸变化时重建；角色层 = 背景层 + 战场角色，
+        界面层 = 角色层 + 卡片、日志、查克拉条和当前行动角色，
+        各自在对应状态变化时从下一层复制后重绘。
+        """
+        if self.background_layer is None or self.background_layer.get_size() != size:
+            self.background_layer = self._create_layer(size)
+            self.background_layer.fill((30, 30, 50))  # 深蓝色背景
+            self._draw_battlefield(self.background_layer)
+            
+            self.character_layer = self._create_layer(size)
+            self.ui_layer = self._create_layer(size)
+            self.overlay_layer = self._create_layer(size, pygame.SRCALPHA)
+            self.overlay_layer.fill((0, 0, 0, 128))
+            self.character_layer_key = None
+            self.ui_layer_key = None
+        
+        character_key = tuple(
+            (character.render_position, character.current_hp, character.is_alive)
+            for character in self.player_team.characters + self.enemy_team.characters
+        )
+        if character_key != self.character_layer_key:
+            self.character_layer.blit(self.background_layer, (0, 0))
+            self._draw_characters(self.character_layer)
+            self.character_layer_key = character_key
+            self.ui_layer_key = None
+        
+        ui_key = (
+            tuple((card.character.current_hp, card.is_hovered, card.selected) for card in self.player_cards + self.enemy_cards),
+            self.battle_log.version,
+            (self.player_team.shared_chakra, self.enemy_team.shared_chakra),
+            self.battle_state.current_character,
+            self.battle_state.current_team,
+        )
+        if ui_key != self.ui_layer_key:
+            self.ui_layer.blit(self.character_layer, (0, 0))
+            
+            # 绘制角色卡片
+            for card in self.player_cards + self.enemy_cards:
+                card.draw(self.ui_layer)
+            
+            # 绘制战斗日志
+            self.battle_log.draw(self.ui_layer)
+            
+            # 绘制查克拉
+            self._draw_chakra_bars(self.ui_layer)
+            
+            # 绘制当前行动角色信息
+            self._draw_current_character_info(self.ui_layer)
+            self.ui_layer_key = ui_key
+    
+    def _draw_characters(self, screen):
+        """绘制战场上的角色"""
+        for character in self.player_team.characters + self.enemy_team.characters:
+            if character.is_alive:
+                # 缩放调整角色图像
+                char_size = 64
+                scaled_image = character.get_portrait((char_size, char_size))
+                screen.blit(scaled_image, (character.render_position[0] - char_size // 2, character.render_position[1] - char_size // 2))
+                
+                # 绘制简单的生命条
+                hp_percent = character.current_hp / character.max_hp
+                hp_width = 50
+                hp_height = 5
+                hp_x = character.render_position[0] - hp_width // 2
+                hp_y = character.render_position[1] - char_size // 2 - 10
+                
+                # HP背景
+                pygame.draw.rect(screen, RED, (hp_x, hp_y, hp_width, hp_height))
+                # HP值
+                if hp_percent > 0:
+                    pygame.draw.rect(screen, GREEN, (hp_x, hp_y, int(hp_width * hp_percent), hp_height))
+                
+                # 显示角色名
+                font = get_font(16)
+                name_surface = render_text(font, character.name, WHITE)
+                name_rect = name_surface.get_rect(center=(character.render_position[0], character.render_position[1] - char_size // 2 - 20))
+                screen.blit(name_surface, name_rect)
+    
     def _draw_battlefield(self, screen):
         """绘制战场"""
         # 简单的地面
@@ -858,8 +1241,8 @@ class BattleScene(Scene):
         player_text = "第七班"
         enemy_text = "第十班"
         
-        player_surface = font.render(player_text, True, (100, 100, 255))
-        enemy_surface = font.render(enemy_text, True, (255, 100, 100))
+        player_surface = render_text(font, player_text, (100, 100, 255))
+        enemy_surface = render_text(font, enemy_text, (255, 100, 100))
         
         player_rect = player_surface.get_rect(center=(SCREEN_WIDTH // 4, 450))
         enemy_rect = enemy_surface.get_rect(center=(SCREEN_WIDTH * 3 // 4, 450))
@@ -887,7 +1270,7 @@ class BattleScene(Scene):
         # 显示数值
         font = get_font(24)
         chakra_text = f"查克拉: {self.player_team.shared_chakra}/{self.player_team.max_chakra}"
-        chakra_surface = font.render(chakra_text, True, WHITE)
+        chakra_surface = render_text(font, chakra_text, WHITE)
         chakra_rect = chakra_surface.get_rect(center=(chakra_x + chakra_width // 2, chakra_y + chakra_height // 2))
         screen.blit(chakra_surface, chakra_rect)
         
@@ -905,7 +1288,7 @@ class BattleScene(Scene):
         
         # 显示数值
         enemy_chakra_text = f"查克拉: {self.enemy_team.shared_chakra}/{self.enemy_team.max_chakra}"
-        enemy_chakra_surface = font.render(enemy_chakra_text, True, WHITE)
+        enemy_chakra_surface = render_text(font, enemy_chakra_text, WHITE)
         enemy_chakra_rect = enemy_chakra_surface.get_rect(center=(enemy_chakra_x + chakra_width // 2, chakra_y + chakra_height // 2))
         screen.blit(enemy_chakra_surface, enemy_chakra_rect)
     
@@ -921,7 +1304,7 @@ class BattleScene(Scene):
         text_color = GREEN if self.battle_state.current_team == self.player_team else RED
         
         info_text = f"当前行动: {self.battle_state.current_character.name}"
-        info_surface = font.render(info_text, True, text_color)
+        info_surface = render_text(font, info_text, text_color)
         info_rect = info_surface.get_rect(center=(SCREEN_WIDTH // 2, 20))
         screen.blit(info_surface, info_rect)
 
@@ -952,28 +1335,366 @@ class BattleScene(Scene):
         
         # 绘制鼠标位置信息
         mouse_pos = pygame.mouse.get_pos()
-        mouse_text = font.render(f"鼠标位置: {mouse_pos}", True, (255, 255, 255))
+        mouse_text = render_text(font, f"鼠标位置: {mouse_pos}", (255, 255, 255))
         screen.blit(mouse_text, (10, 10))
         
         # 绘制当前战斗状态
         state_text = f"战斗状态: {self.battle_state.phase}"
-        state_surface = font.render(state_text, True, (255, 255, 255))
+        state_surface = render_text(font, state_text, (255, 255, 255))
         screen.blit(state_surface, (10, 40))
         
         # 如果有技能按钮，显示它们的位置
         if self.skill_buttons and self.battle_state.phase == "CHARACTER_ACTION":
             for i, btn in enumerate(self.skill_buttons):
                 btn_text = f"按钮{i+1}: {btn.text} 位置:{btn.rect}"
-                btn_surface = font.render(btn_text, True, (255, 255, 0))
+                btn_surface = render_text(font, btn_text, (255, 255, 0))
                 screen.blit(btn_surface, (10, 70 + i * 25))
         
         # 如果正在确认技能，显示使用技能按钮位置
         if hasattr(self, 'use_skill_button') and self.selected_target:
             btn_text = f"使用技能按钮: {self.use_skill_button.rect}"
-            btn_surface = font.render(btn_text, True, (255, 255, 0))
+            btn_surface = render_text(font, btn_text, (255, 255, 0))
             screen.blit(btn_surface, (10, 70))
 
 
+class RemoteBattleScene(BattleScene):
+    """联网战斗场景：只负责显示和输入，战斗在服务器上进行
+
+    本地的战斗状态是服务器状态的镜像，由推送的增量更新。玩家选择的技能和目标发送给服务器，
+    敌方行动和托管行动也都由服务器执行。
+    """
+    # 战斗统计由服务器累计，镜像状态中没有，结束时不显示统计表
+    show_combat_summary = False
+    
+    def __init__(self, game, client, player_lineup=TEAM7_LINEUP, enemy_lineup=TEAM10_LINEUP, policy="default", seed=None):
+        self.client = client                                    # BattleClient
+        self.remote = RemoteBattle(player_lineup, enemy_lineup)
+        self.policy = policy
+        self.seed = seed
+        self.awaiting_server = True                             # 已发送请求，尚未收到服务器的回应
+        super().__init__(game)
+    
+    def _create_teams(self):
+        """使用镜像状态中的队伍，服务器推送的变化直接反映到卡片和战场上"""
+        return self.remote.battle_state.player_team, self.remote.battle_state.enemy_team
+    
+    def start_battle(self):
+        """请求服务器创建战斗"""
+        self.battle_log.clear()
+        self.battle_state = self.remote.battle_state
+        self.synced_log_count = 0
+        self.timeline.clear()
+        self.is_ai_acting = False
+        self.is_player_turn = False
+        self.is_waiting_for_action = False
+        self.awaiting_server = True
+        self.battle_log.add_message("正在连接对战服务器...")
+        self.client.send(self.remote.create_request(self.policy, self.seed))
+    
+    def _receive_events(self):
+        """应用服务器推送的事件"""
+        for event in self.client.poll():
+            if event["event"] == "error":
+                self.awaiting_server = False
+                self.battle_log.add_message(f"服务器拒绝了操作: {event['message']}")
+            elif event["event"] in ("created", "delta", "state"):
+                # 连接积压时服务器用完整状态(state)代替丢弃的差异，同样要应用才能与服务器重新同步
+                self.remote.apply_event(event)
+                self.awaiting_server = False
+        
+        if self.client.closed and not self.battle_state.is_battle_over:
+            self.battle_state.phase = "BATTLE_END"
+            self.battle_state.is_battle_over = True
+            self.battle_log.add_message("与服务器的连接已断开")
+    
+    def update(self):
+        """先应用服务器推送的变化，再按固定步长更新界面"""
+        self._receive_events()
+        super().update()
+    
+    def _update_ui_from_battle_state(self):
+        """以服务器的等待标记为准，请求发出后到回应到达前不接受新的操作"""
+        super()._update_ui_from_battle_state()
+        self.is_waiting_for_action = (
+            self.is_waiting_for_action and
+            self.remote.is_waiting and
+            not self.awaiting_server
+        )
+    
+    def _on_use_skill_click(self):
+        """把选择的技能和目标发送给服务器"""
+        if not self.selected_skill or not self.selected_target:
+            return
+        
+        self.client.send(self.remote.act_request(self.selected_skill, self.selected_target))
+        self.awaiting_server = True
+        self.is_waiting_for_action = False
+        
+        # 清除选择
+        self.selected_skill = None
+        self.selected_target = None
+        self.available_targets = []
+        if hasattr(self, 'use_skill_button'):
+            delattr(self, 'use_skill_button')
+    
+    def _execute_ai_action(self):
+        """敌方行动由服务器执行"""
+        pass
+    
+    def _execute_auto_player_action(self):
+        """托管模式下请求服务器代替我方行动"""
+        self.is_ai_acting = False
+        if not self.auto_play or not self.is_waiting_for_action or self.battle_state.is_battle_over:
+            return
+        
+        self.client.send({"op": "auto", "battle": self.remote.battle_id})
+        self.awaiting_server = True
+        self.is_waiting_for_action = False
+        self.battle_log.add_message(f"我方{self.battle_state.current_character.name}(托管)行动")
+    
+    def skip_to_result(self, max_turns=MAX_BATTLE_TURNS):
+        """联网战斗的节奏由服务器决定，无法跳过，改为开启托管"""
+        if not self.auto_play:
+            self.set_auto_play(True)
+
+
+class ReplayBattleScene(BattleScene):
+    """回放战斗场景：以战斗场景的画面播放一段回放，只负责显示，不接受操作
+
+    战斗状态由回放游标按记录的决策推进，敌方行动由战斗核心随后自动执行，
+    因此画面与录制时的战斗一致，不受场景自身的AI和全局random影响。
+    """
+    def __init__(self, game, replay):
+        self.cursor = ReplayCursor(replay)
+        super().__init__(game)
+    
+    def _create_teams(self):
+        """使用游标中的队伍，执行决策后的变化直接反映到卡片和战场上"""
+        return self.cursor.battle_state.player_team, self.cursor.battle_state.enemy_team
+    
+    def start_battle(self):
+        """战斗已由游标按回放的阵容、种子和AI策略开始"""
+        self.battle_log.clear()
+        self.battle_state = self.cursor.battle_state
+        self.synced_log_count = 0
+        self.timeline.clear()
+        self.is_ai_acting = False
+        self.is_player_turn = False
+        self.is_waiting_for_action = False
+        self.battle_log.add_message("战斗回放")
+    
+    def update(self):
+        """每隔AI_ACTION_DELAY执行一次记录的决策，再按固定步长更新界面"""
+        if not self.is_ai_acting and not self.battle_state.is_battle_over:
+            self.is_ai_acting = True
+            self.timeline.schedule(AI_ACTION_DELAY, self._play_next)
+        super().update()
+    
+    def _play_next(self):
+        """执行下一次决策；决策已用完而战斗未分胜负(达到回合上限)时按平局结束"""
+        self.is_ai_acting = False
+        if not self.cursor.step() and not self.battle_state.is_battle_over:
+            self.battle_state.phase = "BATTLE_END"
+            self.battle_state.is_battle_over = True
+            self.battle_log.add_message("回放结束")
+    
+    def _update_ui_from_battle_state(self):
+        """我方行动也来自回放，不显示技能按钮"""
+        super()._update_ui_from_battle_state()
+        self.is_waiting_for_action = False
+    
+    def _execute_ai_action(self):
+        """敌方行动由战斗核心在执行决策时完成"""
+        pass
+
+
+class ReplayScene(Scene):
+    """回放场景：播放、暂停，并可拖动时间轴跳转到任意一次决策"""
+    def __init__(self, game, replay):
+        super().__init__(game)
+        
+        # 回放游标：跳转时从最近的关键帧恢复，不必从头重新模拟
+        self.cursor = ReplayCursor(replay)
+        self.shown_state = None  # 卡片当前对应的战斗状态，跳转后战斗状态会被替换
+        
+        # 播放状态
+        self.playing = False
+        self.timeline = Timeline()
+        self.needs_redraw = True
+        self.bg_color = (30, 30, 50)
+        
+        # 战斗日志 - 屏幕中央
+        self.battle_log = MessageBox(
+            SCREEN_WIDTH * 0.2,
+            SCREEN_HEIGHT * 0.15,
+            SCREEN_WIDTH * 0.6,
+            SCREEN_HEIGHT * 0.45
+        )
+        
+        # 时间轴 - 角色卡片上方
+        self.slider = Slider(
+            SCREEN_WIDTH * 0.1,
+            SCREEN_HEIGHT * 0.68,
+            SCREEN_WIDTH * 0.8,
+            12,
+            self.cursor.length
+        )
+        
+        # 返回按钮 - 左上角
+        self.back_button = Button(
+            x=SCREEN_WIDTH * 0.02,
+            y=SCREEN_HEIGHT * 0.02,
+            width=SCREEN_WIDTH * 0.1,
+            height=SCREEN_HEIGHT * 0.06,
+            text="返回",
+            color=(100, 100, 100)
+        )
+        
+        self._sync_view()
+    
+    def _create_cards(self, battle_state):
+        """为当前战斗状态的角色创建卡片，双方各4人时也不重叠"""
+        card_width = SCREEN_WIDTH * 0.1
+        card_height = SCREEN_HEIGHT * 0.2
+        card_spacing = card_width * 0.15
+        start_y = SCREEN_HEIGHT - card_height - SCREEN_HEIGHT * 0.02
+        
+        start_x = SCREEN_WIDTH * 0.02
+        self.player_cards = [
+            CharacterCard(start_x + i * (card_width + card_spacing), start_y, card_width, card_height, character)
+            for i, character in enumerate(battle_state.player_team.characters)
+        ]
+        
+        enemy_characters = battle_state.enemy_team.characters
+        start_x = SCREEN_WIDTH - len(enemy_characters) * (card_width + card_spacing) + card_spacing - SCREEN_WIDTH * 0.02
+        self.enemy_cards = [
+            CharacterCard(start_x + i * (card_width + card_spacing), start_y, card_width, card_height, character)
+            for i, character in enumerate(enemy_characters)
+        ]
+    
+    def _sync_view(self):
+        """根据游标的当前位置更新卡片、时间轴和战斗日志"""
+        battle_state = self.cursor.battle_state
+        if battle_state is not self.shown_state:
+            self._create_cards(battle_state)
+            self.shown_state = battle_state
+        else:
+            for card in self.player_cards + self.enemy_cards:
+                card.update()
+        
+        self.slider.set_value(self.cursor.position)
+        
+        # 只显示最近的日志
+        recent_logs = []
+        for log in battle_state.battle_log[-30:]:
+            recent_logs.extend(log if isinstance(log, list) else [log])
+        self.battle_log.clear()
+        for log in recent_logs[-30:]:
+            self.battle_log.add_message(log)
+        
+        self.needs_redraw = True
+    
+    def _seek(self, position):
+        """跳转到指定的决策位置"""
+        self.cursor.seek(position)
+        self._sync_view()
+    
+    def _toggle_play(self):
+        """播放或暂停"""
+        self.playing = not self.playing
+        self.timeline.clear()
+        if self.playing:
+            if self.cursor.is_finished():
+                self._seek(0)
+            self.timeline.schedule(REPLAY_STEP_DELAY, self._play_next)
+        self.needs_redraw = True
+    
+    def _play_next(self):
+        """播放下一次决策"""
+        if not self.playing:
+            return
+        if self.cursor.step():
+            self._sync_view()
+            self.timeline.schedule(REPLAY_STEP_DELAY, self._play_next)
+        else:
+            self.playing = False
+            self.needs_redraw = True
+    
+    def handle_event(self, event):
+        """处理事件"""
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            if self.back_button.rect.collidepoint(event.pos):
+                self.switch_to_scene(TitleScene)
+                return
+        
+        # 拖动时间轴跳转
+        value = self.slider.handle_event(event)
+        if value is not None:
+            self._seek(value)
+            return
+        
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_SPACE:
+                self._toggle_play()
+            elif event.key == pygame.K_LEFT:
+                self._seek(self.cursor.position - 1)
+            elif event.key == pygame.K_RIGHT:
+                self._seek(self.cursor.position + 1)
+            elif event.key == pygame.K_HOME:
+                self._seek(0)
+            elif event.key == pygame.K_END:
+                self._seek(self.cursor.length)
+            elif event.key == pygame.K_ESCAPE:
+                self.switch_to_scene(TitleScene)
+    
+    def update(self):
+        """按固定步长更新场景状态"""
+        self.timeline.advance(1.0 / UPDATE_RATE)
+        self.back_button.update(mouse_pos=pygame.mouse.get_pos())
+    
+    def invalidate(self):
+        """要求下一帧整屏重绘"""
+        self.needs_redraw = True
+    
+    def render(self, screen):
+        """渲染场景，画面没有变化时不重绘"""
+        if not (self.needs_redraw or self.slider.dirty or self.back_button.dirty):
+            return []
+        
+        screen.fill(self.bg_color)
+        battle_state = self.cursor.battle_state
+        
+        # 标题和状态
+        status = "播放中" if self.playing else "已暂停"
+        if self.cursor.is_finished():
+            status = "已结束，校验通过" if self.cursor.is_verified() else "已结束，校验失败"
+        draw_text(screen, f"战斗回放 - 第{battle_state.turn_count}回合", get_font(40), YELLOW, SCREEN_WIDTH // 2, 30)
+        draw_text(screen, f"决策 {self.cursor.position}/{self.cursor.length}  {status}", get_font(24), WHITE, SCREEN_WIDTH // 2, 80)
+        
+        # 查克拉
+        draw_text(screen, f"我方查克拉: {battle_state.player_team.shared_chakra}", get_font(24), BLUE, SCREEN_WIDTH * 0.15, SCREEN_HEIGHT * 0.1)
+        draw_text(screen, f"敌方查克拉: {battle_state.enemy_team.shared_chakra}", get_font(24), RED, SCREEN_WIDTH * 0.85, SCREEN_HEIGHT * 0.1)
+        
+        # 战斗日志、时间轴和操作提示
+        self.battle_log.draw(screen)
+        self.slider.draw(screen)
+        draw_text(screen, "空格 播放/暂停   ←/→ 单步   Home/End 开头/结尾   拖动时间轴跳转   Esc 返回",
+                  get_font(20), LIGHT_GREY, SCREEN_WIDTH // 2, SCREEN_HEIGHT * 0.68 + 35)
+        
+        # 角色卡片
+        for card in self.player_cards + self.enemy_cards:
+            card.draw(screen)
+            card.dirty = False
+        
+        self.back_button.draw(screen)
+        
+        self.needs_redraw = False
+        self.slider.dirty = False
+        self.back_button.dirty = False
+        self.battle_log.dirty = False
+        return None
+
+
 class Game:
     """游戏主类"""
     def __init__(self):
@@ -982,32 +1703,121 @@ class Game:
         pygame.display.set_caption(GAME_TITLE)
         self.clock = pygame.time.Clock()
         self.current_scene = None
+        self.turbo_index = 0  # 当前快进倍速在TURBO_SPEEDS中的位置
     
-    def run(self):
-        """运行游戏主循环"""
-        self.current_scene = TitleScene(self)
-        
+    @property
+    def turbo(self):
+        """当前快进倍速，0表示极速"""
+        return TURBO_SPEEDS[self.turbo_index]
+    
+    def cycle_turbo(self):
+        """切换到下一档快进倍速"""
+        self.turbo_index = (self.turbo_index + 1) % len(TURBO_SPEEDS)
+        self.current_scene.invalidate()
+    
+    def step_scene(self):
+        """执行一次场景逻辑更新并处理场景切换，发生切换时返回True"""
+        self.current_scene.update()
+        if self.current_scene.next_scene:
+            self.current_scene = self.current_scene.next_scene
+            self.current_scene.next_scene = None
+            return True
+        return False
+    
+    def _draw_turbo_indicator(self):
+        """在屏幕右上角(敌方查克拉条上方的空白处)绘制快进倍速，返回绘制区域"""
+        label = "极速" if self.turbo == 0 else f"x{self.turbo}"
+        surface = render_text(get_font(24), f"快进 {label} (F5切换)", YELLOW)
+        rect = surface.get_rect(topright=(SCREEN_WIDTH - 10, 10))
+        self.screen.fill((0, 0, 0), rect)
+        self.screen.blit(surface, rect)
+        return rect
+    
+    def run(self, initial_scene=None):
+        """运行游戏主循环，默认从标题场景开始"""
+        self.current_scene = initial_scene or TitleScene(self)
+        
+        # 设置环境变量NARUTO_PROFILE=1时开启性能分析，游戏中按F3切换、F4导出trace
+        # F5切换快进倍速
+        if os.environ.get("NARUTO_PROFILE"):
+            profiler.enable()
+        trace_path = os.environ.get("NARUTO_TRACE", "naruto_trace.json")
+        
+        # 固定步长：逻辑按UPDATE_RATE推进，渲染帧率只影响每帧执行几次update
+        step = 1.0 / UPDATE_RATE
+        accumulator = 0.0
+        previous_time = time.perf_counter()
+        
+        skipped_render = False     # 极速模式跳过了渲染，恢复渲染时需要整屏重绘
         running = True
         while running:
+            frame_start = time.perf_counter()
+            accumulator += min(frame_start - previous_time, MAX_FRAME_TIME)
+            previous_time = frame_start
+            
             # 处理事件
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     running = False
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                    profiler.toggle()
+                    self.current_scene.invalidate()
+                    continue
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_F4:
+                    count = profiler.dump_trace(trace_path)
+                    print(f"已导出{count}条trace事件到{trace_path}")
+                    continue
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_F5:
+                    self.cycle_turbo()
+                    continue
                 self.current_scene.handle_event(event)
             
-            # 更新场景
-            self.current_scene.update()
+            if self.turbo == 0 and not self.current_scene.needs_input():
+                # 极速：在时间预算内尽可能多地推进逻辑，直到需要玩家输入
+                deadline = frame_start + TURBO_FRAME_BUDGET
+                while not self.current_scene.needs_input() and time.perf_counter() < deadline:
+                    if self.step_scene():
+                        break
+                accumulator = 0.0
+            
+            # 按固定步长更新场景，直到追上真实时间；快进时每步执行多次update
+            while accumulator >= step:
+                accumulator -= step
+                for _ in range(max(1, self.turbo)):
+                    if self.step_scene():
+                        break
             
-            # 检查场景切换
-            if self.current_scene.next_scene:
-                self.current_scene = self.current_scene.next_scene
-                self.current_scene.next_scene = None
+            if self.turbo == 0 and not self.current_scene.needs_input():
+                # 极速：需要玩家输入前不渲染也不刷新屏幕
+                skipped_render = True
+                self.clock.tick(FPS)
+                continue
+            if skipped_render:
+                skipped_render = False
+                self.current_scene.invalidate()
             
-            # 渲染场景
-            self.current_scene.render(self.screen)
+            # 渲染场景，只刷新场景报告的脏矩形
+            self.current_scene.interpolation = accumulator / step
+            dirty_rects = self.current_scene.render(self.screen)
+            if profiler.enabled:
+                overlay_rect = profiler.draw_overlay(self.screen, get_font(16))
+                if dirty_rects is not None:
+                    dirty_rects = dirty_rects + [overlay_rect]
+            if self.turbo != 1:
+                turbo_rect = self._draw_turbo_indicator()
+                if dirty_rects is not None:
+                    dirty_rects = dirty_rects + [turbo_rect]
+            if dirty_rects is None:
+                pygame.display.flip()
+            elif dirty_rects:
+                pygame.display.update(dirty_rects)
             
-            pygame.display.flip()
+            if profiler.enabled:
+                profiler.record("frame", frame_start, time.perf_counter())
             self.clock.tick(FPS)
         
+        if profiler.enabled and os.environ.get("NARUTO_TRACE"):
+            profiler.dump_trace(trace_path)
+        
         pygame.quit()
         sys.exit() 
\ No newline at end of file
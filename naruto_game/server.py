@@ -0,0 +1,942 @@
+"""
+对战服务器模块：在一个进程中用asyncio同时托管大量战斗，通过TCP行协议接收玩家操作并推送状态增量
+
+协议：每行一个UTF-8编码的JSON对象。角色用 "player:序号" / "enemy:序号" 标识，序号为阵容中的位置。
+客户端请求(op)：
+    {"op": "create", "player": ["naruto", ...], "enemy": [...], "policy": "default", "seed": 1}
+    {"op": "act", "battle": 1, "skill": 0, "targets": ["enemy:0"]}   targets只在手动选择目标的技能上需要
+    {"op": "auto", "battle": 1}                                       由服务器AI代替玩家行动一次
+    {"op": "state", "battle": 1}
+    {"op": "watch", "battle": 1}                                      以观战者身份订阅，不能出招
+    {"op": "leave", "battle": 1}
+    {"op": "stats"}
+服务器事件(event)：
+    {"event": "created", "battle": 1, "roster": {...}, "keyframe": "..."}
+    {"event": "delta", "battle": 1, "diff": "...", "log": [...]}
+    {"event": "state", "battle": 1, "keyframe": "..."}                也用于积压后的重新同步
+    {"event": "watching", "battle": 1, "roster": {...}, "keyframe": "..."}
+    {"event": "stats", ...}
+    {"event": "error", "battle": 1, "message": "..."}
+keyframe和diff是models.state_delta格式的二进制状态(base64编码)，客户端用apply_state_delta应用到本地的镜像状态上。
+
+每一步的事件只编码一次，同一份不可变的字节数据以memoryview共享给所有订阅者。发送积压超过
+SESSION_BUFFER_HIGH的连接不再接收差异(期间的日志也不补发)，积压降到SESSION_BUFFER_LOW以下
+或战斗结束时改发一个state关键帧，单个慢连接占用的内存因此有上限。
+"""
+import os
+import sys
+import json
+import base64
+import time
+import random
+import asyncio
+import argparse
+import threading
+import contextlib
+from collections import deque
+from naruto_game.config import (MAX_TEAM_SIZE, MAX_BATTLE_TURNS, AI_ACTION_DELAY, SERVER_HOST, SERVER_PORT,
+                                SESSION_BUFFER_HIGH, SESSION_BUFFER_LOW)
+from naruto_game.models.battle import BattleState
+from naruto_game.models.character import ROSTER, create_team_from_lineup
+from naruto_game.models.state_delta import StateTracker, apply_state_delta, is_empty_delta
+from naruto_game.simulation import AI_POLICIES, setup_battle
+from naruto_game.replay import Replay, ENEMY_TARGET_FLAG, state_digest
+from naruto_game.results import ResultsSink
+from naruto_game.utils.profiler import percentile
+
+LAG_SAMPLE_INTERVAL = 0.05  # 事件循环延迟的采样间隔(秒)
+AI_STEP = bytes((0xFF, 0))  # 由AI决定的一步(敌方行动或托管)
+MAX_SEED = 2 ** 64 - 1
+
+
+def team_sides(battle_state):
+    """(标识, 队伍) 列表"""
+    return (("player", battle_state.player_team), ("enemy", battle_state.enemy_team))
+
+def resolve_character(battle_state, key):
+    """由 '队伍:序号' 标识找到角色，无效时抛出ValueError"""
+    side, _, index = str(key).partition(":")
+    teams = dict(team_sides(battle_state))
+    if side not in teams or not index.isdigit() or int(index) >= len(teams[side].characters):
+        raise ValueError(f"无效的角色: {key}")
+    return teams[side].characters[int(index)]
+
+def is_player_turn(battle_state):
+    """战斗是否停在等待我方行动的阶段"""
+    return (not battle_state.is_battle_over and
+            battle_state.phase == "CHARACTER_ACTION" and
+            battle_state.current_team == battle_state.player_team)
+
+def battle_roster(battle_state):
+    """双方角色的静态信息，创建战斗时发送一次"""
+    roster = {}
+    for side, team in team_sides(battle_state):
+        for index, character in enumerate(team.characters):
+            roster[f"{side}:{index}"] = {
+                "id": character.id,
+                "name": character.name,
+                "max_hp": character.max_hp,
+                "skills": [
+                    {"name": skill.name, "type": skill.type, "chakra_cost": skill.chakra_cost,
+                     "target_type": skill.target_type}
+                    for skill in character.skills
+                ],
+            }
+    return roster
+
+def mirror_from_roster(roster):
+    """按battle_roster的阵容信息建立只用于显示的镜像战斗状态"""
+    teams = [
+        create_team_from_lineup(side, [info["id"] for key, info in roster.items() if key.startswith(side + ":")])
+        for side in ("player", "enemy")
+    ]
+    return BattleState(*teams)
+
+def battle_winner(battle_state):
+    """已结束战斗的胜方，双方都有存活角色(回合超限等)时为平局，返回None"""
+    player_alive = battle_state.player_team.is_team_alive()
+    enemy_alive = battle_state.enemy_team.is_team_alive()
+    if player_alive == enemy_alive:
+        return None
+    return "player" if player_alive else "enemy"
+
+def encode_step(battle_state, skill_index, target_keys):
+    """把我方的一次出招请求编码为步骤，格式与回放的决策相同；请求无法编码时抛出ValueError"""
+    if not 0 <= skill_index < AI_STEP[0] or len(target_keys) > 0xFF:
+        raise ValueError(f"无效的技能序号或目标: {skill_index}")
+    step = bytearray((skill_index, len(target_keys)))
+    for key in target_keys:
+        target = resolve_character(battle_state, key)
+        if target in battle_state.player_team.characters:
+            step.append(battle_state.player_team.characters.index(target))
+        else:
+            step.append(ENEMY_TARGET_FLAG | battle_state.enemy_team.characters.index(target))
+    return bytes(step)
+
+def player_action(battle_state, skill_index, target_keys):
+    """按客户端的选择执行我方当前角色的行动，请求无效时在修改战斗状态前抛出ValueError"""
+    if not is_player_turn(battle_state):
+        raise ValueError("当前不是我方行动阶段")
+    character = battle_state.current_character
+    if not 0 <= skill_index < len(character.skills):
+        raise ValueError(f"无效的技能序号: {skill_index}")
+    skill = character.skills[skill_index]
+    if skill.type in ("PASSIVE", "CHASE"):
+        raise ValueError(f"{skill.name}不能主动使用")
+    if skill.current_cooldown > 0:
+        raise ValueError(f"{skill.name}冷却中")
+    if battle_state.current_team.shared_chakra < skill.chakra_cost:
+        raise ValueError(f"查克拉不足，无法使用{skill.name}")
+
+    valid_targets = battle_state.select_skill(skill)
+    if skill.target_type == "single_enemy_manual":
+        if len(target_keys) != 1:
+            raise ValueError(f"{skill.name}需要指定一个目标")
+        target = resolve_character(battle_state, target_keys[0])
+        if target not in valid_targets:
+            raise ValueError(f"无效的目标: {target_keys[0]}")
+        targets = [target]
+    else:
+        # 其余技能的目标由技能自身决定，与界面上的行为一致
+        targets = valid_targets
+    battle_state.select_targets(targets)
+    return battle_state.use_current_skill()
+
+def run_step(battle_state, step):
+    """执行一步，返回行动是否成功"""
+    if step == AI_STEP:
+        return battle_state.perform_ai_action()
+    target_keys = [
+        f"enemy:{byte & ~ENEMY_TARGET_FLAG}" if byte & ENEMY_TARGET_FLAG else f"player:{byte}"
+        for byte in step[2:2 + step[1]]
+    ]
+    return player_action(battle_state, step[0], target_keys)
+
+def restore_battle(snapshot):
+    """由迁移快照重建战斗，返回(Replay, 战斗状态, 随机数状态)；重建结果与快照摘要不一致时抛出ValueError
+
+    快照沿用回放的二进制容器，其中的决策是服务器执行过的全部步骤(包括AI_STEP)，
+    所以不能当作回放文件播放。战斗核心只依赖种子和步骤序列，按原样重新执行即可得到相同的状态。
+    """
+    replay = Replay.from_bytes(snapshot)
+    battle_state = setup_battle(replay.player_lineup, replay.enemy_lineup, replay.policy, replay.seed,
+                                auto_enemy_actions=False)
+    for step in replay.decisions:
+        run_step(battle_state, step)
+    if state_digest(battle_state) != replay.final_digest:
+        raise ValueError("迁移快照重建后的状态不一致")
+    return replay, battle_state, random.getstate()
+
+def encode_state(data):
+    """二进制状态差异在协议中的文本形式"""
+    return base64.b64encode(data).decode("ascii")
+
+def decode_state(text):
+    """encode_state的逆过程"""
+    return base64.b64decode(text)
+
+def encode_event(event):
+    """把事件编码为一行协议数据"""
+    return json.dumps(event, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+class HostedBattle:
+    """服务器托管的一场战斗"""
+    def __init__(self, battle_id, battle_state, rng_state, record):
+        self.id = battle_id
+        self.battle_state = battle_state
+        self.rng_state = rng_state                  # 该战斗独立的随机数状态，每一步前后与全局random交换
+        self.record = record                        # 种子和已执行的步骤，用于迁移
+        self.sessions = set()                       # 参战的客户端
+        self.spectators = set()                     # 观战的客户端，不影响战斗的存续
+        self.roster = battle_roster(battle_state)
+        self.keyframe_events = {}                   # 事件类型 -> 当前这一步的关键帧事件，所有连接共享
+        self.tracker = StateTracker(battle_state)   # 每一步之后都立即推送差异，处理请求时没有未推送的变化
+        self.log_sent = len(battle_state.battle_log)
+        self.ai_handle = None                       # 已安排的敌方行动
+        self.finished = False
+        self.winner = None                          # 'player' | 'enemy' | None(平局)
+
+    def finish(self, winner):
+        """结束战斗，回合超限或卡住时winner为None，此时由服务器把战斗标记为结束"""
+        self.finished = True
+        self.winner = winner
+        if not self.battle_state.is_battle_over:
+            self.battle_state.phase = "BATTLE_END"
+            self.battle_state.is_battle_over = True
+        if self.ai_handle:
+            self.ai_handle.cancel()
+            self.ai_handle = None
+
+    def keyframe(self):
+        """当前的完整状态"""
+        return encode_state(self.tracker.keyframe())
+
+    def keyframe_event(self, kind):
+        """带完整状态的state/watching事件，同一步内只编码一次"""
+        data = self.keyframe_events.get(kind)
+        if data is None:
+            event = {"event": kind, "battle": self.id, "keyframe": self.keyframe()}
+            if kind == "watching":
+                event["roster"] = self.roster
+            data = self.keyframe_events[kind] = memoryview(encode_event(event))
+        return data
+
+    def subscribers(self):
+        """所有接收推送的连接"""
+        return self.sessions | self.spectators
+
+    def snapshot(self):
+        """迁移快照，见restore_battle"""
+        self.record.final_digest = state_digest(self.battle_state)
+        return self.record.to_bytes()
+
+
+class ClientSession:
+    """一个客户端连接"""
+    def __init__(self, writer):
+        self.writer = writer
+        self.battles = set()    # 参战的战斗ID
+        self.watching = set()   # 观战的战斗ID
+        self.stale = set()      # 因积压跳过了差异、等待关键帧重新同步的战斗ID
+
+    def send(self, data):
+        """写入已编码的事件，不等待发送完成；返回写入的字节数"""
+        if self.writer.is_closing():
+            return 0
+        self.writer.write(data)
+        return len(data)
+
+    @property
+    def backlog(self):
+        """尚未交给内核的发送字节数"""
+        return self.writer.transport.get_write_buffer_size()
+
+
+class BattleServer:
+    """对战服务器：所有战斗都在同一个事件循环上推进
+
+    战斗核心使用全局random并把日志打印到标准输出，不能放进线程池并行执行。
+    因此每一步只执行一个角色的一次行动(毫秒以内)，敌方的每次行动都作为独立的定时回调安排，
+    整场战斗不会一次性占用事件循环。
+    """
+    def __init__(self, ai_delay=AI_ACTION_DELAY, max_turns=MAX_BATTLE_TURNS, results=None):
+        self.ai_delay = ai_delay        # 敌方每次行动前的间隔(秒)
+        self.max_turns = max_turns      # 回合上限，超过判为平局
+        self.results = results          # ResultsSink，记录每场结束的战斗
+        self.battles = {}               # 战斗ID -> HostedBattle
+        self.next_battle_id = 1
+        self.battle_id_step = 1         # 多个服务器分片时按分片数跳跃分配，保证战斗ID全局唯一
+        self.server = None
+        self.monitor_task = None
+        self.clients = {}               # ClientSession -> 处理该连接的任务
+        self.devnull = open(os.devnull, "w")    # 丢弃战斗核心打印的日志，避免每一步都重新打开
+
+        # 统计
+        self.battles_created = 0
+        self.battles_finished = 0
+        self.battles_abandoned = 0
+        self.peak_battles = 0
+        self.actions = 0
+        self.step_time = 0.0
+        self.max_step_time = 0.0
+        self.loop_lags = deque(maxlen=2000)
+        self.max_loop_lag = 0.0
+        self.spectators = 0
+        self.bytes_encoded = 0          # 编码的事件字节数，每一步只编码一次
+        self.bytes_sent = 0             # 写给所有连接的字节数
+        self.deltas_dropped = 0         # 因积压没有发送的差异
+        self.resyncs = 0                # 积压后改发的关键帧
+
+    async def start(self, host=SERVER_HOST, port=SERVER_PORT):
+        """开始监听，port为0时由系统分配端口"""
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+        self.monitor_task = asyncio.create_task(self._monitor_loop_lag())
+        return self.server
+
+    @property
+    def address(self):
+        """实际监听的(主机, 端口)"""
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        """停止监听并取消所有待执行的敌方行动"""
+        if self.monitor_task:
+            self.monitor_task.cancel()
+        for battle in self.battles.values():
+            battle.finish(None)
+        self.battles = {}
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        # 关闭仍然连接的客户端，等处理任务自行结束
+        for session in self.clients:
+            session.writer.close()
+        if self.clients:
+            await asyncio.wait(list(self.clients.values()))
+        self.devnull.close()
+
+    async def _monitor_loop_lag(self):
+        """定时测量事件循环的调度延迟，反映是否有回调长时间占用事件循环"""
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + LAG_SAMPLE_INTERVAL
+            await asyncio.sleep(LAG_SAMPLE_INTERVAL)
+            lag = max(0.0, loop.time() - expected)
+            self.loop_lags.append(lag)
+            self.max_loop_lag = max(self.max_loop_lag, lag)
+
+    def stats(self):
+        """服务器统计"""
+        lags = sorted(self.loop_lags)
+        return {
+            "active": len(self.battles),
+            "created": self.battles_created,
+            "finished": self.battles_finished,
+            "abandoned": self.battles_abandoned,
+            "peak": self.peak_battles,
+            "actions": self.actions,
+            "avg_step_ms": self.step_time / max(self.actions, 1) * 1000,
+            "max_step_ms": self.max_step_time * 1000,
+            "loop_lag_p99_ms": percentile(lags, 0.99) * 1000,
+            "loop_lag_max_ms": self.max_loop_lag * 1000,
+            "spectators": self.spectators,
+            "bytes_encoded": self.bytes_encoded,
+            "bytes_sent": self.bytes_sent,
+            "deltas_dropped": self.deltas_dropped,
+            "resyncs": self.resyncs,
+        }
+
+    async def handle_client(self, reader, writer):
+        """处理一个客户端连接，逐行读取请求"""
+        session = ClientSession(writer)
+        self.clients[session] = asyncio.current_task()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = None
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("请求必须是JSON对象")
+                    self.handle_request(session, request)
+                except ValueError as e:
+                    battle_id = request.get("battle") if isinstance(request, dict) else None
+                    session.send(encode_event({"event": "error", "battle": battle_id, "message": str(e)}))
+                # 不在每个请求后等待drain：积压由SESSION_BUFFER_HIGH/LOW控制(超过后不再发送差异)，
+                # 而asyncio默认64KB的drain上限会让慢速连接的请求(观战、出招)在改发关键帧之前就被搁置
+        except ConnectionError:
+            pass
+        finally:
+            for battle_id in list(session.battles | session.watching):
+                self.leave(session, battle_id)
+            del self.clients[session]
+            writer.close()
+
+    def handle_request(self, session, request):
+        """分派一个请求，请求无效时抛出ValueError"""
+        op = request.get("op")
+        if op == "create":
+            self.create_battle(session, request.get("player"), request.get("enemy"),
+                               request.get("policy", "default"), request.get("seed"))
+        elif op == "act":
+            battle = self._get_battle(session, request)
+            skill_index = request.get("skill")
+            if not isinstance(skill_index, int):
+                raise ValueError("缺少技能序号")
+            targets = request.get("targets") or []
+            if not isinstance(targets, list):
+                raise ValueError("目标必须是列表")
+            self._step(battle, encode_step(battle.battle_state, skill_index, targets))
+        elif op == "auto":
+            battle = self._get_battle(session, request)
+            if not is_player_turn(battle.battle_state):
+                raise ValueError("当前不是我方行动阶段")
+            if not self._step(battle, AI_STEP):
+                self._finish(battle, None)
+        elif op == "state":
+            battle = self._get_battle(session, request, watching=True)
+            session.stale.discard(battle.id)
+            self.bytes_sent += session.send(battle.keyframe_event("state"))
+        elif op == "watch":
+            self.watch(session, request.get("battle"))
+        elif op == "leave":
+            self.leave(session, self._get_battle(session, request, watching=True).id)
+        elif op == "stats":
+            session.send(encode_event(dict(self.stats(), event="stats")))
+        else:
+            raise ValueError(f"未知操作: {op}")
+
+    def _get_battle(self, session, request, watching=False):
+        """session参与的战斗，watching为True时也接受观战的战斗"""
+        battle_id = request.get("battle")
+        if not isinstance(battle_id, int):
+            raise ValueError(f"无效的战斗ID: {battle_id}")
+        if battle_id not in session.battles and not (watching and battle_id in session.watching):
+            raise ValueError(f"未加入战斗: {battle_id}")
+        return self.battles[battle_id]
+
+    def create_battle(self, session, player_lineup, enemy_lineup, policy="default", seed=None):
+        """创建一场战斗并让session订阅它"""
+        for lineup in (player_lineup, enemy_lineup):
+            if not isinstance(lineup, list) or not 1 <= len(lineup) <= MAX_TEAM_SIZE:
+                raise ValueError(f"阵容必须包含1到{MAX_TEAM_SIZE}名角色")
+            # 先检查类型：列表、字典等不可哈希的值做字典查找会抛出TypeError
+            unknown = [char_id for char_id in lineup if not isinstance(char_id, str) or char_id not in ROSTER]
+            if unknown:
+                raise ValueError(f"未知角色: {', '.join(map(str, unknown))}")
+        if not isinstance(policy, str) or policy not in AI_POLICIES:
+            raise ValueError(f"未知的AI策略: {policy}")
+        if seed is not None and (not isinstance(seed, int) or not 0 <= seed <= MAX_SEED):
+            raise ValueError("随机种子必须是0到2^64-1之间的整数")
+        if seed is None:
+            seed = random.getrandbits(64)   # 每场战斗都有确定的种子，才能通过迁移快照重建
+
+        # 初始化同样会用到随机数，完成后把全局random的状态交给这场战斗保管
+        with contextlib.redirect_stdout(self.devnull):
+            battle_state = setup_battle(player_lineup, enemy_lineup, policy, seed, auto_enemy_actions=False)
+        record = Replay(player_lineup, enemy_lineup, seed, policy, min(self.max_turns, 0xFFFF))
+        battle = HostedBattle(self.next_battle_id, battle_state, random.getstate(), record)
+
+        self.next_battle_id += self.battle_id_step
+        self._host(battle)
+
+        battle.sessions.add(session)
+        session.battles.add(battle.id)
+        session.send(encode_event({"event": "created", "battle": battle.id,
+                                   "roster": battle.roster, "keyframe": battle.keyframe()}))
+        self._after_step(battle)
+        return battle
+
+    def _host(self, battle):
+        self.battles[battle.id] = battle
+        self.battles_created += 1
+        self.peak_battles = max(self.peak_battles, len(self.battles))
+
+    def export_battle(self, battle_id):
+        """把一场战斗移出本服务器，返回(迁移快照, 参战连接, 观战连接)；战斗不存在时返回None
+
+        战斗不会被判定结束，订阅关系由调用方在目标服务器上恢复。
+        """
+        battle = self.battles.pop(battle_id, None)
+        if battle is None:
+            return None
+        if battle.ai_handle:
+            battle.ai_handle.cancel()
+            battle.ai_handle = None
+        self.battles_created -= 1
+        for session in battle.sessions:
+            session.battles.discard(battle_id)
+        for session in battle.spectators:
+            session.watching.discard(battle_id)
+        self.spectators -= len(battle.spectators)
+        return battle.snapshot(), battle.sessions, battle.spectators
+
+    def import_battle(self, battle_id, snapshot, sessions=(), spectators=()):
+        """由迁移快照重建一场战斗并恢复订阅，快照无效时抛出ValueError
+
+        客户端的镜像状态已是迁出前的最新状态，重建后只需继续推送之后的变化。
+        """
+        if battle_id in self.battles:
+            raise ValueError(f"战斗已存在: {battle_id}")
+        with contextlib.redirect_stdout(self.devnull):
+            record, battle_state, rng_state = restore_battle(snapshot)
+        battle = HostedBattle(battle_id, battle_state, rng_state, record)
+        self._host(battle)
+        for session in sessions:
+            battle.sessions.add(session)
+            session.battles.add(battle_id)
+        if not battle.sessions:
+            # 迁移途中参战客户端都已断开
+            self._abandon(battle)
+            return battle
+        for session in spectators:
+            battle.spectators.add(session)
+            session.watching.add(battle_id)
+        self.spectators += len(battle.spectators)
+        self._after_step(battle)
+        return battle
+
+    def watch(self, session, battle_id):
+        """以观战者身份订阅一场进行中的战斗，先发送阵容和当前的完整状态"""
+        if not isinstance(battle_id, int):
+            raise ValueError(f"无效的战斗ID: {battle_id}")
+        battle = self.battles.get(battle_id)
+        if battle is None:
+            raise ValueError(f"战斗不存在: {battle_id}")
+        if battle_id in session.battles or battle_id in session.watching:
+            raise ValueError(f"已加入战斗: {battle_id}")
+        battle.spectators.add(session)
+        session.watching.add(battle_id)
+        self.spectators += 1
+        self.bytes_sent += session.send(battle.keyframe_event("watching"))
+
+    def leave(self, session, battle_id):
+        """取消订阅，没有参战客户端的战斗直接丢弃"""
+        session.battles.discard(battle_id)
+        session.stale.discard(battle_id)
+        battle = self.battles.get(battle_id)
+        if battle is None:
+            return
+        if battle_id in session.watching:
+            session.watching.discard(battle_id)
+            battle.spectators.discard(session)
+            self.spectators -= 1
+            return
+        battle.sessions.discard(session)
+        if not battle.sessions:
+            self._abandon(battle)
+
+    def _abandon(self, battle):
+        """丢弃没有参战客户端的战斗，不记录结果"""
+        battle.finish(None)
+        del self.battles[battle.id]
+        self.battles_abandoned += 1
+
+    def _step(self, battle, step):
+        """在该战斗自己的随机数状态下执行一步，推送增量并安排后续的敌方行动
+
+        全局random在服务器中只作为各场战斗轮流使用的工作状态，不需要恢复。
+        步骤无效而抛出ValueError时战斗状态未被修改，随机数状态和步骤记录也不会保存。
+        """
+        random.setstate(battle.rng_state)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(self.devnull):
+            result = run_step(battle.battle_state, step)
+        battle.rng_state = random.getstate()
+        battle.record.decisions.append(step)
+
+        elapsed = time.perf_counter() - start
+        self.actions += 1
+        self.step_time += elapsed
+        self.max_step_time = max(self.max_step_time, elapsed)
+        self._after_step(battle)
+        return result
+
+    def _after_step(self, battle):
+        """判定结束、推送增量，轮到敌方时安排下一次行动"""
+        battle_state = battle.battle_state
+        if battle_state.is_battle_over:
+            battle.finish(battle_winner(battle_state))
+        elif battle_state.turn_count > self.max_turns:
+            battle.finish(None)
+
+        self._publish(battle)
+        if battle.finished:
+            self._remove(battle)
+        elif (battle_state.phase == "CHARACTER_ACTION" and
+              battle_state.current_team == battle_state.enemy_team and
+              battle.ai_handle is None):
+            loop = asyncio.get_running_loop()
+            battle.ai_handle = loop.call_later(self.ai_delay, self._run_enemy_action, battle)
+
+    def _run_enemy_action(self, battle):
+        battle.ai_handle = None
+        if battle.finished:
+            return
+        # 敌方行动失败时战斗无法继续推进，判为平局
+        if not self._step(battle, AI_STEP):
+            self._finish(battle, None)
+
+    def _finish(self, battle, winner):
+        if battle.finished:
+            return
+        battle.finish(winner)
+        self._publish(battle)
+        self._remove(battle)
+
+    def _publish(self, battle):
+        """把自上次推送以来的变化发送给所有订阅者
+
+        事件只编码一次，所有连接共享同一个memoryview。积压过多的连接跳过差异，
+        之后用关键帧重新同步，关键帧同样每一步只编码一次。
+        """
+        diff = battle.tracker.collect()
+        log = battle.battle_state.battle_log[battle.log_sent:]
+        if is_empty_delta(diff) and not log:
+            return
+        battle.log_sent = len(battle.battle_state.battle_log)
+        if not is_empty_delta(diff):
+            battle.keyframe_events.clear()
+
+        data = memoryview(encode_event({"event": "delta", "battle": battle.id, "diff": encode_state(diff),
+                                        "log": [str(entry) for entry in log]}))
+        self.bytes_encoded += len(data)
+        for session in battle.subscribers():
+            stale = battle.id in session.stale
+            # 战斗结束时不论积压都要送达最终状态，每场战斗最多多占用一个事件
+            if battle.finished:
+                pass
+            elif not stale and session.backlog > SESSION_BUFFER_HIGH:
+                session.stale.add(battle.id)
+                self.deltas_dropped += 1
+                continue
+            elif stale and session.backlog > SESSION_BUFFER_LOW:
+                self.deltas_dropped += 1
+                continue
+
+            if stale:
+                session.stale.discard(battle.id)
+                self.bytes_sent += session.send(battle.keyframe_event("state"))
+                self.resyncs += 1
+            else:
+                self.bytes_sent += session.send(data)
+
+    def _remove(self, battle):
+        if self.battles.pop(battle.id, None) is not None:
+            self.battles_finished += 1
+            if self.results is not None:
+                try:
+                    self.results.record(battle.battle_state, battle.winner, battle.record.seed,
+                                        battle.record.policy, "server")
+                except Exception as e:
+                    # 结果数据库的写入线程已出错(磁盘已满等)，对战照常进行，只是不再记录
+                    print(f"结果数据库写入失败，之后的战斗不再记录: {e!r}", file=sys.stderr)
+                    self.results = None
+        for session in battle.sessions:
+            session.battles.discard(battle.id)
+            session.stale.discard(battle.id)
+        for session in battle.spectators:
+            session.watching.discard(battle.id)
+            session.stale.discard(battle.id)
+        self.spectators -= len(battle.spectators)
+        battle.spectators = set()
+
+
+async def serve(host=SERVER_HOST, port=SERVER_PORT, ai_delay=AI_ACTION_DELAY, max_turns=MAX_BATTLE_TURNS, results=None):
+    """运行服务器直到被中断"""
+    server = BattleServer(ai_delay, max_turns, results)
+    await server.start(host, port)
+    print(f"对战服务器监听于 {server.address[0]}:{server.address[1]}")
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.close()
+
+
+class LocalServerThread:
+    """在后台线程的事件循环中运行服务器，供界面客户端在本机联调
+
+    战斗核心使用全局random并重定向标准输出，界面线程此时只作为客户端显示，不运行战斗逻辑。
+    """
+    def __init__(self, ai_delay=AI_ACTION_DELAY, max_turns=MAX_BATTLE_TURNS):
+        self.server = BattleServer(ai_delay, max_turns)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="battle-server", daemon=True)
+
+    def start(self, host="127.0.0.1", port=0):
+        """启动服务器并返回实际监听的(主机, 端口)"""
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.server.start(host, port), self.loop).result()
+        return self.server.address
+
+    def stop(self):
+        """关闭服务器并结束后台线程"""
+        asyncio.run_coroutine_threadsafe(self.server.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+async def _send(writer, message):
+    writer.write(encode_event(message))
+    await writer.drain()
+
+def choose_client_action(rng, battle_state):
+    """负载测试客户端的出招：查克拉足够时有三成几率使用奥义，否则普攻随机存活的敌人"""
+    character = battle_state.current_character
+    usable = [
+        skill for skill in character.skills
+        if skill.type in ("NORMAL", "MYSTERY") and skill.current_cooldown == 0 and
+        battle_state.player_team.shared_chakra >= skill.chakra_cost
+    ]
+    mystery = [skill for skill in usable if skill.type == "MYSTERY"]
+    normal = [skill for skill in usable if skill.type == "NORMAL"] or [character.normal_attack]
+    skill = rng.choice(mystery) if mystery and rng.random() < 0.3 else rng.choice(normal)
+
+    alive_enemies = [index for index, enemy in enumerate(battle_state.enemy_team.characters) if enemy.is_alive]
+    return {"op": "act", "skill": character.skills.index(skill), "targets": [f"enemy:{rng.choice(alive_enemies)}"]}
+
+async def load_test_player(host, port, games, seed, policy, latencies, results, announce=None):
+    """模拟一名玩家：依次进行games场战斗，记录从出招到收到增量的延迟
+
+    results收集 (战斗ID, 胜方)；announce为观战者的队列列表，每创建一场战斗就通知所有观战者。
+    """
+    rng = random.Random(seed)   # 独立的随机数生成器，不影响服务器端战斗使用的全局random
+    roster_ids = list(ROSTER)
+    team_size = min(MAX_TEAM_SIZE, len(roster_ids))
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(games):
+            player_lineup = rng.sample(roster_ids, team_size)
+            enemy_lineup = rng.sample(roster_ids, team_size)
+            await _send(writer, {"op": "create", "player": player_lineup, "enemy": enemy_lineup,
+                                 "policy": policy, "seed": rng.getrandbits(32)})
+
+            # 客户端只保存由服务器推送维护的镜像状态
+            mirror = BattleState(create_team_from_lineup("player", player_lineup),
+                                 create_team_from_lineup("enemy", enemy_lineup))
+            battle_id = None
+            sent_at = None
+            while True:
+                line = await reader.readline()
+                if not line:
+                    raise ConnectionError("服务器关闭了连接")
+                event = json.loads(line)
+                kind = event["event"]
+                if kind == "created":
+                    battle_id = event["battle"]
+                    apply_state_delta(mirror, decode_state(event["keyframe"]))
+                    for queue in announce or ():
+                        queue.put_nowait(battle_id)
+                elif kind == "state":
+                    apply_state_delta(mirror, decode_state(event["keyframe"]))
+                elif kind == "delta":
+                    apply_state_delta(mirror, decode_state(event["diff"]))
+                    if sent_at is not None:
+                        latencies.append(time.perf_counter() - sent_at)
+                        sent_at = None
+                elif kind == "error":
+                    if battle_id is None:
+                        raise RuntimeError(event["message"])
+                    # 出招被拒绝时改由服务器AI代为行动
+                    await _send(writer, {"op": "auto", "battle": battle_id})
+                    continue
+
+                if mirror.is_battle_over:
+                    results.append((battle_id, battle_winner(mirror)))
+                    break
+                if is_player_turn(mirror) and sent_at is None:
+                    request = choose_client_action(rng, mirror)
+                    request["battle"] = battle_id
+                    sent_at = time.perf_counter()
+                    await _send(writer, request)
+    finally:
+        writer.close()
+
+async def load_test_spectator(host, port, queue, read_delay, outcomes, counts):
+    """模拟一名观战者：观看所有新创建的战斗，read_delay模拟读取缓慢的连接
+
+    outcomes收集观战者看到的 (战斗ID, 胜方)，用于和参战玩家的结果核对；counts累计收到的事件数。
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    mirrors = {}    # 战斗ID -> 镜像状态
+
+    async def subscribe():
+        while True:
+            battle_id = await queue.get()
+            await _send(writer, {"op": "watch", "battle": battle_id})
+
+    subscriber = asyncio.create_task(subscribe())
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            event = json.loads(line)
+            counts["events"] += 1
+            kind = event["event"]
+            battle_id = event.get("battle")
+            if kind == "watching":
+                mirrors[battle_id] = mirror_from_roster(event["roster"])
+                apply_state_delta(mirrors[battle_id], decode_state(event["keyframe"]))
+            elif kind == "state" and battle_id in mirrors:
+                counts["keyframes"] += 1
+                apply_state_delta(mirrors[battle_id], decode_state(event["keyframe"]))
+            elif kind == "delta" and battle_id in mirrors:
+                apply_state_delta(mirrors[battle_id], decode_state(event["diff"]))
+            else:
+                continue    # 订阅时战斗已经结束
+
+            mirror = mirrors[battle_id]
+            if mirror.is_battle_over:
+                outcomes.append((battle_id, battle_winner(mirror)))
+                del mirrors[battle_id]
+            if read_delay:
+                await asyncio.sleep(read_delay)
+    except asyncio.CancelledError:
+        pass
+    finally:
+        subscriber.cancel()
+        writer.close()
+
+async def fetch_stats(host, port):
+    """向服务器查询统计"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        await _send(writer, {"op": "stats"})
+        return json.loads(await reader.readline())
+    finally:
+        writer.close()
+
+async def run_load_test(players, games=1, host=None, port=SERVER_PORT, ai_delay=0.0, policy="default", seed=0,
+                        spectators=0, spectator_delay=0.0):
+    """用players个并发客户端对服务器施压，返回统计结果
+
+    spectators个观战者观看所有战斗，每名观战者读取每个事件后等待spectator_delay秒。
+
+    host为None时在本进程内启动一个监听随机端口的服务器；此时客户端与服务器共用一个事件循环，
+    测得的事件循环延迟也包含客户端自身的开销。
+    """
+    server = None
+    if host is None:
+        server = BattleServer(ai_delay=ai_delay)
+        await server.start("127.0.0.1", 0)
+        host, port = server.address
+
+    latencies = []
+    results = []
+    outcomes = []
+    counts = {"events": 0, "keyframes": 0}
+    queues = [asyncio.Queue() for _ in range(spectators)]
+    watchers = [
+        asyncio.create_task(load_test_spectator(host, port, queue, spectator_delay, outcomes, counts))
+        for queue in queues
+    ]
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(
+            load_test_player(host, port, games, rng.getrandbits(32), policy, latencies, results, queues)
+            for _ in range(players)
+        ))
+        elapsed = time.perf_counter() - start
+        # 慢速观战者在战斗结束后仍在读取积压的数据，只要还在收到事件就继续等待
+        received = -1
+        while len(outcomes) < len(results) * spectators and counts["events"] != received:
+            received = counts["events"]
+            await asyncio.sleep(1.0)
+        server_stats = server.stats() if server else await fetch_stats(host, port)
+    finally:
+        for watcher in watchers:
+            watcher.cancel()
+        await asyncio.gather(*watchers)
+        if server:
+            await server.close()
+
+    winners = dict(results)
+    latencies.sort()
+    return {
+        "players": players,
+        "battles": len(results),
+        "wins": list(winners.values()).count("player"),
+        "losses": list(winners.values()).count("enemy"),
+        "draws": list(winners.values()).count(None),
+        "spectators": spectators,
+        "spectator_events": counts["events"],
+        "spectator_keyframes": counts["keyframes"],
+        "spectated": len(outcomes),
+        "spectator_mismatches": sum(1 for battle_id, winner in outcomes if winners.get(battle_id, winner) != winner),
+        "elapsed": elapsed,
+        "latency_p50_ms": percentile(latencies, 0.50) * 1000,
+        "latency_p95_ms": percentile(latencies, 0.95) * 1000,
+        "latency_p99_ms": percentile(latencies, 0.99) * 1000,
+        "server": server_stats,
+    }
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="火影忍者OL战斗原型 - 对战服务器")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="启动对战服务器")
+    serve_parser.add_argument("--host", default=SERVER_HOST, help="监听地址")
+    serve_parser.add_argument("--port", type=int, default=SERVER_PORT, help="监听端口")
+    serve_parser.add_argument("--ai-delay", type=float, default=AI_ACTION_DELAY, help="敌方每次行动前的间隔(秒)")
+    serve_parser.add_argument("--max-turns", type=int, default=MAX_BATTLE_TURNS, help="回合上限，超过判为平局")
+    serve_parser.add_argument("--results-db", default=None, help="把每场结束的战斗写入该SQLite数据库")
+
+    load_parser = subparsers.add_parser("loadtest", help="模拟多名并发玩家进行负载测试")
+    load_parser.add_argument("--players", type=int, default=1000, help="并发玩家数")
+    load_parser.add_argument("--games", type=int, default=1, help="每名玩家依次进行的战斗数")
+    load_parser.add_argument("--host", default=None, help="服务器地址，不指定时在本进程内启动服务器")
+    load_parser.add_argument("--port", type=int, default=SERVER_PORT, help="服务器端口")
+    load_parser.add_argument("--ai-delay", type=float, default=0.0, help="本进程内服务器的敌方行动间隔(秒)")
+    load_parser.add_argument("--policy", choices=sorted(AI_POLICIES), default="default", help="敌方AI策略")
+    load_parser.add_argument("--seed", type=int, default=0, help="客户端随机种子")
+    load_parser.add_argument("--spectators", type=int, default=0, help="观看所有战斗的观战者数")
+    load_parser.add_argument("--spectator-delay", type=float, default=0.0, help="观战者读取每个事件后的等待(秒)，模拟慢速连接")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        results = ResultsSink(args.results_db) if args.results_db else None
+        try:
+            asyncio.run(serve(args.host, args.port, args.ai_delay, args.max_turns, results))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if results:
+                results.close()
+        return 0
+
+    if args.players <= 0 or args.games <= 0:
+        parser.error("玩家数和战斗数必须为正数")
+    if args.spectators < 0 or args.spectator_delay < 0:
+        parser.error("观战者数和等待时间不能为负数")
+    report = asyncio.run(run_load_test(args.players, args.games, args.host, args.port, args.ai_delay,
+                                       args.policy, args.seed, args.spectators, args.spectator_delay))
+    server_stats = report["server"]
+    elapsed = max(report["elapsed"], 1e-9)
+    print(f"并发玩家: {report['players']}，完成战斗: {report['battles']} "
+          f"(胜{report['wins']} 负{report['losses']} 平{report['draws']})，耗时 {report['elapsed']:.1f} 秒")
+    print(f"战斗吞吐: {report['battles'] / elapsed:.1f} 场/秒，行动吞吐: {server_stats['actions'] / elapsed:.0f} 次/秒，"
+          f"同时进行的战斗峰值: {server_stats['peak']}")
+    print(f"出招延迟: p50 {report['latency_p50_ms']:.2f} ms，p95 {report['latency_p95_ms']:.2f} ms，"
+          f"p99 {report['latency_p99_ms']:.2f} ms")
+    print(f"单步耗时: 平均 {server_stats['avg_step_ms']:.3f} ms，最大 {server_stats['max_step_ms']:.2f} ms；"
+          f"事件循环延迟: p99 {server_stats['loop_lag_p99_ms']:.2f} ms，最大 {server_stats['loop_lag_max_ms']:.2f} ms")
+    if report["spectators"]:
+        encoded = max(server_stats["bytes_encoded"], 1)
+        print(f"观战者: {report['spectators']}，收到事件: {report['spectator_events']}，"
+              f"看完的战斗: {report['spectated']}，结果不一致: {report['spectator_mismatches']}")
+        print(f"推送: 编码 {server_stats['bytes_encoded'] / 1024:.0f} KB，发送 {server_stats['bytes_sent'] / 1024:.0f} KB "
+              f"(共享 {server_stats['bytes_sent'] / encoded:.1f} 倍)；积压跳过差异 {server_stats['deltas_dropped']} 次，"
+              f"关键帧重新同步 {server_stats['resyncs']} 次")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+战斗模拟模块：在无界面的情况下由AI驱动双方完成整场战斗
+"""
+import os
+import sys
+import random
+import contextlib
+from naruto_game.config import MAX_BATTLE_TURNS
+from naruto_game.models.character import create_team_from_lineup
+from naruto_game.models.battle import BattleState, BattleSystem
+
+
+def normal_attack_policy(battle_state, character):
+    """只使用普通攻击的AI策略"""
+    skill = character.normal_attack
+    return skill, skill.get_valid_targets(character, battle_state)
+
+def mystery_first_policy(battle_state, character):
+    """查克拉足够时优先使用奥义的AI策略"""
+    skill = character.mystery_art
+    if (skill is None or
+            skill.current_cooldown > 0 or
+            battle_state.current_team.shared_chakra < skill.chakra_cost):
+        skill = character.normal_attack
+    return skill, skill.get_valid_targets(character, battle_state)
+
+# 可选的AI策略，None表示使用BattleState内置的AI
+AI_POLICIES = {
+    "default": None,
+    "normal": normal_attack_policy,
+    "mystery": mystery_first_policy,
+}
+
+
+class BattleResult:
+    """一场模拟战斗的结果"""
+    def __init__(self, winner, turn_count, battle_state):
+        self.winner = winner                # 'player' | 'enemy' | None(平局)
+        self.turn_count = turn_count        # 总回合数
+        self.battle_state = battle_state    # 结束时的战斗状态
+
+
+def create_battle_state(player_team, enemy_team, policy="default"):
+    """创建战斗状态并设置AI策略，尚未开始战斗"""
+    battle_state = BattleState(player_team, enemy_team)
+    battle_state.ai_policy = AI_POLICIES[policy]
+    return battle_state
+
+def run_battle(battle_state, max_turns=MAX_BATTLE_TURNS, player_action=None):
+    """代替玩家行动，直到战斗结束或超过回合上限
+
+    player_action(battle_state)为玩家方执行一次行动并返回是否成功，默认由AI行动。
+    """
+    act = player_action or BattleState.perform_ai_action
+    while not battle_state.is_battle_over and battle_state.turn_count <= max_turns:
+        if battle_state.phase != "CHARACTER_ACTION" or battle_state.current_team != battle_state.player_team:
+            break
+        if not act(battle_state):
+            break
+
+    if not battle_state.is_battle_over:
+        return None
+    return "player" if battle_state.player_team.is_team_alive() else "enemy"
+
+@contextlib.contextmanager
+def quiet_output(quiet=True):
+    """战斗核心会把日志打印到标准输出，批量模拟时将其丢弃"""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull if quiet else sys.stdout):
+        yield
+
+def setup_battle(player_lineup, enemy_lineup, policy="default", seed=None, auto_enemy_actions=True):
+    """按阵容创建并开始一场战斗，返回停在我方第一次行动前的战斗状态
+
+    auto_enemy_actions为False时敌方行动不会自动执行，也可能停在敌方角色的行动阶段。
+    """
+    if seed is not None:
+        random.seed(seed)
+
+    player_team = create_team_from_lineup("player", player_lineup)
+    enemy_team = create_team_from_lineup("enemy", enemy_lineup)
+    battle_state = create_battle_state(player_team, enemy_team, policy)
+    battle_state.auto_enemy_actions = auto_enemy_actions
+
+    battle_system = BattleSystem()
+    battle_system.battle_state = battle_state
+    battle_system.determine_first_team(battle_state)
+    battle_system.start_battle(battle_state)
+    return battle_state
+
+def simulate_battle(player_lineup, enemy_lineup, policy="default", seed=None, max_turns=MAX_BATTLE_TURNS, quiet=True,
+                    player_action=None):
+    """按阵容模拟一场AI对AI的战斗
+
+    player_lineup和enemy_lineup为按手位排列的角色ID序列；
+    指定seed时战斗结果可复现。player_action见run_battle。
+    """
+    with quiet_output(quiet):
+        battle_state = setup_battle(player_lineup, enemy_lineup, policy, seed)
+        winner = run_battle(battle_state, max_turns, player_action)
+
+    return BattleResult(winner, battle_state.turn_count, battle_state)
@@ -0,0 +1,208 @@
+"""
+启动耗时模块：在新的子进程中测量游戏从启动到画出第一帧的耗时
+
+每次测量都启动一个新的Python进程，分别统计导入、创建窗口、创建标题场景和绘制第一帧的时间。
+冷启动在测量前删除字体缓存文件，第一帧包含扫描系统字体的时间；热启动直接打开缓存的字体文件。
+测量使用临时的字体缓存文件，不影响游戏实际使用的缓存。
+
+imports子命令用python -X importtime测量无界面入口模块(模拟、服务器、锦标赛等)的导入耗时，
+并检查这些模块是否加载了pygame：战斗核心和命令行工具不应依赖渲染相关的模块。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+PHASES = ("import", "display", "scene", "first_frame", "total", "process")
+PHASE_NAMES = {
+    "import": "导入",
+    "display": "创建窗口",
+    "scene": "创建场景",
+    "first_frame": "第一帧",
+    "total": "合计",
+    "process": "进程",
+}
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 不需要窗口的入口模块，导入时不应加载pygame
+HEADLESS_MODULES = (
+    "naruto_game.models.battle",
+    "naruto_game.simulation",
+    "naruto_game.tournament",
+    "naruto_game.results",
+    "naruto_game.replay",
+    "naruto_game.server",
+    "naruto_game.cluster",
+    "naruto_game.benchmark",
+)
+# 导入耗时的目标(毫秒)，不含asyncio等服务器必需的标准库
+IMPORT_TARGET_MS = 50
+
+
+def measure_startup():
+    """在当前进程中完成一次启动，返回各阶段耗时(秒)"""
+    start = time.perf_counter()
+    import pygame
+    from naruto_game.scenes import Game, TitleScene
+    imported = time.perf_counter()
+
+    game = Game()
+    displayed = time.perf_counter()
+
+    scene = TitleScene(game)
+    created = time.perf_counter()
+
+    scene.render(game.screen)
+    pygame.display.flip()
+    rendered = time.perf_counter()
+    pygame.quit()
+
+    return {
+        "import": imported - start,
+        "display": displayed - imported,
+        "scene": created - displayed,
+        "first_frame": rendered - created,
+        "total": rendered - start,
+    }
+
+def run_child(cache_file, headless=False):
+    """在新进程中测量一次启动，返回各阶段耗时，process为包含解释器启动的进程总耗时"""
+    env = dict(os.environ)
+    env["NARUTO_FONT_CACHE"] = cache_file
+    env["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, (PROJECT_ROOT, env.get("PYTHONPATH"))))
+    if headless:
+        env["SDL_VIDEODRIVER"] = "dummy"
+        env["SDL_AUDIODRIVER"] = "dummy"
+
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-m", "naruto_game.startup", "child"],
+        env=env, cwd=PROJECT_ROOT, capture_output=True, text=True,
+    )
+    elapsed = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f"启动测量进程失败:\n{completed.stderr}")
+
+    # 游戏初始化时会打印信息，测量结果在最后一行
+    timings = json.loads(completed.stdout.strip().splitlines()[-1])
+    timings["process"] = elapsed
+    return timings
+
+def measure_import(module):
+    """在新进程中用-X importtime导入module，返回 (累计耗时(秒), 是否加载了pygame, 耗时最多的自有模块)"""
+    env = dict(os.environ)
+    env["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, (PROJECT_ROOT, env.get("PYTHONPATH"))))
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env, cwd=PROJECT_ROOT, capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{completed.stderr}")
+
+    # 每行格式为 "import time: 自身(微秒) | 累计(微秒) | 缩进的模块名"
+    cumulative = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        cumulative[fields[2].strip()] = int(fields[1]) / 1e6
+    if module not in cumulative:
+        raise RuntimeError(f"未找到 {module} 的导入耗时")
+
+    loaded_pygame = any(name == "pygame" or name.startswith("pygame.") for name in cumulative)
+    own = [name for name in cumulative if name.startswith("naruto_game.") and name != module]
+    heaviest = max(own, key=cumulative.get) if own else None
+    return cumulative[module], loaded_pygame, heaviest
+
+def benchmark_imports(modules=HEADLESS_MODULES, runs=5):
+    """每个模块测量runs次，返回 {模块: (耗时中位数(秒), 是否加载了pygame, 耗时最多的自有模块)}"""
+    report = {}
+    for module in modules:
+        samples = [measure_import(module) for _ in range(runs)]
+        report[module] = (
+            statistics.median(sample[0] for sample in samples),
+            any(sample[1] for sample in samples),
+            samples[-1][2],
+        )
+    return report
+
+def benchmark_startup(runs=5, headless=False, cache_file=None):
+    """交替测量冷启动和热启动各runs次，返回 {"cold": [...], "warm": [...]}"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache_file = cache_file or os.path.join(temp_dir, "fonts.json")
+        report = {"cold": [], "warm": []}
+        for _ in range(runs):
+            if os.path.exists(cache_file):
+                os.remove(cache_file)
+            report["cold"].append(run_child(cache_file, headless))
+            report["warm"].append(run_child(cache_file, headless))
+    return report
+
+def summarize(samples):
+    """各阶段的中位数(秒)"""
+    return {phase: statistics.median(sample[phase] for sample in samples) for phase in PHASES}
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="火影忍者OL战斗原型 - 启动耗时测量")
+    subparsers = parser.add_subparsers(dest="command")
+
+    bench_parser = subparsers.add_parser("bench", help="测量冷启动和热启动的耗时(默认)")
+    bench_parser.add_argument("--runs", type=int, default=5, help="冷启动和热启动各测量的次数")
+    bench_parser.add_argument("--headless", action="store_true", help="不打开窗口(使用SDL的dummy驱动)")
+
+    imports_parser = subparsers.add_parser("imports", help="测量无界面入口模块的导入耗时")
+    imports_parser.add_argument("modules", nargs="*", help="要测量的模块(默认为全部无界面入口模块)")
+    imports_parser.add_argument("--runs", type=int, default=5, help="每个模块测量的次数")
+    imports_parser.add_argument("--target", type=float, default=IMPORT_TARGET_MS, help="导入耗时的目标(毫秒)")
+
+    subparsers.add_parser("child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.command == "child":
+        print(json.dumps(measure_startup()))
+        return 0
+
+    if args.command == "imports":
+        if args.runs < 1:
+            parser.error("--runs 至少为1")
+        report = benchmark_imports(args.modules or HEADLESS_MODULES, args.runs)
+        print(f"导入耗时中位数(毫秒)，每个模块 {args.runs} 次，目标 {args.target:.0f} 毫秒：")
+        failed = False
+        for module, (elapsed, loaded_pygame, heaviest) in report.items():
+            flags = []
+            if loaded_pygame:
+                flags.append("加载了pygame")
+            if elapsed * 1000 > args.target:
+                flags.append("超过目标")
+            failed = failed or loaded_pygame
+            print(f"  {module:<28}{elapsed * 1000:>8.1f}   {heaviest or '-':<28}{'，'.join(flags)}")
+        # 超过目标只做提示(服务器导入asyncio本身就要几十毫秒)，加载pygame视为失败
+        return 1 if failed else 0
+
+    runs = getattr(args, "runs", 5)
+    headless = getattr(args, "headless", False)
+    if runs < 1:
+        parser.error("--runs 至少为1")
+    report = benchmark_startup(runs, headless)
+
+    print(f"启动耗时中位数(毫秒)，冷启动和热启动各 {runs} 次：")
+    print("            " + "".join(f"{PHASE_NAMES[phase]:>10}" for phase in PHASES))
+    for kind, label in (("cold", "冷启动"), ("warm", "热启动")):
+        medians = summarize(report[kind])
+        print(f"{label:<10}" + "".join(f"{medians[phase] * 1000:>12.1f}" for phase in PHASES))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
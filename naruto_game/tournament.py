@@ -0,0 +1,290 @@
+"""
+锦标赛模块：枚举全部阵容与手位排列，批量进行AI对AI的对战并输出Elo排名和胜负矩阵
+"""
+import os
+import sys
+import json
+import argparse
+import itertools
+from naruto_game.config import MAX_TEAM_SIZE, MAX_BATTLE_TURNS
+from naruto_game.models.character import ROSTER
+from naruto_game.simulation import AI_POLICIES, simulate_battle
+
+ELO_INITIAL = 1500  # 初始Elo分
+ELO_K = 32          # Elo系数
+CHECKPOINT_VERSION = 1
+
+
+def lineup_key(lineup):
+    """阵容的字符串表示，按手位顺序用'-'连接角色ID"""
+    return "-".join(lineup)
+
+def parse_lineup_key(key):
+    """将阵容字符串还原为角色ID列表"""
+    return key.split("-")
+
+def enumerate_lineups(roster_ids, team_size=MAX_TEAM_SIZE):
+    """枚举所有合法阵容，手位不同视为不同阵容"""
+    return [lineup_key(lineup) for lineup in itertools.permutations(roster_ids, team_size)]
+
+def enumerate_pairings(lineups):
+    """枚举所有对阵，跳过镜像对局和交换双方后的重复对阵"""
+    return list(itertools.combinations(lineups, 2))
+
+
+def play_pairing(task):
+    """进行一组对阵的全部场次，双方轮流担任玩家方以抵消先后手差异
+
+    collect为True时返回的记录中附带每场战斗的结果记录(results.battle_record)，由主进程写入数据库。
+    """
+    key_a, key_b, games, policy, base_seed, max_turns, collect = task
+    lineup_a = parse_lineup_key(key_a)
+    lineup_b = parse_lineup_key(key_b)
+    if collect:
+        # 避免循环导入：results导入了本模块
+        from naruto_game.results import battle_record
+    battles = []
+
+    wins_a = wins_b = draws = 0
+    for game in range(games):
+        seed = f"{base_seed}:{key_a}:{key_b}:{game}"
+        a_is_player = game % 2 == 0
+        if a_is_player:
+            result = simulate_battle(lineup_a, lineup_b, policy, seed, max_turns)
+        else:
+            result = simulate_battle(lineup_b, lineup_a, policy, seed, max_turns)
+        if collect:
+            battles.append(battle_record(result.battle_state, result.winner, seed, policy, "tournament"))
+
+        if result.winner is None:
+            draws += 1
+        elif (result.winner == "player") == a_is_player:
+            wins_a += 1
+        else:
+            wins_b += 1
+
+    record = {"a": key_a, "b": key_b, "wins_a": wins_a, "wins_b": wins_b, "draws": draws}
+    if collect:
+        record["battles"] = battles
+    return record
+
+
+def checkpoint_header(roster_ids, team_size, games, policy, seed, max_turns):
+    """检查点文件的第一行：生成这些对阵结果的锦标赛参数，参数不同的结果不能混用"""
+    return {
+        "checkpoint": CHECKPOINT_VERSION,
+        "roster": list(roster_ids),
+        "team_size": team_size,
+        "games": games,
+        "policy": policy,
+        "seed": seed,
+        "max_turns": max_turns,
+    }
+
+def load_checkpoint(path, header=None):
+    """读取检查点文件，返回已完成的对阵结果
+
+    header不为None时，文件第一行记录的参数与之不同、无法解析(或是没有参数行的旧文件)则抛出ValueError；
+    空文件视为新的检查点。
+    """
+    records = {}
+    if not path or not os.path.exists(path):
+        return records
+
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if number == 0 and header is not None:
+                # 参数行不完整时同样无法确认旧结果可用
+                if record is None:
+                    raise ValueError(f"检查点文件 {path} 的参数行不完整")
+                if record != header:
+                    raise ValueError(f"检查点文件 {path} 的锦标赛参数与本次不同")
+                continue
+            if record is None:
+                # 中断时可能留下不完整的最后一行
+                continue
+            if "checkpoint" in record:
+                continue
+            records[(record["a"], record["b"])] = record
+    return records
+
+def compute_elo(records, lineups):
+    """按对阵顺序计算每个阵容的Elo分"""
+    ratings = {key: float(ELO_INITIAL) for key in lineups}
+    for record in sorted(records, key=lambda r: (r["a"], r["b"])):
+        games = record["wins_a"] + record["wins_b"] + record["draws"]
+        if games == 0:
+            continue
+        rating_a = ratings[record["a"]]
+        rating_b = ratings[record["b"]]
+        expected_a = 1 / (1 + 10 ** ((rating_b - rating_a) / 400))
+        score_a = (record["wins_a"] + 0.5 * record["draws"]) / games
+        delta = ELO_K * games * (score_a - expected_a)
+        ratings[record["a"]] = rating_a + delta
+        ratings[record["b"]] = rating_b - delta
+    return ratings
+
+def build_report(records, lineups, policy, games):
+    """生成包含Elo排名和胜负矩阵的报告"""
+    ratings = compute_elo(records, lineups)
+    totals = {key: [0, 0, 0] for key in lineups}  # [胜, 负, 平]
+    win_matrix = {key: {} for key in lineups}
+
+    for record in records:
+        a, b = record["a"], record["b"]
+        win_matrix[a][b] = [record["wins_a"], record["wins_b"], record["draws"]]
+        win_matrix[b][a] = [record["wins_b"], record["wins_a"], record["draws"]]
+        totals[a][0] += record["wins_a"]
+        totals[a][1] += record["wins_b"]
+        totals[b][0] += record["wins_b"]
+        totals[b][1] += record["wins_a"]
+        totals[a][2] += record["draws"]
+        totals[b][2] += record["draws"]
+
+    ranking = sorted(lineups, key=lambda key: ratings[key], reverse=True)
+    return {
+        "policy": policy,
+        "games_per_pairing": games,
+        "pairings": len(records),
+        "ratings": [
+            {
+                "lineup": key,
+                "elo": round(ratings[key], 1),
+                "wins": totals[key][0],
+                "losses": totals[key][1],
+                "draws": totals[key][2],
+            }
+            for key in ranking
+        ],
+        "win_matrix": win_matrix,
+    }
+
+
+def run_tournament(roster_ids, team_size=MAX_TEAM_SIZE, games=2, policy="default", workers=None,
+                   checkpoint=None, seed=0, max_turns=MAX_BATTLE_TURNS, results=None):
+    """运行锦标赛，已记录在检查点文件中的对阵会被跳过
+
+    results为ResultsSink时把每场战斗的结果写入数据库。
+    """
+    lineups = enumerate_lineups(roster_ids, team_size)
+    pairings = enumerate_pairings(lineups)
+    header = checkpoint_header(roster_ids, team_size, games, policy, seed, max_turns)
+    try:
+        records = load_checkpoint(checkpoint, header)
+    except ValueError as e:
+        # 参数变了，旧的结果不能用于本次排名；保留旧文件，从头开始
+        backup = checkpoint + ".old"
+        os.replace(checkpoint, backup)
+        print(f"{e}，已改名为 {backup}，重新开始")
+        records = {}
+    # 只保留本次对阵表中的结果
+    records = {pairing: records[pairing] for pairing in pairings if pairing in records}
+    pending = [
+        (a, b, games, policy, seed, max_turns, results is not None)
+        for a, b in pairings
+        if (a, b) not in records
+    ]
+
+    print(f"阵容数: {len(lineups)}，对阵数: {len(pairings)}，已完成: {len(records)}，待进行: {len(pending)}")
+
+    workers = workers or os.cpu_count() or 1
+    checkpoint_file = None
+    if checkpoint:
+        checkpoint_file = open(checkpoint, "a", encoding="utf-8")
+        if checkpoint_file.tell() == 0:
+            checkpoint_file.write(json.dumps(header, ensure_ascii=False) + "\n")
+            checkpoint_file.flush()
+    pool = None
+    if workers > 1 and pending:
+        # results、replay等模块只用到阵容键的函数，多进程模块在真正需要进程池时才导入
+        import multiprocessing
+        pool = multiprocessing.Pool(workers)
+    try:
+        if pool:
+            chunksize = max(1, min(256, len(pending) // (workers * 16)))
+            outcomes = pool.imap_unordered(play_pairing, pending, chunksize=chunksize)
+        else:
+            outcomes = map(play_pairing, pending)
+
+        for done, record in enumerate(outcomes, start=1):
+            for battle in record.pop("battles", ()):
+                results.put(battle)
+            records[(record["a"], record["b"])] = record
+            if checkpoint_file:
+                checkpoint_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                checkpoint_file.flush()
+            if done % 1000 == 0:
+                print(f"已完成 {done}/{len(pending)} 组对阵")
+    except KeyboardInterrupt:
+        print("锦标赛被中断，重新运行相同命令即可从检查点继续")
+        raise
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+        if checkpoint_file:
+            checkpoint_file.close()
+
+    return build_report(list(records.values()), lineups, policy, games)
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="火影忍者OL战斗原型 - AI对AI锦标赛")
+    parser.add_argument("--roster", default=",".join(ROSTER),
+                        help="参赛角色ID，用逗号分隔 (默认: 全部角色)")
+    parser.add_argument("--team-size", type=int, default=MAX_TEAM_SIZE, help="每队人数")
+    parser.add_argument("--games", type=int, default=2, help="每组对阵的场次")
+    parser.add_argument("--policy", choices=sorted(AI_POLICIES), default="default", help="AI策略")
+    parser.add_argument("--workers", type=int, default=None, help="并行进程数 (默认: CPU核数)")
+    parser.add_argument("--checkpoint", default="tournament_checkpoint.jsonl", help="检查点文件")
+    parser.add_argument("--report", default="tournament_report.json", help="报告输出文件")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--max-turns", type=int, default=MAX_BATTLE_TURNS, help="单场战斗的回合上限")
+    parser.add_argument("--results-db", default=None, help="把每场战斗的结果写入该SQLite数据库")
+    args = parser.parse_args(argv)
+
+    roster_ids = [char_id.strip() for char_id in args.roster.split(",") if char_id.strip()]
+    unknown = [char_id for char_id in roster_ids if char_id not in ROSTER]
+    if unknown:
+        parser.error(f"未知的角色ID: {', '.join(unknown)}")
+    if not 1 <= args.team_size <= min(MAX_TEAM_SIZE, len(roster_ids)):
+        parser.error("每队人数必须在1到参赛角色数之间，且不超过4人")
+
+    results = None
+    if args.results_db:
+        from naruto_game.results import ResultsSink
+        results = ResultsSink(args.results_db)
+    try:
+        report = run_tournament(
+            roster_ids,
+            team_size=args.team_size,
+            games=args.games,
+            policy=args.policy,
+            workers=args.workers,
+            checkpoint=args.checkpoint,
+            seed=args.seed,
+            max_turns=args.max_turns,
+            results=results,
+        )
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        if results:
+            results.close()
+
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"报告已写入: {args.report}")
+    for entry in report["ratings"][:10]:
+        print(f"  {entry['lineup']}: Elo {entry['elo']} (胜{entry['wins']} 负{entry['losses']} 平{entry['draws']})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
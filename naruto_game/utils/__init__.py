@@ -1,5 +1,39 @@
 """
 utils包的初始化文件
+
+包级别的名字按需导入(PEP 562)：只用到profiler或timeline时不会加载依赖pygame的helpers和ui。
 """
-from naruto_game.utils.helpers import *
-from naruto_game.utils.ui import * 
\ No newline at end of file
+import importlib
+
+# 子模块 -> 对外提供的名字
+# profiler模块中的全局实例同名，包级别不导出它，以免与子模块属性冲突；使用naruto_game.utils.profiler.profiler
+_EXPORTS = {
+    "helpers": (
+        "FONT_PROBE_TEXT", "FONT_PROBE_SIZE", "FONT_CACHE_VERSION", "LazyFont",
+        "probe_font_paths", "font_cache_file", "resolve_font_paths", "get_font", "render_text", "draw_text",
+        "load_image", "distance", "get_random_position", "lerp",
+        "create_simple_character_image", "create_status_effect_icon",
+    ),
+    "ui": ("Button", "ProgressBar", "CharacterCard", "MessageBox", "SkillButton", "Slider"),
+    "profiler": (
+        "INSTRUMENTED_METHODS", "SAMPLE_WINDOW", "MAX_TRACE_EVENTS", "OVERLAY_REFRESH_FRAMES",
+        "Profiler", "percentile",
+    ),
+    "timeline": ("Timeline",),
+}
+
+_LOCATIONS = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = list(_LOCATIONS)
+
+
+def __getattr__(name):
+    module = _LOCATIONS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f"{__name__}.{module}"), name)
+    globals()[name] = value     # 之后的访问不再经过__getattr__
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,174 @@
+"""
+字形图集模块：每个字号的字体把用到的字形各光栅化一次，存入图集页，拼字符串时只按图集中的矩形blit
+
+战斗文字重复度很高(忍者名、技能名、数字、"造成…点伤害")。字符串切分成片段：数字逐个字形拼接，
+其余字符每至多4个一段，片段第一次出现时由字形拼成后也存入图集，之后一行日志只需要几次blit，
+不再调用Font.render。片段不取整段非数字文字，是因为"甲使用某技能对乙"这类组合太多，整段缓存会不断挤占图集。
+
+每个图集对应一种字体和颜色，可选择以预乘alpha格式存储，供按预乘格式合成的界面直接使用。
+图集页数有上限，页满时清空最久未使用的一页重新分配，被清空的字形和片段下次用到时重新生成。
+
+字形按各自的前进宽度依次排列，不做字距调整；中文和数字的排版与Font.render一致，
+少数西文字母组合可能有一两个像素的差别。
+"""
+import re
+import pygame
+from naruto_game.config import WHITE, GLYPH_ATLAS_PAGE_SIZE, GLYPH_ATLAS_MAX_PAGES
+
+# 数字逐个字形拼接；其余字符每至多4个一段整体缓存
+_TOKEN = re.compile(r"\d|\D{1,4}")
+
+
+class GlyphAtlas:
+    """一种字体和颜色的字形图集"""
+    def __init__(self, font, color=WHITE, premultiplied=False,
+                 page_size=GLYPH_ATLAS_PAGE_SIZE, max_pages=GLYPH_ATLAS_MAX_PAGES):
+        self.font = font
+        self.color = tuple(color)
+        self.premultiplied = premultiplied
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.height = None          # 行高，首次光栅化时由字体决定
+        self.entries = {}           # 字形或片段 -> (页序号, 矩形)
+        self.pages = []             # 图集页Surface
+        self.page_entries = []      # 每页存放的字形和片段，清空一页时从entries中移除
+        self.page_used = []         # 每页最近一次被使用的时钟值
+        self.cursor = None          # 当前页的下一个空位 (页序号, x, y)
+        self.clock = 0
+        self.rasterized = 0         # 累计光栅化的字形数
+        self.composed = 0           # 累计拼成的片段数
+        self.evictions = 0          # 累计清空的页数
+
+    def _allocate(self, width):
+        """为宽width的条目找一个空位，返回(页序号, x, y)"""
+        if self.cursor is not None:
+            index, x, y = self.cursor
+            if x + width > self.page_size:
+                # 当前行放不下，换到下一行
+                x, y = 0, y + self.height
+            if y + self.height <= self.page_size:
+                self.cursor = (index, x + width, y)
+                return index, x, y
+
+        if len(self.pages) < self.max_pages:
+            index = len(self.pages)
+            self.pages.append(pygame.Surface((self.page_size, self.page_size), pygame.SRCALPHA))
+            self.page_entries.append([])
+            self.page_used.append(self.clock)
+        else:
+            # 所有页都已用满，清空最久未使用的一页
+            index = min(range(len(self.pages)), key=self.page_used.__getitem__)
+            for key in self.page_entries[index]:
+                del self.entries[key]
+            self.page_entries[index] = []
+            self.pages[index].fill((0, 0, 0, 0))
+            self.evictions += 1
+        self.cursor = (index, width, 0)
+        return index, 0, 0
+
+    def _store(self, key, surface):
+        """把字形或片段的表面放入图集"""
+        width = surface.get_width()
+        index, x, y = self._allocate(width)
+        rect = pygame.Rect(x, y, width, self.height)
+        # 目标区域是全透明的，取最大值等于直接复制像素和alpha
+        self.pages[index].blit(surface, rect, special_flags=pygame.BLEND_RGBA_MAX)
+        self.page_entries[index].append(key)
+        entry = self.entries[key] = (index, rect)
+        return entry
+
+    def _glyph(self, char):
+        """单个字形，不在图集中时光栅化"""
+        entry = self.entries.get(char)
+        if entry is None:
+            glyph = self.font.render(char, True, self.color)
+            if self.height is None:
+                self.height = glyph.get_height()
+            if glyph.get_width() > self.page_size:
+                glyph = glyph.subsurface((0, 0, self.page_size, glyph.get_height()))
+            if self.premultiplied:
+                # 字体表面的行距可能带有填充，先复制到紧凑的表面再做预乘
+                compact = pygame.Surface(glyph.get_size(), pygame.SRCALPHA)
+                compact.blit(glyph, (0, 0), special_flags=pygame.BLEND_RGBA_MAX)
+                glyph = compact.premul_alpha()
+            entry = self._store(char, glyph)
+            self.rasterized += 1
+        self.page_used[entry[0]] = self.clock
+        return entry
+
+    def _token(self, token):
+        """数字或片段，片段第一次出现时由字形拼成；放不进一页的片段返回None，由调用方逐字拼接"""
+        entry = self.entries.get(token)
+        if entry is None:
+            if len(token) == 1:
+                return self._glyph(token)
+            width = 0
+            for char in token:
+                width += self._glyph(char)[1].width
+            if width > self.page_size:
+                return None
+            surface = pygame.Surface((max(1, width), self.height), pygame.SRCALPHA)
+            self._compose(surface, [self._glyph(char) for char in token])
+            entry = self._store(token, surface)
+            self.composed += 1
+        self.page_used[entry[0]] = self.clock
+        return entry
+
+    def _layout(self, text):
+        """(页序号, 矩形) 列表"""
+        for _ in range(self.max_pages):
+            self.clock += 1
+            evictions = self.evictions
+            layout = []
+            for token in _TOKEN.findall(text):
+                entry = self._token(token)
+                if entry is None:
+                    layout.extend(self._glyph(char) for char in token)
+                else:
+                    layout.append(entry)
+            if self.evictions == evictions:
+                return layout
+            # 生成新条目时清空了页，较早排好的条目可能已被覆盖，此时重新排版
+            live = set(map(id, self.entries.values()))
+            if all(id(entry) in live for entry in layout):
+                return layout
+        # 一行文字用到的条目超过了整个图集的容量，只能接受部分字形被覆盖
+        return layout
+
+    def _compose(self, surface, layout):
+        pages = self.pages
+        x = 0
+        blits = []
+        for index, rect in layout:
+            blits.append((pages[index], (x, 0), rect, pygame.BLEND_RGBA_MAX))
+            x += rect.width
+        surface.blits(blits, doreturn=False)
+
+    def size(self, text):
+        """拼接后的宽高"""
+        layout = self._layout(text)
+        return sum(rect.width for _, rect in layout), self.height or self.font.get_height()
+
+    def render(self, text):
+        """拼出一行文字，返回新的带alpha的Surface，调用方可以自由修改"""
+        layout = self._layout(text)
+        width = sum(rect.width for _, rect in layout)
+        surface = pygame.Surface((max(1, width), self.height or self.font.get_height()), pygame.SRCALPHA)
+        self._compose(surface, layout)
+        return surface
+
+    def memory_bytes(self):
+        """图集页占用的像素内存"""
+        return sum(page.get_bytesize() * self.page_size * self.page_size for page in self.pages)
+
+
+# 全局图集缓存：(字体, 颜色, 预乘) -> GlyphAtlas
+_atlases = {}
+
+def get_atlas(font, color=WHITE, premultiplied=False):
+    """获取字体和颜色对应的字形图集"""
+    key = (font, tuple(color), premultiplied)
+    atlas = _atlases.get(key)
+    if atlas is None:
+        atlas = _atlases[key] = GlyphAtlas(font, color, premultiplied)
+    return atlas
@@ -6,69 +6,176 @@ import os
 import math
 import random
 import sys
-from naruto_game.config import SCREEN_WIDTH, SCREEN_HEIGHT
+import json
+from collections import OrderedDict
+from naruto_game.config import SCREEN_WIDTH, SCREEN_HEIGHT, TEXT_CACHE_SIZE, FONT_CACHE_FILE
 
-# 全局字体缓存
+# 字体探测：渲染测试文字的宽度过小说明字体缺少汉字(只画出了很窄的方块)
+FONT_PROBE_TEXT = "中文测试火影忍者"
+FONT_PROBE_SIZE = 32
+FONT_CACHE_VERSION = 1
+
+# 全局字体缓存：(字号, 粗体) -> LazyFont
 _font_cache = {}
 
-def get_font(size, bold=False):
-    """获取支持中文的字体"""
-    # 使用缓存避免重复加载字体
-    key = (size, bold)
-    if key in _font_cache:
-        return _font_cache[key]
-    
-    # 默认系统字体 - 通常能显示中文
-    default_font = pygame.font.SysFont(None, size, bold=bold)
-    
-    # 尝试按顺序加载这些字体，找到第一个可用的
-    font_names = []
-    
+# 找到的字体文件：{"regular": 路径, "bold": 路径, "fake_bold": 是否需要模拟粗体}，路径为None表示默认字体
+_font_paths = None
+
+def _candidate_font_names():
+    """当前平台上按优先顺序尝试的中文字体"""
     # Windows中文字体
     if sys.platform.startswith('win'):
-        font_names.extend([
+        return [
             "SimHei", "Microsoft YaHei", "SimSun", "NSimSun", "FangSong", "KaiTi",
             "Arial Unicode MS", "MingLiU"
-        ])
+        ]
     # macOS中文字体
-    elif sys.platform.startswith('darwin'):
-        font_names.extend([
+    if sys.platform.startswith('darwin'):
+        return [
             "STHeiti", "Hiragino Sans GB", "Apple SD Gothic Neo", "PingFang SC",
             "STSong", "STFangsong"
-        ])
+        ]
     # Linux中文字体
-    else:
-        font_names.extend([
-            "WenQuanYi Zen Hei", "WenQuanYi Micro Hei", "Droid Sans Fallback",
-            "Noto Sans CJK SC", "Source Han Sans CN", "Source Han Sans SC"
-        ])
-    
-    # 测试字符 - 包含一些常用汉字
-    test_chars = "中文测试火影忍者"
-    
-    # 尝试找到一个支持中文的字体
-    font = None
-    for font_name in font_names:
+    return [
+        "WenQuanYi Zen Hei", "WenQuanYi Micro Hei", "Droid Sans Fallback",
+        "Noto Sans CJK SC", "Source Han Sans CN", "Source Han Sans SC"
+    ]
+
+def probe_font_paths():
+    """扫描系统字体，找到第一个能显示中文的字体文件，找不到时使用默认字体
+
+    pygame.font.match_font首次调用时会扫描整个系统字体目录，只在没有磁盘缓存时调用。
+    """
+    for font_name in _candidate_font_names():
+        path = pygame.font.match_font(font_name)
+        if not path:
+            continue
         try:
-            font = pygame.font.SysFont(font_name, size, bold=bold)
-            # 尝试渲染测试字符
-            test_surface = font.render(test_chars, True, (0, 0, 0))
-            width, height = test_surface.get_size()
-            
-            # 检查渲染结果是否有合理的宽度 (方块字符通常很窄)
-            if width > len(test_chars) * size * 0.3:  # 基本判断标准
-                _font_cache[key] = font
-                return font
-        except:
+            width = pygame.font.Font(path, FONT_PROBE_SIZE).size(FONT_PROBE_TEXT)[0]
+        except (pygame.error, OSError):
             continue
+        if width > len(FONT_PROBE_TEXT) * FONT_PROBE_SIZE * 0.3:
+            bold_path = pygame.font.match_font(font_name, bold=True) or path
+            return {"regular": path, "bold": bold_path, "fake_bold": bold_path == path}
+    return {"regular": None, "bold": None, "fake_bold": True}
+
+def font_cache_file():
+    """字体路径缓存文件"""
+    return os.environ.get("NARUTO_FONT_CACHE") or FONT_CACHE_FILE
+
+def _load_font_paths(cache_file):
+    """读取缓存的字体路径，缓存不存在、属于其他平台、字体文件已被删除或记录的是默认字体时返回None"""
+    try:
+        with open(cache_file, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get("version") != FONT_CACHE_VERSION or data.get("platform") != sys.platform:
+        return None
+    paths = data.get("fonts")
+    if not isinstance(paths, dict) or set(paths) != {"regular", "bold", "fake_bold"}:
+        return None
+    if paths["regular"] is None:
+        # 旧版本会缓存"没有找到中文字体"，此后安装的字体永远不会被发现
+        return None
+    for key in ("regular", "bold"):
+        if paths[key] is not None and not os.path.isfile(paths[key]):
+            return None
+    return paths
+
+def _save_font_paths(cache_file, paths):
+    """写入字体路径缓存，写不进去时只是下次启动重新探测"""
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(cache_file)), exist_ok=True)
+        temp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump({"version": FONT_CACHE_VERSION, "platform": sys.platform, "fonts": paths}, f, ensure_ascii=False)
+        os.replace(temp_file, cache_file)
+    except OSError as e:
+        print(f"无法写入字体缓存 {cache_file}: {e}")
+
+def resolve_font_paths(refresh=False):
+    """找到要使用的字体文件：先读磁盘缓存，没有时探测系统字体并写入缓存
+
+    只缓存找到的中文字体；没有找到时使用默认字体且不写入缓存，下次启动重新探测，
+    之后安装的中文字体也能被发现。换用其他已安装的字体可以删除缓存文件或传入refresh=True。
+    """
+    global _font_paths
+    if _font_paths is None or refresh:
+        cache_file = font_cache_file()
+        paths = None if refresh else _load_font_paths(cache_file)
+        if paths is None:
+            paths = probe_font_paths()
+            if paths["regular"] is not None:
+                _save_font_paths(cache_file, paths)
+        _font_paths = paths
+    return _font_paths
+
+
+class LazyFont:
+    """延迟打开的字体：首次渲染或测量文字时才查找并打开字体文件
+
+    界面组件在构造时就获取字体，延迟打开使字体探测不占用启动时间。其余属性和方法都转给pygame的Font。
+    """
+    def __init__(self, size, bold=False):
+        self.font_size = size
+        self.bold = bold
+        self._font = None
+    
+    @property
+    def font(self):
+        """实际的pygame.font.Font"""
+        if self._font is None:
+            paths = resolve_font_paths()
+            font = pygame.font.Font(paths["bold" if self.bold else "regular"], self.font_size)
+            if self.bold and paths["fake_bold"]:
+                font.set_bold(True)
+            self._font = font
+        return self._font
+    
+    def render(self, text, antialias, color, background=None):
+        return self.font.render(text, antialias, color, background)
+    
+    def size(self, text):
+        return self.font.size(text)
+    
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.font, name)
+
+def get_font(size, bold=False):
+    """获取支持中文的字体，返回的字体在首次使用时才打开"""
+    # 使用缓存避免重复加载字体
+    key = (size, bold)
+    font = _font_cache.get(key)
+    if font is None:
+        font = _font_cache[key] = LazyFont(size, bold)
+    return font
+
+# 文字表面缓存：(字体, 文本, 颜色, 抗锯齿) -> Surface，按最近最少使用淘汰
+_text_cache = OrderedDict()
+
+def render_text(font, text, color, antialias=True):
+    """渲染文本表面，参数相同时直接复用缓存，不再重新光栅化
+
+    返回的Surface是共享的，调用方只能blit，不要修改它。
+    """
+    key = (font, text, tuple(color), antialias)
+    surface = _text_cache.get(key)
+    if surface is not None:
+        _text_cache.move_to_end(key)
+        return surface
     
-    # 如果找不到合适的字体，尝试直接使用默认字体
-    _font_cache[key] = default_font
-    return default_font
+    surface = font.render(text, antialias, color)
+    _text_cache[key] = surface
+    if len(_text_cache) > TEXT_CACHE_SIZE:
+        _text_cache.popitem(last=False)
+    return surface
 
 def draw_text(surface, text, font, color, x, y, align="center"):
     """在指定位置绘制文本"""
-    text_surface = font.render(text, True, color)
+    text_surface = render_text(font, text, color)
     text_rect = text_surface.get_rect()
     
     if align == "center":
@@ -169,7 +276,7 @@ def create_status_effect_icon(effect_name, size=(20, 20)):
     )
     
     # 在图标中添加首字符
-    font = pygame.font.SysFont(None, size[0])
+    font = pygame.font.Font(None, size[0])  # 默认字体，不必扫描系统字体
     text = effect_name[0]  # 取第一个字
     text_surface = font.render(text, True, (255, 255, 255))
     text_rect = text_surface.get_rect(center=(size[0] // 2, size[1] // 2))
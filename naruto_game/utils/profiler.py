@@ -0,0 +1,170 @@
+"""
+性能分析模块：可选的耗时统计、帧耗时浮层和Chrome trace导出
+
+默认关闭。开启时才把计时包装替换到被监测的方法上，关闭后恢复原方法，
+因此关闭状态下没有任何额外开销。
+"""
+import os
+import json
+import math
+import time
+import threading
+import importlib
+import functools
+from collections import deque
+
+# 被监测的方法：(模块, 类, 方法, 显示名称)
+INSTRUMENTED_METHODS = [
+    ("naruto_game.scenes", "TitleScene", "handle_event", "handle_event"),
+    ("naruto_game.scenes", "TitleScene", "update", "update"),
+    ("naruto_game.scenes", "TitleScene", "render", "render"),
+    ("naruto_game.scenes", "BattleScene", "handle_event", "handle_event"),
+    ("naruto_game.scenes", "BattleScene", "update", "update"),
+    ("naruto_game.scenes", "BattleScene", "render", "render"),
+    ("naruto_game.scenes", "BattleScene", "_update_layers", "_update_layers"),
+    ("naruto_game.scenes", "BattleScene", "_draw_battlefield", "_draw_battlefield"),
+    ("naruto_game.scenes", "BattleScene", "_draw_characters", "_draw_characters"),
+    ("naruto_game.scenes", "BattleScene", "_draw_chakra_bars", "_draw_chakra_bars"),
+    ("naruto_game.scenes", "BattleScene", "_draw_debug_info", "_draw_debug_info"),
+    ("naruto_game.utils.ui", "CharacterCard", "draw", "CharacterCard.draw"),
+    ("naruto_game.utils.ui", "MessageBox", "draw", "MessageBox.draw"),
+    ("naruto_game.models.skills", "Skill", "use", "Skill.use"),
+    ("naruto_game.models.skills", "Skill", "trigger_chase_attacks", "trigger_chase_attacks"),
+    ("naruto_game.models.character", "Character", "update_status_effects", "update_status_effects"),
+]
+
+SAMPLE_WINDOW = 300          # 每项统计保留的最近样本数
+MAX_TRACE_EVENTS = 200000    # trace事件上限，超过后丢弃最早的事件
+OVERLAY_REFRESH_FRAMES = 15  # 浮层文字每隔多少帧刷新一次
+
+
+def percentile(sorted_values, fraction):
+    """最近秩法求百分位数，输入需已排序"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+class Profiler:
+    """性能分析器：记录各段耗时，提供滚动百分位数并导出Chrome trace"""
+    def __init__(self, window=SAMPLE_WINDOW, max_trace_events=MAX_TRACE_EVENTS):
+        self.enabled = False
+        self.window = window
+        self.samples = {}                                # 名称 -> 最近的耗时(毫秒)
+        self.trace_events = deque(maxlen=max_trace_events)
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self._originals = []                             # (类, 方法名, 原方法)
+
+        # 浮层
+        self.overlay_surface = None
+        self.overlay_frame = 0
+
+    def enable(self):
+        """开启监测：把计时包装替换到被监测的方法上"""
+        if self.enabled:
+            return
+        for module_name, class_name, method_name, label in INSTRUMENTED_METHODS:
+            owner = getattr(importlib.import_module(module_name), class_name)
+            original = owner.__dict__.get(method_name)
+            if original is None:
+                continue
+            self._originals.append((owner, method_name, original))
+            setattr(owner, method_name, self._wrap(original, label))
+        self.enabled = True
+
+    def disable(self):
+        """关闭监测并恢复原方法"""
+        for owner, method_name, original in reversed(self._originals):
+            setattr(owner, method_name, original)
+        self._originals = []
+        self.enabled = False
+        self.overlay_surface = None
+
+    def toggle(self):
+        """切换开启状态"""
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+
+    def _wrap(self, func, label):
+        profiler = self
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.record(label, start, time.perf_counter())
+        return timed
+
+    def record(self, name, start, end):
+        """记录一段耗时，start和end为perf_counter的读数"""
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = deque(maxlen=self.window)
+        samples.append((end - start) * 1000)
+        self.trace_events.append((name, start, end, threading.get_ident()))
+
+    def stats(self):
+        """各项的滚动统计：名称 -> (p50, p95, p99)，单位毫秒"""
+        result = {}
+        for name, samples in self.samples.items():
+            values = sorted(samples)
+            result[name] = (percentile(values, 0.50), percentile(values, 0.95), percentile(values, 0.99))
+        return result
+
+    def dump_trace(self, path):
+        """导出Chrome trace JSON，可在chrome://tracing或Perfetto中打开"""
+        events = [
+            {
+                "name": name,
+                "ph": "X",
+                "ts": (start - self.origin) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": self.pid,
+                "tid": tid,
+            }
+            for name, start, end, tid in self.trace_events
+        ]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+        return len(events)
+
+    def draw_overlay(self, screen, font):
+        """在屏幕右上角绘制耗时浮层，返回浮层区域"""
+        if self.overlay_surface is None or self.overlay_frame % OVERLAY_REFRESH_FRAMES == 0:
+            self.overlay_surface = self._build_overlay(font)
+        self.overlay_frame += 1
+
+        rect = self.overlay_surface.get_rect(topright=(screen.get_width() - 10, 90))
+        screen.blit(self.overlay_surface, rect)
+        return rect
+
+    def _build_overlay(self, font):
+        # 对战服务器也用本模块做统计，pygame只在绘制浮层时导入
+        import pygame
+
+        # 数值每帧都在变，直接渲染而不放入文字缓存，以免挤掉场景的缓存条目
+        lines = [f"{'项目':<24}{'p50':>8}{'p95':>8}{'p99':>8}  (ms)"]
+        for name, (p50, p95, p99) in sorted(self.stats().items()):
+            lines.append(f"{name:<24}{p50:>8.2f}{p95:>8.2f}{p99:>8.2f}")
+
+        line_height = font.get_linesize()
+        surfaces = [font.render(line, True, (255, 255, 255)) for line in lines]
+        width = max(surface.get_width() for surface in surfaces) + 20
+        height = line_height * len(surfaces) + 20
+
+        overlay = pygame.Surface((width, height))
+        overlay.fill((20, 20, 20))
+        pygame.draw.rect(overlay, (255, 255, 0), overlay.get_rect(), 1)
+        for i, surface in enumerate(surfaces):
+            overlay.blit(surface, (10, 10 + i * line_height))
+        return overlay
+
+
+# 全局性能分析器
+profiler = Profiler()
@@ -0,0 +1,45 @@
+"""
+时间轴模块：按固定步长推进的模拟时间上触发定时事件，取代会阻塞主循环的等待
+"""
+import heapq
+import itertools
+
+
+class Timeline:
+    """时间轴：事件按触发时间排序，advance时依次触发到期的事件"""
+    def __init__(self):
+        self.time = 0.0                     # 当前模拟时间(秒)
+        self.events = []                    # 小顶堆：(触发时间, 序号, 回调, 参数)
+        self._sequence = itertools.count()  # 同一时刻的事件按加入顺序触发
+
+    def schedule(self, delay, callback, *args):
+        """在delay秒后触发callback(*args)"""
+        heapq.heappush(self.events, (self.time + delay, next(self._sequence), callback, args))
+
+    def advance(self, dt):
+        """推进dt秒并触发所有到期的事件，返回触发的事件数
+
+        回调中新加入的到期事件会在同一次advance中继续触发。
+        """
+        self.time += dt
+        fired = 0
+        while self.events and self.events[0][0] <= self.time:
+            _, _, callback, args = heapq.heappop(self.events)
+            callback(*args)
+            fired += 1
+        return fired
+
+    def time_until_next(self):
+        """距离下一个事件的时间，没有事件时返回None"""
+        if not self.events:
+            return None
+        return max(0.0, self.events[0][0] - self.time)
+
+    def clear(self):
+        """清空所有未触发的事件"""
+        self.events = []
+
+    @property
+    def pending(self):
+        """是否还有未触发的事件"""
+        return bool(self.events)
@@ -2,8 +2,11 @@
 UI组件模块：包含游戏中使用的各种UI元素
 """
 import pygame
-from naruto_game.config import BLACK, WHITE, RED, GREEN, GREY, YELLOW, BUTTON_WIDTH, BUTTON_HEIGHT
-from naruto_game.utils.helpers import get_font
+from collections import deque
+from itertools import islice
+from naruto_game.config import BLACK, WHITE, RED, GREEN, GREY, YELLOW, BUTTON_WIDTH, BUTTON_HEIGHT, MESSAGE_HISTORY_SIZE
+from naruto_game.utils.helpers import get_font, render_text
+from naruto_game.utils.glyph_atlas import get_atlas
 
 class Button:
     """按钮控件：可响应点击事件"""
@@ -14,17 +17,29 @@ class Button:
         self.hover_color = tuple(min(c + 50, 255) for c in color)  # 悬停时颜色变亮
         self.text_color = text_color
         self.action = action
-        self.font = get_font(24)
+        self.font = get_font(28)  # 使用较大的字体
         self.hovered = False
         self.available = True
+        self.dirty = True  # 外观变化后需要重绘
         print(f"创建按钮: '{text}' 位置:({x}, {y}) 大小:({width}x{height})")
     
     def update(self, chakra=None, mouse_pos=None):
         """更新按钮状态"""
         if mouse_pos:
-            self.hovered = self.rect.collidepoint(mouse_pos) and self.available
+            hovered = self.rect.collidepoint(mouse_pos) and self.available
         else:
-            self.hovered = False
+            hovered = False
+        if hovered != self.hovered:
+            self.hovered = hovered
+            self.dirty = True
+    
+    def get_bounds(self):
+        """按钮绘制时覆盖的屏幕区域"""
+        bounds = self.rect.inflate(12, 12)
+        if hasattr(self, 'skill'):
+            # 按钮下方的"点击选择"提示
+            bounds.union_ip(pygame.Rect(self.rect.x, self.rect.bottom, self.rect.width, 35))
+        return bounds
     
     def draw(self, screen):
         """绘制按钮"""
@@ -45,9 +60,8 @@ class Button:
         outer_rect = self.rect.inflate(10, 10)
         pygame.draw.rect(screen, (255, 0, 0), outer_rect, width=2, border_radius=10)
         
-        # 绘制文本 - 使用更大的字体
-        self.font = get_font(28)  # 增大字体
-        text_surface = self.font.render(self.text, True, self.text_color)
+        # 绘制文本
+        text_surface = render_text(self.font, self.text, self.text_color)
         text_rect = text_surface.get_rect(center=self.rect.center)
         screen.blit(text_surface, text_rect)
         
@@ -55,7 +69,7 @@ class Button:
         if hasattr(self, 'skill'):
             hint_font = get_font(20)  # 增大提示字体
             hint_text = "点击选择"
-            hint_surface = hint_font.render(hint_text, True, (255, 255, 0))
+            hint_surface = render_text(hint_font, hint_text, (255, 255, 0))
             hint_rect = hint_surface.get_rect(center=(self.rect.centerx, self.rect.bottom + 20))
             screen.blit(hint_surface, hint_rect)
 
@@ -68,10 +82,14 @@ class ProgressBar:
         self.bg_color = bg_color
         self.fill_color = fill_color
         self.border_color = border_color
+        self.dirty = True
     
     def update(self, new_value):
         """更新当前值"""
-        self.current_value = min(max(0, new_value), self.max_value)
+        new_value = min(max(0, new_value), self.max_value)
+        if new_value != self.current_value:
+            self.current_value = new_value
+            self.dirty = True
     
     def draw(self, surface):
         """绘制进度条"""
@@ -102,12 +120,18 @@ class CharacterCard:
         )
         self.font_name = get_font(20)
         self.font_stats = get_font(16)
+        # 名字和生命值文字由字形图集拼接，受击后生命值变化不再重新光栅化整行文字
+        self.atlas_name = get_atlas(self.font_name)
+        self.atlas_stats = get_atlas(self.font_stats)
         self.selected = False
         self.is_hovered = False
+        self.dirty = True
     
     def update(self):
         """更新角色卡片状态"""
-        self.hp_bar.current_value = self.character.current_hp
+        self.hp_bar.update(self.character.current_hp)
+        if self.hp_bar.dirty:
+            self.dirty = True
     
     def draw(self, surface):
         """绘制角色卡片"""
@@ -129,20 +153,21 @@ class CharacterCard:
         pygame.draw.rect(surface, border_color, self.rect, width=2, border_radius=5)
         
         # 绘制角色名称
-        name_surface = self.font_name.render(self.character.name, True, WHITE)
+        name_surface = self.atlas_name.render(self.character.name)
         name_rect = name_surface.get_rect(center=(self.rect.centerx, self.rect.y + 20))
         surface.blit(name_surface, name_rect)
         
         # 绘制角色图像
         char_image_size = 130
-        char_image = pygame.transform.scale(self.character.image, (char_image_size, char_image_size))
+        char_image = self.character.get_portrait((char_image_size, char_image_size))
         char_rect = char_image.get_rect(center=(self.rect.centerx, self.rect.centery - 20))
         surface.blit(char_image, char_rect)
         
         # 绘制生命值条
         self.hp_bar.draw(surface)
+        self.hp_bar.dirty = False
         hp_text = f"HP: {self.character.current_hp}/{self.character.max_hp}"
-        hp_surface = self.font_stats.render(hp_text, True, WHITE)
+        hp_surface = self.atlas_stats.render(hp_text)
         hp_rect = hp_surface.get_rect(center=(self.rect.centerx, self.rect.bottom - 15))
         surface.blit(hp_surface, hp_rect)
     
@@ -155,48 +180,115 @@ class CharacterCard:
     
     def update_hover(self, mouse_pos):
         """更新鼠标悬停状态"""
-        self.is_hovered = self.rect.collidepoint(mouse_pos) and self.character.is_alive
+        is_hovered = self.rect.collidepoint(mouse_pos) and self.character.is_alive
+        if is_hovered != self.is_hovered:
+            self.is_hovered = is_hovered
+            self.dirty = True
 
 class MessageBox:
-    """消息框：显示战斗信息"""
-    def __init__(self, x, y, width, height, font_size=18):
+    """消息框：显示战斗信息，支持滚动查看历史消息"""
+    def __init__(self, x, y, width, height, font_size=18, history_size=MESSAGE_HISTORY_SIZE):
         self.rect = pygame.Rect(x, y, width, height)
         self.font = get_font(font_size)
-        self.messages = []
+        self.atlas = get_atlas(self.font, WHITE, premultiplied=True)  # 消息行按预乘alpha合成
         self.max_messages = 8  # 最多显示8条消息
         self.bg_color = (0, 0, 0, 128)  # 半透明黑色
+        self.line_height = 22
+        self.margin = 10
+        self.dirty = True
+        
+        # 历史消息环形缓冲区：每条消息只在添加时渲染一次
+        self.history = deque(maxlen=history_size)  # (消息, 预乘alpha的文字表面)
+        self.total_added = 0                       # 累计添加的消息数
+        self.page_start = 0                        # 最近一次清除时的消息序号
+        self.scroll_offset = 0                     # 向上滚动的行数，0表示显示最新消息
+        self.version = 0                           # 内容或滚动位置变化时递增
+        
+        # 离屏合成的面板，只在内容或滚动位置变化时重新合成
+        self.panel = None
+        self.panel_version = -1
+    
+    def _page_size(self):
+        """最近一次清除之后仍在历史记录中的消息数"""
+        return min(self.total_added - self.page_start, len(self.history))
+    
+    @property
+    def messages(self):
+        """最近一次清除之后的消息（最多max_messages条）"""
+        count = min(self._page_size(), self.max_messages)
+        return [message for message, _ in islice(self.history, len(self.history) - count, None)]
+    
+    def visible_lines(self):
+        """消息框内可以容纳的行数"""
+        fit = (self.rect.height - 2 * self.margin) // self.line_height
+        return max(0, min(self.max_messages, fit))
+    
+    def _changed(self):
+        self.version += 1
+        self.dirty = True
+    
+    def _render_line(self, message):
+        """由字形图集拼出一行预乘alpha格式的消息"""
+        return self.atlas.render(message)
     
     def add_message(self, message):
         """添加消息"""
-        self.messages.append(message)
-        # 保持消息数量在最大限制内
-        if len(self.messages) > self.max_messages:
-            self.messages = self.messages[-self.max_messages:]
+        self.history.append((message, self._render_line(message)))
+        self.total_added += 1
+        
+        # 正在查看历史时保持视图位置不动
+        if self.scroll_offset > 0:
+            self.scroll_offset = min(self.scroll_offset + 1, self._max_scroll())
+        self._changed()
     
     def clear(self):
-        """清除所有消息"""
-        self.messages = []
+        """清除当前显示的消息，历史记录仍可滚动查看"""
+        if self.total_added != self.page_start or self.scroll_offset:
+            self._changed()
+        self.page_start = self.total_added
+        self.scroll_offset = 0
+    
+    def _max_scroll(self):
+        return max(0, len(self.history) - self.visible_lines())
+    
+    def scroll(self, lines):
+        """滚动消息，正数向上查看更早的消息"""
+        offset = min(max(0, self.scroll_offset + lines), self._max_scroll())
+        if offset != self.scroll_offset:
+            self.scroll_offset = offset
+            self._changed()
+    
+    def _compose_panel(self):
+        """把可见的消息行合成到离屏面板上"""
+        if self.panel is None:
+            self.panel = pygame.Surface(self.rect.size, pygame.SRCALPHA)
+        # 面板以预乘alpha格式合成，贴到屏幕上时与逐行直接绘制的效果一致
+        r, g, b, a = self.bg_color
+        self.panel.fill((r * a // 255, g * a // 255, b * a // 255, a))
+        
+        visible = self.visible_lines()
+        end = len(self.history) - self.scroll_offset
+        start = max(0, end - visible)
+        if self.scroll_offset == 0:
+            # 未滚动时只显示最近一次清除之后的消息
+            start = max(start, len(self.history) - self._page_size())
+        
+        for row, (_, line_surface) in enumerate(islice(self.history, start, end)):
+            y = self.margin + row * self.line_height
+            self.panel.blit(line_surface, (self.margin, y), special_flags=pygame.BLEND_PREMULTIPLIED)
+        
+        self.panel_version = self.version
     
     def draw(self, surface):
         """绘制消息框"""
-        # 绘制背景
-        bg_surface = pygame.Surface((self.rect.width, self.rect.height), pygame.SRCALPHA)
-        bg_surface.fill(self.bg_color)
-        surface.blit(bg_surface, self.rect)
+        if self.panel_version != self.version or self.panel is None:
+            self._compose_panel()
+        
+        # 绘制背景和消息
+        surface.blit(self.panel, self.rect, special_flags=pygame.BLEND_PREMULTIPLIED)
         
         # 绘制边框
         pygame.draw.rect(surface, WHITE, self.rect, 1)
-        
-        # 绘制消息
-        line_height = 22
-        margin = 10
-        for i, message in enumerate(self.messages):
-            y = self.rect.y + margin + i * line_height
-            if y + line_height > self.rect.y + self.rect.height - margin:
-                break
-                
-            text_surface = self.font.render(message, True, WHITE)
-            surface.blit(text_surface, (self.rect.x + margin, y))
 
 class SkillButton(Button):
     """技能按钮：显示技能信息和状态"""
@@ -216,7 +308,23 @@ class SkillButton(Button):
         
         # 更新悬停状态
         if mouse_pos is not None:
-            self.is_hovered = self.rect.collidepoint(mouse_pos)
+            is_hovered = self.rect.collidepoint(mouse_pos)
+            if is_hovered != getattr(self, 'is_hovered', False):
+                self.dirty = True
+            self.is_hovered = is_hovered
+    
+    def get_bounds(self):
+        """按钮及悬停时技能描述覆盖的屏幕区域"""
+        bounds = super().get_bounds()
+        if hasattr(self.skill, "description"):
+            desc_width, desc_height = self.font_description.size(self.skill.description)
+            bounds.union_ip(pygame.Rect(
+                self.rect.centerx - desc_width // 2 - 10,
+                self.rect.top - 80,
+                desc_width + 20,
+                80
+            ))
+        return bounds
         
     def draw(self, surface):
         """绘制技能按钮"""
@@ -226,7 +334,7 @@ class SkillButton(Button):
         if self.is_hovered:
             if hasattr(self.skill, "description"):
                 # 创建描述面板
-                desc_surface = self.font_description.render(self.skill.description, True, WHITE)
+                desc_surface = render_text(self.font_description, self.skill.description, WHITE)
                 desc_rect = desc_surface.get_rect(midtop=(self.rect.centerx, self.rect.top - 30))
                 
                 # 添加背景
@@ -240,6 +348,62 @@ class SkillButton(Button):
             if hasattr(self.skill, "chakra_cost") and self.skill.chakra_cost > 0:
                 # 显示查克拉消耗
                 chakra_text = f"查克拉: {self.skill.chakra_cost}"
-                chakra_surface = self.font_description.render(chakra_text, True, (0, 100, 255))
+                chakra_surface = render_text(self.font_description, chakra_text, (0, 100, 255))
                 chakra_rect = chakra_surface.get_rect(midbottom=(self.rect.centerx, self.rect.top - 35))
-                surface.blit(chakra_surface, chakra_rect) 
\ No newline at end of file
+                surface.blit(chakra_surface, chakra_rect) 
+
+class Slider:
+    """滑动条：点击或拖动选择0到max_value之间的整数，用于回放时间轴"""
+    def __init__(self, x, y, width, height, max_value, value=0, fill_color=YELLOW):
+        self.rect = pygame.Rect(x, y, width, height)
+        self.max_value = max(0, max_value)
+        self.value = min(max(0, value), self.max_value)
+        self.fill_color = fill_color
+        self.dragging = False
+        self.dirty = True
+    
+    def set_value(self, value):
+        """设置当前值"""
+        value = min(max(0, value), self.max_value)
+        if value != self.value:
+            self.value = value
+            self.dirty = True
+    
+    def _value_at(self, x):
+        """屏幕横坐标对应的值"""
+        if self.max_value == 0:
+            return 0
+        ratio = (x - self.rect.x) / max(1, self.rect.width)
+        return round(min(max(0.0, ratio), 1.0) * self.max_value)
+    
+    def _knob_x(self):
+        if self.max_value == 0:
+            return self.rect.x
+        return self.rect.x + int(self.rect.width * self.value / self.max_value)
+    
+    def handle_event(self, event):
+        """处理鼠标事件，值被用户改变时返回新值，否则返回None"""
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            if self.rect.inflate(0, 20).collidepoint(event.pos):
+                self.dragging = True
+                return self._change_to(self._value_at(event.pos[0]))
+        elif event.type == pygame.MOUSEMOTION and self.dragging:
+            return self._change_to(self._value_at(event.pos[0]))
+        elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+            self.dragging = False
+        return None
+    
+    def _change_to(self, value):
+        if value == self.value:
+            return None
+        self.set_value(value)
+        return value
+    
+    def draw(self, surface):
+        """绘制滑动条"""
+        pygame.draw.rect(surface, (50, 50, 50), self.rect, border_radius=4)
+        fill_rect = pygame.Rect(self.rect.x, self.rect.y, self._knob_x() - self.rect.x, self.rect.height)
+        if fill_rect.width > 0:
+            pygame.draw.rect(surface, self.fill_color, fill_rect, border_radius=4)
+        pygame.draw.rect(surface, WHITE, self.rect, 1, border_radius=4)
+        pygame.draw.circle(surface, WHITE, (self._knob_x(), self.rect.centery), self.rect.height)